@@ -8,8 +8,217 @@ This should be connected to a safety interlock to ensure that the laser
 emission is controlled and in a safe environment
 """
 
+import json
+import operator
+import os
+import socket
+import threading
+import time
+from array import array
+from collections import deque
+from typing import NamedTuple
+
 import serial
 
+# Adaptive read timeouts, see Pulsed_Laser_Serial.record_latency()
+LATENCY_WINDOW = 200  # Replies kept per command code
+LATENCY_MIN_SAMPLES = 20  # Replies needed before the timeout is adapted
+LATENCY_UPDATE_EVERY = 10  # Recalculate the timeout every n replies
+TIMEOUT_MULTIPLIER = 3  # Timeout = p99 latency * multiplier
+MIN_TIMEOUT = 0.02  # Lower bound on an adapted timeout (s)
+# Port timeout (s) while timeouts are adapted. It is set once, as pySerial
+# reconfigures the port each time the timeout changes, and each command's
+# timeout is kept by repeating reads until its deadline
+READ_SLICE = MIN_TIMEOUT
+
+UNKNOWN_ERROR = "Unknown error code"  # Message of codes not in ERROR_CODES
+
+# RS232 error codes and their meanings
+ERROR_CODES = {
+    "E5": "Illegal character",
+    "E6": "Too few characters",
+    "E7": "Illegal password character",
+    "E8": "Incorrect password",
+    "E9": "Insufficient privilege",
+    "E10": "Syntax error: command not recognised",
+    "E11": "'Set' method not available for this command",
+    "E12": "'Get' method not available for this command",
+    "E13": "Parameter error: too many characters",
+    "E14": "Parameter error: not a number",
+    "E15": "Unsupported command in this laser",
+    "E16": "Command not available (e.g. password protected)",
+    "E17": "Too few parameters",
+    "E18": "Too many parameters",
+    "E20": "Parameter out of range",
+    "E21": "Command not executed because an alarm is active",
+    "E22": "Command not executed because of beam \
+                                delivery alarm(1)",
+    "E23": "Command not executed because of \
+                                temperature alarm",
+    "E24": "Command not executed because power supplies \
+                                were not ready",
+    "E25": "Command not executed because Laser is not ready",
+    "E26": "Command not executed because it is not available \
+                                in the active Laser Mode",
+    "E27": "Command not executed because Laser_Enable input \
+                                signal is active (high)",
+    "E28": "Command not executed - bit is already set",
+    "E29": "Command not executed - bit is already set",
+    "E30": "Command could not be executed because \
+                                Laser is enabled",
+    "E31": "Command could not be executed because \
+                                Laser is not enabled",
+    "E32": "Command could not be executed - parameter \
+                                under hardware control",
+    "E33": "Command could not be executed - parameter \
+                                under software control",
+    "E34": "Command could not be executed because \
+                                pilot Laser is enabled",
+    "E35": "Command could not be executed because \
+                                pulse repetition rate is out of range",
+}
+
+# Legal "set" command arguments, checked locally before anything is sent
+# command code: (legal values, error code the laser replies with otherwise)
+PARAMETER_LIMITS = {
+    "SM": (range(8), "E20"),
+    "SS": (frozenset({0, 1, 3, 4, 8, 9}), "E20"),
+    "SC": (frozenset({0, 1, 3, 4, 8, 9}), "E20"),
+    "SH": (range(101), "E20"),
+    "SI": (range(1001), "E20"),
+    "SW": (range(32), "E20"),
+    "SR": (range(10000, 1000001), "E35"),
+    "SL": (range(10000001), "E20"),
+    "SF": (range(1001), "E20"),
+}
+# The PRF range is lower in CW mode (status word bit 3 set)
+CW_PARAMETER_LIMITS = {**PARAMETER_LIMITS, "SR": (range(100, 100001), "E35")}
+
+# Positions of the enable, pulses, mode, extcurrentcontrol, pilotlaser and
+# extpulsetrigger bits in the reply to "GS", "n, n, n, ..."
+STATUS_WORD_POSITIONS = (0, 3, 6, 9, 12, 15)
+
+# Removed from diode current replies before parsing, see parse_diode_currents()
+DIODE_CURRENT_BRACKETS = str.maketrans("", "", "()")
+
+VENDOR_INFO_LINES = 5  # Lines in the reply to "RQV"
+
+# Pulsed_Laser attributes saved by save_state() and restored by warm_start()
+STATE_ATTRIBUTES = (
+    "serialno",
+    "partno",
+    "vendorinfo",
+    "controlmode",
+    "simmer",
+    "activecurrent",
+    "waveform",
+    "prf",
+    "pulseburstlength",
+    "pumpduty",
+)
+
+# Order staged set commands are sent in by Pulsed_Laser.transaction(), status
+# word changes other than 'SS 1' go first, then these codes, then 'SS 1'
+TRANSACTION_ORDER = ("SM", "SH", "SW", "SR", "SL", "SF", "SI")
+
+# Set commands that only take effect on the next 'SS 1'
+COMMIT_CODES = ("SW", "SR", "SL", "SF")
+
+# Pulsed_Laser attribute changed by each set command code or status word bit
+# ("S n"), restored when a transaction fails before sending it
+SETTING_ATTRIBUTES = {
+    "SM": "controlmode",
+    "SH": "simmer",
+    "SI": "activecurrent",
+    "SW": "waveform",
+    "SR": "prf",
+    "SL": "pulseburstlength",
+    "SF": "pumpduty",
+    "S 0": "enable",
+    "S 1": "pulses",
+    "S 3": "mode",
+    "S 4": "extcurrentcontrol",
+    "S 8": "pilotlaser",
+    "S 9": "extpulsetrigger",
+}
+
+# Telemetry attributes of Pulsed_Laser and the query that reads them,
+# see Pulsed_Laser.reading_times()
+READING_COMMANDS = {
+    "lasertemp": "QT",
+    "beamdeliverytemp": "QU",
+    "diodecurrents": "QI",
+    "diodecurrentvalues": "QI",
+    "extendeddiodecurrent": "QJ",
+    "extendeddiodecurrentvalues": "QJ",
+    "operatinghours": "QH",
+    "extprf": "QR",
+    "statuswordint": "QS",
+    "alarms": "QA",
+    "monitor": "QD",
+    "alarmstatemonitor": "QD",
+    "lasertempmonitor": "QD",
+    "beamdeliverytempmon": "QD",
+    "systemfaultmonitor": "QD",
+    "deactivatedmonitor": "QD",
+    "emissionwarningmon": "QD",
+    "laseronmonitor": "QD",
+    "controlmode": "GM",
+}
+
+
+class ReplyTimes(NamedTuple):
+    """time.monotonic_ns() times of a successful command"""
+
+    sent: int  # Just before the command was written
+    received: int  # Once the whole reply had been read
+    sample: int  # Estimated time the laser took the reading
+
+
+def character_time_ns(
+    baudrate: int, databits: int, parity: str, stopbits: float
+) -> float:
+    """Return the time (ns) to send one character at a serial configuration
+    One start bit, the data bits, a parity bit unless PARITY_NONE and the
+    stop bits"""
+    bits = 1 + databits + (parity != serial.PARITY_NONE) + stopbits
+    return bits * 1e9 / baudrate
+
+
+def estimate_sample_time(
+    sent: int, received: int, commandbytes: int, replybytes: int, chartime: float
+) -> int:
+    """Estimate when the laser took a reading, in the clock of sent/received
+    The laser reads the value between receiving the last byte of the command
+    and sending the first byte of the reply. That window is the round trip
+    less the time to send commandbytes and replybytes at chartime ns each,
+    and the estimate is its mid-point"""
+    start = sent + commandbytes * chartime
+    end = received - replybytes * chartime
+    if end < start:
+        return (sent + received) // 2
+    return int((start + end) // 2)
+
+
+class Pulsed_Laser_Tracer:
+    """Base class for tracers of Pulsed_Laser_Serial transactions
+
+    Set an instance as Pulsed_Laser_Serial.tracer to have start_span() called
+    before each command is written and end_span() once the reply is decoded.
+    With no tracer set, the only cost is a check for None.
+    """
+
+    def start_span(self, command: str, data: bytes) -> object:
+        """Called before the command bytes are written
+        The return value is passed to end_span()"""
+        return None
+
+    def end_span(
+        self, span: object, reply: bytes, success: bool, result: str, errorcode: str
+    ):
+        """Called with the raw reply and decoded result of the command
+        errorcode is the laser error code ("E20"), or empty on success"""
+
 
 class Pulsed_Laser_Serial:
     """A Python class for controlling a pulsed laser via a serial connection.
@@ -27,6 +236,8 @@ class Pulsed_Laser_Serial:
         parity: str,
         databits: int,
         timeout: int,
+        keepalive: int = 10,
+        adaptive_timeout: bool = False,
     ):
         self.port = port
         self.baudrate = baudrate
@@ -34,17 +245,67 @@ class Pulsed_Laser_Serial:
         self.parity = parity
         self.databits = databits
         self.timeout = timeout
+        self.keepalive = keepalive
+        self.adaptive_timeout = adaptive_timeout
+        self.latencies = {}
+        self.commandtimeouts = {}
+        self.lateuntil = 0.0  # time.monotonic() a timed out reply may arrive by
+        self.tracer = None  # Pulsed_Laser_Tracer called around each command
+        self.lastreply = 0.0  # time.monotonic() of the last complete reply
+        self.replytimes = {}  # ReplyTimes of the last success per command code
+        # (code, replaced ReplyTimes, ReplyTimes) of this thread's last success
+        self._stamped = threading.local()
+        self.chartime = character_time_ns(baudrate, databits, parity, stopbits)
+        # Held for each write/read transaction, so threads sharing the
+        # connection never interleave commands or take each other's replies
+        self.lock = threading.Lock()
+        self.lockwaits = {"count": 0, "contended": 0, "total": 0.0, "max": 0.0}
 
     def open_connection(self):
-        """Open the serial connection to the laser"""
-        self.serial = serial.Serial(
-            port=self.port,
-            baudrate=self.baudrate,
-            parity=self.parity,
-            stopbits=self.stopbits,
-            bytesize=self.databits,
-            timeout=self.timeout,
-        )
+        """Open the serial connection to the laser
+        A port given as a URL is opened through the pySerial URL handlers:
+        "socket://host:port" for a raw TCP serial-over-Ethernet gateway
+        "rfc2217://host:port" for an RFC 2217 device server
+        The framing is the same as for a local serial port"""
+        if "://" in self.port:
+            self.serial = serial.serial_for_url(
+                self.port,
+                baudrate=self.baudrate,
+                parity=self.parity,
+                stopbits=self.stopbits,
+                bytesize=self.databits,
+                timeout=self.timeout,
+            )
+            self.configure_socket()
+        else:
+            self.serial = serial.Serial(
+                port=self.port,
+                baudrate=self.baudrate,
+                parity=self.parity,
+                stopbits=self.stopbits,
+                bytesize=self.databits,
+                timeout=self.timeout,
+            )
+
+    def configure_socket(self):
+        """Tune the TCP socket behind a network port
+        TCP_NODELAY stops short commands waiting on Nagle's algorithm
+        TCP keep-alive probes are sent after keepalive seconds of idle, so a
+        gateway that has gone away is detected without waiting for a command"""
+        sock = getattr(self.serial, "_socket", None)
+        if sock is None:
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if not self.keepalive:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (
+            ("TCP_KEEPIDLE", self.keepalive),
+            ("TCP_KEEPINTVL", max(1, self.keepalive // 3)),
+            ("TCP_KEEPCNT", 3),
+        ):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
 
     def close_connection(self):
         """Close serial connection to the laser"""
@@ -55,97 +316,453 @@ class Pulsed_Laser_Serial:
         On a success, will return "True".
         Result will be empty, as there is no response from laser
         On a failure, will return "False" and the error code"""
-        if self.serial.is_open:
-            self.serial.write(bytes(setcommand + "\r\n", "utf-8"))
-            result = (
-                self.serial.read_until(expected="\r\n").decode("utf-8").rstrip("\r\n")
-            )  # Decode bytes and remove line breaks
-            if result[0] == "E":
-                error = result + ": " + self.error_check(result)
-                success = False
-                return success, error
-            else:
-                success = True
-                return success, result
-        else:
-            success = False
-            result = f"Error: Serial port on {self.port} is not open"
-            return success, result
+        return self.send_command(setcommand)
 
-    def send_get_command(self, getcommand: str) -> tuple[bool, str]:
+    def send_get_command(self, getcommand: str, lines: int = 1) -> tuple[bool, str]:
         """Send a "get" command to the laser to read a parameter
+        lines is the number of lines in the reply, joined with "\n"
         On a success, will return "True" and the value
         On a failure, will return "False" and the error code"""
+        return self.send_command(getcommand, lines)
+
+    def send_command(self, command: str, lines: int = 1) -> tuple[bool, str]:
+        """Write a command to the laser and read back its reply
+        The link is simplex, so the whole reply is read before returning
+        For multi-line replies, reading stops early if a line times out
+        The transaction holds self.lock, so threads sharing the connection
+        each get their own reply
+        On a success, will return "True" and the reply
+        On a failure, will return "False" and the error code"""
+        lock = self.lock
+        if lock.acquire(blocking=False):
+            wait = 0.0
+        else:
+            start = time.perf_counter()
+            lock.acquire()
+            wait = time.perf_counter() - start
+        try:
+            self.record_lock_wait(wait)
+            return self._transact(command, lines)
+        finally:
+            lock.release()
+
+    def _transact(self, command: str, lines: int) -> tuple[bool, str]:
+        """Write a command and read its reply, with the lock held"""
         if self.serial.is_open:
-            self.serial.write(bytes(getcommand + "\r\n", "utf-8"))
-            result = (
-                self.serial.read_until(expected="\r\n").decode("utf-8").rstrip("\r\n")
-            )  # Decode bytes and remove line breaks
-            if result[0] == "E":
-                error = result + ": " + self.error_check(result)
+            code = command.split(" ", 1)[0]
+            deadline = None
+            if self.adaptive_timeout:
+                if self.serial.timeout != READ_SLICE:
+                    self.serial.timeout = READ_SLICE
+                timeout = self.commandtimeouts.get(code, self.timeout)
+            data = bytes(command + "\r\n", "utf-8")
+            tracer = self.tracer
+            if tracer is not None:
+                span = tracer.start_span(command, data)
+            sent = time.monotonic_ns()
+            timedout = False
+            try:
+                if self.lateuntil:
+                    # The last reply timed out early, wait for it up to the
+                    # fixed timeout so it is not read as the reply to this
+                    # command
+                    if self.lateuntil > time.monotonic():
+                        self._read_line(self.lateuntil)
+                    self.lateuntil = 0.0
+                # Nothing is sent unasked, anything waiting is a late reply
+                self.serial.reset_input_buffer()
+                sent = time.monotonic_ns()
+                if self.adaptive_timeout:
+                    deadline = sent / 1e9 + timeout
+                self.serial.write(data)
+                reply = self._read_line(deadline)
+                if lines > 1 and reply and reply[:1] != b"E":
+                    for _ in range(lines - 1):
+                        line = self._read_line(deadline)
+                        if not line:
+                            # Drop any late lines, they are not the
+                            # reply to the next command
+                            self.serial.reset_input_buffer()
+                            break
+                        reply += line
+            except OSError as error:  # serial.SerialException is an OSError
+                reply = b""
+                valid = False
+                result = f"Error: Serial port on {self.port} failed: {error}"
+            else:
+                timedout = not reply.endswith(b"\r\n")
+                valid, result = self.check_reply(code, reply)
+            received = time.monotonic_ns()
+            complete = reply.endswith(b"\r\n")
+            if complete:
+                self.lastreply = received / 1e9
+                if self.adaptive_timeout:
+                    self.record_latency(code, (received - sent) / 1e9)
+            elif timedout and self.adaptive_timeout:
+                self.record_timeout(code, sent / 1e9)
+            if not valid:
+                errorcode = ""
+                success = False
+            elif result[:1] == "E":
+                errorcode = result
+                result = result + ": " + self.error_check(result)
                 success = False
-                return success, error
             else:
+                errorcode = ""
                 success = True
-                return success, result
+                if complete:
+                    times = ReplyTimes(
+                        sent,
+                        received,
+                        estimate_sample_time(
+                            sent, received, len(data), len(reply), self.chartime
+                        ),
+                    )
+                    self._stamped.times = (code, self.replytimes.get(code), times)
+                    self.replytimes[code] = times
+            if tracer is not None:
+                tracer.end_span(span, reply, success, result, errorcode)
+            return success, result
         else:
             success = False
             result = f"Error: Serial port on {self.port} is not open"
             return success, result
 
-    def error_check(self, errorcode: str) -> None | str:
-        """This dict stores the RS232 error codes and their meanings
-        It will return the error message associated with the code"""
-
-        errordict = {
-            "E5": "Illegal character",
-            "E6": "Too few characters",
-            "E7": "Illegal password character",
-            "E8": "Incorrect password",
-            "E9": "Insufficient privilege",
-            "E10": "Syntax error: command not recognised",
-            "E11": "'Set' method not available for this command",
-            "E12": "'Get' method not available for this command",
-            "E13": "Parameter error: too many characters",
-            "E14": "Parameter error: not a number",
-            "E15": "Unsupported command in this laser",
-            "E16": "Command not available (e.g. password protected)",
-            "E17": "Too few parameters",
-            "E18": "Too many parameters",
-            "E20": "Parameter out of range",
-            "E21": "Command not executed because an alarm is active",
-            "E22": "Command not executed because of beam \
-                                delivery alarm(1)",
-            "E23": "Command not executed because of \
-                                temperature alarm",
-            "E24": "Command not executed because power supplies \
-                                were not ready",
-            "E25": "Command not executed because Laser is not ready",
-            "E26": "Command not executed because it is not available \
-                                in the active Laser Mode",
-            "E27": "Command not executed because Laser_Enable input \
-                                signal is active (high)",
-            "E28": "Command not executed - bit is already set",
-            "E29": "Command not executed - bit is already set",
-            "E30": "Command could not be executed because \
-                                Laser is enabled",
-            "E31": "Command could not be executed because \
-                                Laser is not enabled",
-            "E32": "Command could not be executed - parameter \
-                                under hardware control",
-            "E33": "Command could not be executed - parameter \
-                                under software control",
-            "E34": "Command could not be executed because \
-                                pilot Laser is enabled",
-            "E35": "Command could not be executed because \
-                                pulse repetition rate is out of range",
+    def _read_line(self, deadline: float | None) -> bytes:
+        """Read one line of a reply
+        With a deadline (time.monotonic()), reads of READ_SLICE are repeated
+        until the line is complete or the deadline has passed"""
+        line = self.serial.read_until(expected=b"\r\n")
+        if deadline is not None:
+            while not line.endswith(b"\r\n") and time.monotonic() < deadline:
+                line += self.serial.read_until(expected=b"\r\n")
+        return line
+
+    def check_reply(self, code: str, reply: bytes) -> tuple[bool, str]:
+        """Decode a reply, checking that it can be trusted
+        A reply is empty if the read timed out (a reply of only CRLF is
+        valid, such as QA with no alarms active), is missing its final CRLF
+        if it was cut short, and is garbled if it is not printable ASCII.
+        Anything left of a bad reply is discarded, so it is not read as the
+        reply to the next command
+        Returns "True" and the decoded reply, or "False" and an error"""
+        error = None
+        if not reply:
+            error = f"Error: No reply to {code} from {self.port}"
+        elif not reply.endswith(b"\r\n"):
+            error = f"Error: Incomplete reply to {code} from {self.port}"
+        else:
+            try:
+                result = reply.decode("ascii").rstrip("\r\n").replace("\r\n", "\n")
+                garbled = not result.isprintable() and not (
+                    result.replace("\n", "").isprintable()
+                )
+            except UnicodeDecodeError:
+                garbled = True
+            if garbled:
+                error = f"Error: Garbled reply to {code} from {self.port}"
+        if error is None:
+            return True, result
+        self.serial.reset_input_buffer()
+        return False, error
+
+    def reject_reply(self, code: str):
+        """Restore the reply times of code from before this thread's last
+        reply to it, because the reply could not be parsed
+        Times of a later reply to code from another thread are kept"""
+        stamped = getattr(self._stamped, "times", None)
+        if stamped is None or stamped[0] != code:
+            return
+        self._stamped.times = None
+        _, previous, times = stamped
+        with self.lock:
+            if self.replytimes.get(code) is times:
+                if previous is None:
+                    del self.replytimes[code]
+                else:
+                    self.replytimes[code] = previous
+
+    def record_latency(self, code: str, latency: float):
+        """Store the round trip time of a command and update its timeout
+        The timeout is the p99 latency of the last LATENCY_WINDOW replies
+        multiplied by TIMEOUT_MULTIPLIER, bounded by MIN_TIMEOUT and the
+        fixed timeout the connection was opened with
+        Until LATENCY_MIN_SAMPLES replies have been seen, the fixed timeout
+        is used. Reads that time out are not samples, see record_timeout()"""
+        samples = self.latencies.get(code)
+        if samples is None:
+            samples = self.latencies[code] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(latency)
+        count = len(samples)
+        if count < LATENCY_MIN_SAMPLES or count % LATENCY_UPDATE_EVERY:
+            return
+        ordered = sorted(samples)
+        p99 = ordered[min(count - 1, int(count * 0.99))]
+        timeout = min(self.timeout, max(MIN_TIMEOUT, p99 * TIMEOUT_MULTIPLIER))
+        self.commandtimeouts[code] = round(timeout, 3)
+
+    def record_timeout(self, code: str, sent: float):
+        """Back off the timeout of a command whose reply timed out
+        The learned timeout is doubled, up to the fixed timeout, so it grows
+        again if the link has become slower. The next command first waits
+        for the late reply until the fixed timeout after sent
+        (time.monotonic())"""
+        timeout = self.commandtimeouts.get(code)
+        if timeout is not None:
+            self.commandtimeouts[code] = min(self.timeout, round(timeout * 2, 3))
+        self.lateuntil = sent + self.timeout
+
+    def record_lock_wait(self, wait: float):
+        """Store the time (s) a transaction waited for the lock
+        Must be called with the lock held"""
+        stats = self.lockwaits
+        stats["count"] += 1
+        if wait:
+            stats["contended"] += 1
+            stats["total"] += wait
+            stats["max"] = max(stats["max"], wait)
+
+    def get_lock_waits(self) -> dict[str, float]:
+        """Return the number of transactions, how many waited for another
+        thread's transaction, and the mean and max wait (s) of those"""
+        with self.lock:
+            stats = dict(self.lockwaits)
+        contended = stats["contended"]
+        return {
+            "count": stats["count"],
+            "contended": contended,
+            "mean": stats["total"] / contended if contended else 0.0,
+            "max": stats["max"],
         }
 
-        try:
-            errordict[errorcode]
-        except KeyError:
-            raise KeyError(f"The error code {errorcode} is not in the list of errors")
-        return errordict[errorcode]
+    def get_timeouts(self) -> dict[str, float]:
+        """Return the read timeout currently used for each command code
+        Commands not in the dict use the fixed timeout"""
+        return dict(self.commandtimeouts)
+
+    def error_check(self, errorcode: str) -> str:
+        """Return the error message associated with an RS232 error code
+        The codes and their meanings are stored in ERROR_CODES, any other
+        code returns UNKNOWN_ERROR"""
+        return ERROR_CODES.get(errorcode, UNKNOWN_ERROR)
+
+
+def is_error(result: None | str) -> bool:
+    """Return True if a Pulsed_Laser method result is an error message
+    Errors are laser error codes ("Enn: ...") or library errors ("Error: ...")"""
+    if not result or result[0] != "E":
+        return False
+    return result.startswith("Error") or result[1:2].isdigit()
+
+
+def unexpected_reply(command: str, result: str) -> str:
+    """Return the error for a reply that is not in the format of command"""
+    return f"Error: Unexpected reply to {command}: {result!r}"
+
+
+def parse_reply(command: str, result: str, parse, *args) -> tuple:
+    """Convert the reply to a get command with parse(result, *args)
+    Returns (value, None), or (None, error) if parse raises because the
+    reply is not in the expected format, such as an empty reply"""
+    try:
+        return parse(result, *args), None
+    except (ValueError, IndexError, OverflowError):
+        return None, unexpected_reply(command, result)
+
+
+def parse_bits(result: str, positions: tuple[int, ...]) -> list[bool]:
+    """Return the 0/1 digit at each position of a reply as a bool"""
+    return [bool(int(result[position])) for position in positions]
+
+
+def parse_alarms(result: str) -> list[int]:
+    """Return the alarm codes of a QA reply, "nn, nn, nn..." or empty"""
+    return [int(alarm) for alarm in result.split(", ") if alarm]
+
+
+def parse_diode_currents(result: str) -> array:
+    """Convert a QI/QJ diode current reply into an array of unsigned 16-bit
+    integers (mA), one per driver stage
+    Reply is "nnnnn, nnnnn" or "nnnnn, nnnnn, nnnnn, (nnnnn)", where the
+    fourth stage in brackets is only present on some lasers
+    Raises ValueError or OverflowError if the reply is not in that format"""
+    currents = result.translate(DIODE_CURRENT_BRACKETS).split(",")
+    if not currents[-1].strip():
+        del currents[-1]
+    if not currents:
+        raise ValueError(f"No diode currents in {result!r}")
+    return array("H", map(int, currents))
+
+
+class DiodeCurrentStats:
+    """Running minimum, maximum and mean of each diode driver stage (mA)
+    No samples are kept. A stage that is missing from some replies, such as
+    the optional fourth stage, has its own sample count"""
+
+    __slots__ = ("count", "maximum", "minimum", "total")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget every sample"""
+        self.count = []
+        self.minimum = []
+        self.maximum = []
+        self.total = []
+
+    def update(self, currents: array):
+        """Add one reply, as returned by parse_diode_currents()"""
+        count = self.count
+        minimum = self.minimum
+        maximum = self.maximum
+        total = self.total
+        for stage, current in enumerate(currents):
+            if stage == len(count):
+                count.append(0)
+                minimum.append(current)
+                maximum.append(current)
+                total.append(0)
+            count[stage] += 1
+            total[stage] += current
+            if current < minimum[stage]:
+                minimum[stage] = current
+            elif current > maximum[stage]:
+                maximum[stage] = current
+
+    def mean(self) -> list[float]:
+        """Return the mean current of each stage"""
+        return [total / count for total, count in zip(self.total, self.count)]
+
+
+def ramp_step_due(
+    start: int, target: int, rate: float, step: int, index: int
+) -> float:
+    """Return the time (s from the start of a ramp) at which step index + 1 is due
+    The value moves by step every step / rate seconds, and the last step is
+    shortened so the ramp ends exactly on target"""
+    return min(abs(target - start), (index + 1) * step) / rate
+
+
+def ramp_next_step(
+    start: int, target: int, rate: float, step: int, index: int, elapsed: float
+) -> tuple[int, int]:
+    """Return the index and value of the step to send elapsed s into a ramp
+    This is the latest step that is due, so steps the link has fallen
+    behind on are dropped, but it is always after step index"""
+    distance = abs(target - start)
+    laststep = -(-distance // step)
+    index = min(laststep, max(index + 1, int(rate * elapsed / step)))
+    travelled = min(distance, index * step)
+    return index, start + travelled if target >= start else start - travelled
+
+
+class Pulsed_Laser_Staging:
+    """Stands in for the connection of a Pulsed_Laser while transactions are open
+    Set commands from a thread with an open transaction are recorded for it
+    and reported as successful without being sent. Set commands from other
+    threads, and every other command and attribute, go to the real connection"""
+
+    lock = threading.Lock()  # Held while a transaction opens or closes
+
+    def __init__(self, serialconn):
+        self.serialconn = serialconn
+        self.transactions = {}  # Thread ident: staged commands of its transaction
+
+    def send_set_command(self, setcommand: str) -> tuple[bool, str]:
+        staged = self.transactions.get(threading.get_ident())
+        if staged is None:
+            return self.serialconn.send_set_command(setcommand)
+        code, _, value = setcommand.partition(" ")
+        # Each status word bit is one setting, whether set or cleared
+        key = f"S {value}" if code in ("SS", "SC") else code
+        staged.pop(key, None)
+        staged[key] = setcommand
+        return True, ""
+
+    def __getattr__(self, name: str):
+        return getattr(self.serialconn, name)
+
+    @staticmethod
+    def commands(staged: dict) -> list[str]:
+        """Return the staged commands in the order they are to be sent
+        Only the last command for each setting is kept. They end with one
+        'SS 1' if it was staged, or if a command in COMMIT_CODES was staged
+        and neither bit 0 nor bit 1 is cleared, when the changes are left for
+        the next 'SS 1'"""
+        commands = [
+            command
+            for key, command in staged.items()
+            if key[:2] == "S " and command != "SS 1"
+        ]
+        commands += [staged[code] for code in TRANSACTION_ORDER if code in staged]
+        clearing = staged.get("S 0") == "SC 0" or staged.get("S 1") == "SC 1"
+        if staged.get("S 1") == "SS 1" or (
+            not clearing and any(code in staged for code in COMMIT_CODES)
+        ):
+            commands.append("SS 1")
+        return commands
+
+
+class Pulsed_Laser_Transaction:
+    """Context manager returned by Pulsed_Laser.transaction()
+    Only set commands made by the thread that entered it are staged. After
+    the block, error is None if every command succeeded, otherwise it is the
+    error and failedcommand is the command that returned it"""
+
+    def __init__(self, laser: "Pulsed_Laser"):
+        self.laser = laser
+        self.staging = None
+        self.staged = {}  # Command key: command, in the order first staged
+        self.saved = {}
+        self.sent = []
+        self.error = None
+        self.failedcommand = None
+
+    def __enter__(self):
+        laser = self.laser
+        self.saved = {
+            name: getattr(laser, name) for name in SETTING_ATTRIBUTES.values()
+        }
+        with Pulsed_Laser_Staging.lock:
+            staging = laser.serialconn
+            if not isinstance(staging, Pulsed_Laser_Staging):
+                staging = laser.serialconn = Pulsed_Laser_Staging(staging)
+            if threading.get_ident() in staging.transactions:
+                raise RuntimeError("Transactions cannot be nested")
+            staging.transactions[threading.get_ident()] = self.staged
+        self.staging = staging
+        return self
+
+    def __exit__(self, exctype, exc, traceback):
+        staging = self.staging
+        serialconn = staging.serialconn
+        with Pulsed_Laser_Staging.lock:
+            del staging.transactions[threading.get_ident()]
+            # The last transaction to close puts the real connection back
+            if not staging.transactions:
+                self.laser.serialconn = serialconn
+        if exctype is not None:
+            self.rollback()
+            return False
+        for command in staging.commands(self.staged):
+            success, result = serialconn.send_set_command(command)
+            if success is not True:
+                self.error = result
+                self.failedcommand = command
+                self.rollback()
+                return False
+            self.sent.append(command)
+        return False
+
+    def rollback(self):
+        """Restore the settings whose commands were not sent to what the
+        laser object had before the transaction"""
+        sent = set(self.sent)
+        for key, command in self.staged.items():
+            if command not in sent:
+                name = SETTING_ATTRIBUTES[key]
+                setattr(self.laser, name, self.saved[name])
 
 
 class Pulsed_Laser:
@@ -176,9 +793,13 @@ class Pulsed_Laser:
         self.lasertemp = 0
         self.beamdeliverytemp = 0
         self.diodecurrents = ""
+        self.diodecurrentvalues = array("H")  # diodecurrents as integers (mA)
+        self.diodecurrentstats = DiodeCurrentStats()
         self.operatinghours = 0
         self.extprf = 0
         self.extendeddiodecurrent = ""
+        self.extendeddiodecurrentvalues = array("H")  # As integers (mA)
+        self.extendeddiodecurrentstats = DiodeCurrentStats()
         self.statuswordint = 0
 
         self.serialno = 0
@@ -187,6 +808,12 @@ class Pulsed_Laser:
 
         self.errorcode = ""
 
+        # Check set command arguments locally, see check_parameter()
+        self.validate = True
+
+        # PowerCalibration used by set_power() and estimate_power()
+        self.powercalibration = None
+
         # Status Word Vars
         self.extpulsetrigger = False  # bit9, 0=Internal pulses, 1=External
         self.pilotlaser = False  # bit8, 0=Pilot off, 1=Pilot on
@@ -203,11 +830,25 @@ class Pulsed_Laser:
         parity: str = serial.PARITY_NONE,
         databits: int = serial.EIGHTBITS,
         timeout: int = 1,
+        keepalive: int = 10,
+        adaptive_timeout: bool = False,
     ):
         """Create an instance of the Pulsed_Laser_Serial class to talk to laser
-        Default serial settings are those detailed in the G4 manual"""
+        Default serial settings are those detailed in the G4 manual
+        port may also be a "socket://host:port" or "rfc2217://host:port" URL
+        for a laser behind a serial-over-Ethernet gateway
+        keepalive is the TCP keep-alive idle time in seconds (0 disables)
+        adaptive_timeout learns a read timeout per command from the observed
+        latency, with timeout as the upper bound"""
         self.serialconn = Pulsed_Laser_Serial(
-            port, baudrate, stopbits, parity, databits, timeout
+            port,
+            baudrate,
+            stopbits,
+            parity,
+            databits,
+            timeout,
+            keepalive,
+            adaptive_timeout,
         )
         self.serialconn.open_connection()
 
@@ -215,10 +856,56 @@ class Pulsed_Laser:
         """Close the connection with the laser"""
         self.serialconn.close_connection()
 
+    def transaction(self) -> Pulsed_Laser_Transaction:
+        """Group set commands so they take effect with a single 'SS 1'
+
+            with laser.transaction() as txn:
+                laser.set_waveform(3)
+                laser.set_prf(80000)
+            if txn.error is not None:
+                print(txn.failedcommand, txn.error)
+
+        Set and clear commands made in the block are not sent straight away.
+        When the block ends, only the last command for each setting is sent:
+        status word changes first, then the commands in TRANSACTION_ORDER,
+        then one 'SS 1' if the block set bit 1 or staged a command in
+        COMMIT_CODES (unless it clears bit 0 or 1). Reads in the block, and
+        set commands from other threads, go to the laser as usual.
+        Transactions cannot be nested in one thread.
+        If a command fails, the rest are not sent and the settings they would
+        have changed on this object are restored to what they were before the
+        block. If the block raises an exception, nothing is sent and every
+        staged setting is restored"""
+        return Pulsed_Laser_Transaction(self)
+
+    def check_parameter(self, code: str, value: int) -> None | str:
+        """Check a "set" command argument against PARAMETER_LIMITS
+        The PRF limits depend on the CW mode bit
+        Returns the error the laser would reply with, without sending the
+        command, or None if the value is legal (or self.validate is False)"""
+        if not self.validate:
+            return None
+        limits = CW_PARAMETER_LIMITS if self.mode else PARAMETER_LIMITS
+        values, errorcode = limits[code]
+        # Any integer type is sent as its digits, such as numpy.int64, but a
+        # bool would be sent as "True"
+        try:
+            integer = operator.index(value)
+        except TypeError:
+            integer = None
+        if integer is None or isinstance(value, bool):
+            errorcode = "E14"
+        elif integer in values:
+            return None
+        return errorcode + ": " + ERROR_CODES[errorcode]
+
     def set_control_mode(self, mode: int) -> None | str:
         """Set the control mode of the laser
         mode = 0-7
         To understand the different control modes, refer to laser documentation"""
+        error = self.check_parameter("SM", mode)
+        if error is not None:
+            return error
         setcommand = f"SM {mode}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -233,7 +920,10 @@ class Pulsed_Laser:
         command = "GM"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.controlmode = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.controlmode = value
             return result
         elif success is False:
             return result
@@ -241,6 +931,9 @@ class Pulsed_Laser:
     def set_status_word(self, bit: int) -> None | str:
         """Set the value of the status word bit to 1
         Only writable bits (0, 1, 3, 4, 8, 9)"""
+        error = self.check_parameter("SS", bit)
+        if error is not None:
+            return error
         command = f"SS {bit}"
         success, result = self.serialconn.send_set_command(command)
         if success is True:
@@ -264,6 +957,9 @@ class Pulsed_Laser:
     def clear_status_word(self, bit: int) -> None | str:
         """Set the value of the status word bit to 0
         Only writable bits (0, 1, 3, 4, 8, 9)"""
+        error = self.check_parameter("SC", bit)
+        if error is not None:
+            return error
         command = f"SC {bit}"
         success, result = self.serialconn.send_set_command(command)
         if success is True:
@@ -291,12 +987,19 @@ class Pulsed_Laser:
         command = "GS"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.extpulsetrigger = bool(int(result[15]))
-            self.pilotlaser = bool(int(result[12]))
-            self.extcurrentcontrol = bool(int(result[9]))
-            self.mode = bool(int(result[6]))
-            self.pulses = bool(int(result[3]))
-            self.enable = bool(int(result[0]))
+            bits, error = self.parse_reading(
+                command, result, parse_bits, STATUS_WORD_POSITIONS
+            )
+            if error is not None:
+                return error
+            (
+                self.enable,
+                self.pulses,
+                self.mode,
+                self.extcurrentcontrol,
+                self.pilotlaser,
+                self.extpulsetrigger,
+            ) = bits
             return result
         elif success is False:
             return result
@@ -304,6 +1007,9 @@ class Pulsed_Laser:
     def set_simmer_current(self, current: int) -> None | str:
         """Set the simmer current of the laser
         current can be 000-100"""
+        error = self.check_parameter("SH", current)
+        if error is not None:
+            return error
         setcommand = f"SH {current}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -318,7 +1024,10 @@ class Pulsed_Laser:
         command = "GH"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.simmer = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.simmer = value
             return result
         elif success is False:
             return result
@@ -327,6 +1036,9 @@ class Pulsed_Laser:
         """Set the active current of the laser
         current can be 0000-1000
         Active current is proportional to power"""
+        error = self.check_parameter("SI", current)
+        if error is not None:
+            return error
         setcommand = f"SI {current}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -335,6 +1047,78 @@ class Pulsed_Laser:
         elif success is False:
             return result
 
+    def set_power(self, watts: float) -> None | str:
+        """Set the active current that gives an output power (W)
+        The current is looked up in powercalibration at the waveform and PRF
+        last set or read, so set those first"""
+        if self.powercalibration is None:
+            return "Error: No power calibration"
+        try:
+            current = self.powercalibration.current_for_power(
+                self.waveform, self.prf, watts
+            )
+        except ValueError as error:
+            return f"Error: {error}"
+        return self.set_active_current(current)
+
+    def estimate_power(self) -> None | float:
+        """Return the output power (W) powercalibration gives for the active
+        current, waveform and PRF last set or read
+        Returns None if there is no calibration for them"""
+        if self.powercalibration is None:
+            return None
+        try:
+            return self.powercalibration.power(
+                self.waveform, self.prf, self.activecurrent
+            )
+        except ValueError:
+            return None
+
+    def ramp_active_current(
+        self,
+        target: int,
+        rate: float,
+        step: int = 10,
+        abort: threading.Event | None = None,
+        start: int | None = None,
+    ) -> None | str:
+        """Ramp the active current from its present value to target
+        rate is in current units per second, step is the size of each step
+        start is the present value, read from the laser (GI) if not given
+        Steps are timed from the start of the ramp, not from the previous
+        set, and each set is sent early by the measured command latency so
+        it takes effect on schedule. If the link falls behind, intermediate
+        steps are dropped and the latest due value is sent
+        Setting abort stops the ramp at the last value sent
+        On a failure, returns the error message"""
+        error = self.check_parameter("SI", target)
+        if error is not None:
+            return error
+        if rate <= 0 or step <= 0:
+            return "Error: Ramp rate and step must be positive"
+        if abort is None:
+            abort = threading.Event()
+        if start is None:
+            error = self.get_active_current()
+            if is_error(error):
+                return error
+            start = self.activecurrent
+        value = start
+        index = 0
+        latency = 0.0
+        began = time.monotonic()
+        while value != target:
+            due = began + ramp_step_due(start, target, rate, step, index) - latency
+            if abort.wait(max(0.0, due - time.monotonic())):
+                return "Error: Ramp aborted"
+            elapsed = time.monotonic() - began + latency
+            index, value = ramp_next_step(start, target, rate, step, index, elapsed)
+            sent = time.monotonic()
+            error = self.set_active_current(value)
+            if error is not None:
+                return error
+            latency = 0.7 * latency + 0.3 * (time.monotonic() - sent)
+
     def get_active_current(self) -> None | str:
         """Get the current active current
         On success return "nnnn" where nnnn is the current
@@ -342,7 +1126,10 @@ class Pulsed_Laser:
         command = "GI"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.activecurrent = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.activecurrent = value
             return result
         elif success is False:
             return result
@@ -352,6 +1139,9 @@ class Pulsed_Laser:
         waveform can be 00-31
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
+        error = self.check_parameter("SW", waveform)
+        if error is not None:
+            return error
         setcommand = f"SW {waveform}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -366,7 +1156,10 @@ class Pulsed_Laser:
         command = "GW"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.waveform = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.waveform = value
             return result
         elif success is False:
             return result
@@ -377,6 +1170,9 @@ class Pulsed_Laser:
         PRF can be 0000100-0100000 Hz in CW mode
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
+        error = self.check_parameter("SR", PRF)
+        if error is not None:
+            return error
         setcommand = f"SR {PRF}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -392,7 +1188,10 @@ class Pulsed_Laser:
         command = "GR"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.prf = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.prf = value
             return result
         elif success is False:
             return result
@@ -404,6 +1203,9 @@ class Pulsed_Laser:
         =0 is continuous pulsing
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
+        error = self.check_parameter("SL", pulseburst)
+        if error is not None:
+            return error
         setcommand = f"SL {pulseburst}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -420,7 +1222,10 @@ class Pulsed_Laser:
         command = "GL"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.pulseburstlength = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.pulseburstlength = value
             return result
         elif success is False:
             return result
@@ -431,6 +1236,9 @@ class Pulsed_Laser:
         Pump modulation duty factor when laser in CWM mode
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
+        error = self.check_parameter("SF", pumpduty)
+        if error is not None:
+            return error
         setcommand = f"SF {pumpduty}"
         success, result = self.serialconn.send_set_command(setcommand)
         if success is True:
@@ -447,7 +1255,10 @@ class Pulsed_Laser:
         command = "GF"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.pumpduty = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.pumpduty = value
             return result
         elif success is False:
             return result
@@ -457,21 +1268,24 @@ class Pulsed_Laser:
         Response is "nn, nn, nn..."
         No response if no alarms
         The return string is split using ', ' as the deliminator
-        Each alarm is passed to read_alarms(), and the returned error message
-        is appended to the alarms array"""
+        Each alarm is passed to decode_alarms(), and the alarms array is
+        replaced by the returned error messages, so it only holds the alarms
+        active at the last query"""
         command = "QA"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            alarmarray = result.split(", ")
-            for alarm in alarmarray:
-                self.alarms.append(self.decode_alarms(int(alarm)))
+            alarmcodes, error = self.parse_reading(command, result, parse_alarms)
+            if error is not None:
+                return error
+            self.alarms = [self.decode_alarms(alarm) for alarm in alarmcodes]
             return result
         elif success is False:
             return result
 
-    def decode_alarms(self, alarmcode: int) -> None | str:
+    def decode_alarms(self, alarmcode: int) -> str:
         """Function for converting the alarm code number into a more
-        verbose explanation of the error"""
+        verbose explanation of the error
+        A code the manual does not list is returned as 'Unknown alarm nn'"""
         alarm = int(alarmcode)
         if 40 <= alarm <= 49:
             return "System fault: diode driver current"
@@ -493,6 +1307,7 @@ class Pulsed_Laser:
             return "Fan alarm. The Laser continues to operate if one fan stalls. The fan noise increases as the  remaining 3 fans increase their speed to compensate. Only cleared by cycling the power supply."
         elif alarm == 99:
             return "Emergency stop alarm Triggered by the Laser_Disable signal"
+        return f"Unknown alarm {alarm}"
 
     def query_monitoring_states(self) -> None | str:
         """Query the monitoring group signal states
@@ -500,14 +1315,19 @@ class Pulsed_Laser:
         command = "QD"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.monitor = bool(int(result[0]))
-            self.alarmstatemonitor = bool(int(result[1]))
-            self.lasertempmonitor = bool(int(result[2]))
-            self.beamdeliverytempmon = bool(int(result[3]))
-            self.systemfaultmonitor = bool(int(result[4]))
-            self.deactivatedmonitor = bool(int(result[5]))
-            self.emissionwarningmon = bool(int(result[6]))
-            self.laseronmonitor = bool(int(result[7]))
+            bits, error = self.parse_reading(command, result, parse_bits, range(8))
+            if error is not None:
+                return error
+            (
+                self.monitor,
+                self.alarmstatemonitor,
+                self.lasertempmonitor,
+                self.beamdeliverytempmon,
+                self.systemfaultmonitor,
+                self.deactivatedmonitor,
+                self.emissionwarningmon,
+                self.laseronmonitor,
+            ) = bits
             return
         elif success is False:
             return result
@@ -518,7 +1338,10 @@ class Pulsed_Laser:
         command = "QT"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.lasertemp = float(result)
+            value, error = self.parse_reading(command, result, float)
+            if error is not None:
+                return error
+            self.lasertemp = value
             return result
         elif success is False:
             return result
@@ -529,18 +1352,28 @@ class Pulsed_Laser:
         command = "QU"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.beamdeliverytemp = float(result)
+            value, error = self.parse_reading(command, result, float)
+            if error is not None:
+                return error
+            self.beamdeliverytemp = value
             return result
         elif success is False:
             return result
 
     def query_active_diode_currents(self) -> None | str:
         """Query the diode current of the pump laser driver stages (mA)
-        Response is "nnnnn, nnnnn" from 00000-20000"""
+        Response is "nnnnn, nnnnn" from 00000-20000
+        The integer currents are stored in diodecurrentvalues and added to
+        diodecurrentstats. A reply that does not parse changes nothing"""
         command = "QI"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
+            values, error = self.parse_reading(command, result, parse_diode_currents)
+            if error is not None:
+                return error
             self.diodecurrents = result
+            self.diodecurrentvalues = values
+            self.diodecurrentstats.update(self.diodecurrentvalues)
             return result
         elif success is False:
             return result
@@ -552,7 +1385,10 @@ class Pulsed_Laser:
         command = "QH"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.operatinghours = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.operatinghours = value
             return result
         elif success is False:
             return result
@@ -564,7 +1400,10 @@ class Pulsed_Laser:
         command = "QR"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.extprf = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.extprf = value
             return result
         elif success is False:
             return result
@@ -573,11 +1412,19 @@ class Pulsed_Laser:
         """Query the extended diode currents
         Current of pump laser diode driver stages in high power lasers
         Response is "nnnnn, nnnnn, nnnnn, (nnnnn)"
-        00000-20000 mA"""
+        00000-20000 mA
+        The integer currents are stored in extendeddiodecurrentvalues and
+        added to extendeddiodecurrentstats. A reply that does not parse
+        changes nothing"""
         command = "QJ"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
+            values, error = self.parse_reading(command, result, parse_diode_currents)
+            if error is not None:
+                return error
             self.extendeddiodecurrent = result
+            self.extendeddiodecurrentvalues = values
+            self.extendeddiodecurrentstats.update(self.extendeddiodecurrentvalues)
             return result
         elif success is False:
             return result
@@ -588,7 +1435,10 @@ class Pulsed_Laser:
         command = "QS"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.statuswordint = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.statuswordint = value
             return result
         elif success is False:
             return result
@@ -599,7 +1449,10 @@ class Pulsed_Laser:
         command = "RSN"
         success, result = self.serialconn.send_get_command(command)
         if success is True:
-            self.serialno = int(result)
+            value, error = self.parse_reading(command, result, int)
+            if error is not None:
+                return error
+            self.serialno = value
             return result
         elif success is False:
             return result
@@ -627,10 +1480,9 @@ class Pulsed_Laser:
         'DCHP' may be 'STATIC' depending on IP config
         x.x.x specifies versions"""
         command = "RQV"
-        success, result = self.serialconn.send_get_command(command)
+        success, result = self.serialconn.send_get_command(command, VENDOR_INFO_LINES)
         if success is True:
             self.vendorinfo = result
-            print(self.vendorinfo)
             return result
         elif success is False:
             return result
@@ -658,3 +1510,66 @@ class Pulsed_Laser:
         self.read_part_number()
         self.query_vendor_info()
         self.query_alarms()
+
+    def parse_reading(self, command: str, result: str, parse, *args) -> tuple:
+        """parse_reply() for the reply to a get command
+        If the reply does not parse, its reply times are rejected, so
+        reading_times() still gives the times of the value stored"""
+        value, error = parse_reply(command, result, parse, *args)
+        if error is not None:
+            self.serialconn.reject_reply(command)
+        return value, error
+
+    def reading_times(self, attribute: str) -> ReplyTimes | None:
+        """Return the ReplyTimes of the query that last updated a telemetry
+        attribute, or None if it has not been read
+        attribute is a key of READING_COMMANDS, e.g. "lasertemp"
+        The times are time.monotonic_ns() values, so they can be joined with
+        other streams timestamped by the same clock"""
+        replytimes = getattr(self.serialconn, "replytimes", {})
+        return replytimes.get(READING_COMMANDS[attribute])
+
+    def save_state(self, path: str):
+        """Save the laser identity and last-known parameters to a JSON file
+        States are keyed by port and serial number, so one file can hold
+        several lasers"""
+        key = f"{self.serialconn.port}|{self.serialno}"
+        try:
+            with open(path) as file:
+                states = json.load(file)
+        except (OSError, ValueError):
+            states = {}
+        states[key] = {name: getattr(self, name) for name in STATE_ATTRIBUTES}
+        temppath = path + ".tmp"
+        with open(temppath, "w") as file:
+            json.dump(states, file, indent=2)
+        os.replace(temppath, path)
+
+    def warm_start(self, path: str) -> bool:
+        """Populate the laser information using a state file from save_state()
+        The serial number is read to confirm it is the same laser, then the
+        identity and parameters are loaded from the file. The status word,
+        monitoring states and alarms are always read from the laser
+        If the laser is not in the file, initialise_laser() is run and the
+        state is saved
+        Returns True if the cached state was used"""
+        if is_error(self.read_serial_number()):
+            self.initialise_laser()
+            return False
+        key = f"{self.serialconn.port}|{self.serialno}"
+        try:
+            with open(path) as file:
+                state = json.load(file).get(key)
+        except (OSError, ValueError):
+            state = None
+        if state is None:
+            self.initialise_laser()
+            self.save_state(path)
+            return False
+        for name in STATE_ATTRIBUTES:
+            if name in state:
+                setattr(self, name, state[name])
+        self.get_status_word()
+        self.query_monitoring_states()
+        self.query_alarms()
+        return True
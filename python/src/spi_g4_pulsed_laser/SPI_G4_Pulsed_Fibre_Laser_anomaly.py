@@ -0,0 +1,167 @@
+"""Streaming anomaly detection on SPI G4 pulsed laser telemetry.
+
+AnomalyDetector keeps exponentially weighted mean, variance and slope
+statistics for each channel (laser temperature, beam delivery temperature
+and each diode driver stage current). The memory per channel is constant.
+It gives an early warning before the laser's own alarms trip, when a channel:
+
+    "limit"      is within margin of its alarm limit
+    "trend"      is heading for its alarm limit within horizon seconds
+    "deviation"  is more than zlimit standard deviations from its mean
+
+The default limits are the full scale of each reply (85.0 C, 20000 mA).
+Set them to the alarm thresholds of the laser in use.
+"""
+
+import math
+import time
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+
+TEMPERATURE_LIMIT = 85.0  # C, full scale of QT/QU replies
+DIODE_CURRENT_LIMIT = 20000  # mA, full scale of QI/QJ replies
+
+NO_WARNINGS = frozenset()
+
+
+class ChannelStats:
+    """EWMA mean, variance and slope (units/s) of one telemetry channel"""
+
+    __slots__ = (
+        "alpha",
+        "count",
+        "mean",
+        "slope",
+        "time",
+        "value",
+        "variance",
+        "warnings",
+    )
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.slope = 0.0
+        self.value = 0.0
+        self.time = 0.0
+        self.warnings = NO_WARNINGS  # Reasons this channel is warning for
+
+    def update(self, value: float, timestamp: float):
+        """Add a sample taken at timestamp (s)"""
+        alpha = self.alpha
+        if self.count:
+            dt = timestamp - self.time
+            if dt > 0:
+                self.slope += alpha * ((value - self.value) / dt - self.slope)
+            difference = value - self.mean
+            increment = alpha * difference
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + difference * increment)
+        else:
+            self.mean = value
+        self.count += 1
+        self.value = value
+        self.time = timestamp
+
+
+class AnomalyDetector:
+    """Early warnings from a stream of telemetry samples
+
+    limits maps channel names to alarm limits, channels not listed use
+    TEMPERATURE_LIMIT or DIODE_CURRENT_LIMIT. No warnings are given for a
+    channel until it has warmup samples.
+    callback(channel, reason, value) is called when a channel starts giving a
+    warning for a reason, not again until that warning has cleared.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        horizon: float = 30.0,
+        zlimit: float = 4.0,
+        margin: float = 0.05,
+        warmup: int = 20,
+        limits: dict[str, float] | None = None,
+        callback=None,
+    ):
+        self.alpha = alpha
+        self.horizon = horizon
+        self.zlimit = zlimit
+        self.margin = margin
+        self.warmup = warmup
+        self.limits = dict(limits or {})
+        self.callback = callback
+        self.channels = {}
+
+    def limit(self, channel: str) -> float:
+        """Return the alarm limit of a channel"""
+        if channel in self.limits:
+            return self.limits[channel]
+        if channel.endswith("temp"):
+            return TEMPERATURE_LIMIT
+        return DIODE_CURRENT_LIMIT
+
+    def update(
+        self, channel: str, value: float, timestamp: float | None = None
+    ) -> list[tuple[str, str, float]]:
+        """Add a sample to a channel and return its warnings
+        Each warning is (channel, reason, value)"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        stats = self.channels.get(channel)
+        if stats is None:
+            stats = self.channels[channel] = ChannelStats(self.alpha)
+        # Deviation is judged against the statistics before this sample
+        deviation = abs(value - stats.mean)
+        spread = math.sqrt(stats.variance)
+        stats.update(value, timestamp)
+        if stats.count <= self.warmup:
+            return []
+
+        limit = self.limit(channel)
+        warnings = []
+        if value >= limit * (1 - self.margin):
+            warnings.append((channel, "limit", value))
+        elif stats.slope > 0 and value + stats.slope * self.horizon >= limit:
+            warnings.append((channel, "trend", value))
+        if deviation > self.zlimit * spread > 0:
+            warnings.append((channel, "deviation", value))
+
+        reasons = NO_WARNINGS
+        if warnings:
+            reasons = frozenset(warning[1] for warning in warnings)
+        if reasons != stats.warnings:
+            if self.callback is not None:
+                for reason in reasons - stats.warnings:
+                    self.callback(channel, reason, value)
+            stats.warnings = reasons
+        return warnings
+
+    def active_warnings(self) -> list[tuple[str, str]]:
+        """Return (channel, reason) for every warning currently active"""
+        return [
+            (channel, reason)
+            for channel, stats in self.channels.items()
+            for reason in sorted(stats.warnings)
+        ]
+
+    def update_from_laser(
+        self, laser: Pulsed_Laser, timestamp: float | None = None
+    ) -> list[tuple[str, str, float]]:
+        """Add the latest telemetry stored on a Pulsed_Laser
+        Uses the values from query_laser_temp, query_beam_delivery_temp,
+        query_active_diode_currents and query_extended_diode_currents.
+        Diode stages are channels "diodecurrent0".. and "extendeddiodecurrent0".."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        warnings = self.update("lasertemp", laser.lasertemp, timestamp)
+        warnings += self.update("beamdeliverytemp", laser.beamdeliverytemp, timestamp)
+        for name, currents in (
+            ("diodecurrent", laser.diodecurrentvalues),
+            ("extendeddiodecurrent", laser.extendeddiodecurrentvalues),
+        ):
+            for stage, current in enumerate(currents):
+                warnings += self.update(f"{name}{stage}", current, timestamp)
+        return warnings
@@ -1,7 +1,97 @@
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import serial
-from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser import (
+    Pulsed_Laser,
+    is_error,
+    ramp_next_step,
+    ramp_step_due,
+)
+
+MONITORING_BITS = (
+    "monitor",
+    "alarmstatemonitor",
+    "lasertempmonitor",
+    "beamdeliverytempmon",
+    "systemfaultmonitor",
+    "deactivatedmonitor",
+    "emissionwarningmon",
+    "laseronmonitor",
+)
+
+# Telemetry fields available to AsyncPulsedLaser.stream()
+# field name: (Pulsed_Laser query method, conversion of the stored value)
+STREAM_FIELDS = {
+    "lasertemp": ("query_laser_temp", lambda laser: float(laser.lasertemp)),
+    "beamdeliverytemp": (
+        "query_beam_delivery_temp",
+        lambda laser: float(laser.beamdeliverytemp),
+    ),
+    "diodecurrents": (
+        "query_active_diode_currents",
+        lambda laser: tuple(laser.diodecurrentvalues),
+    ),
+    "extendeddiodecurrent": (
+        "query_extended_diode_currents",
+        lambda laser: tuple(laser.extendeddiodecurrentvalues),
+    ),
+    "monitoring": (
+        "query_monitoring_states",
+        lambda laser: {bit: getattr(laser, bit) for bit in MONITORING_BITS},
+    ),
+    "statuswordint": ("query_status_word_int", lambda laser: laser.statuswordint),
+    "extprf": ("query_ext_prf", lambda laser: laser.extprf),
+    "alarms": ("query_alarms", lambda laser: tuple(laser.alarms)),
+    "controlmode": ("get_control_mode", lambda laser: laser.controlmode),
+}
+
+# Pulsed_Laser attribute whose reading_times() are used for a stream field,
+# where the field is not itself an attribute
+SAMPLE_TIME_ATTRIBUTES = {"monitoring": "monitor"}
+
+# Results of reads that were never sent, see AsyncPulsedLaser.get_queue_metrics()
+REJECTED = "Error: Command queue is full"
+EXPIRED = "Error: Read expired in the command queue"
+
+# Pending reads made stale by a set, by Pulsed_Laser method name
+INVALIDATES = {
+    "set_control_mode": ("get_control_mode",),
+    "set_status_word": ("get_status_word", "query_status_word_int"),
+    "clear_status_word": ("get_status_word", "query_status_word_int"),
+    "set_simmer_current": ("get_simmer_current",),
+    "set_active_current": ("get_active_current",),
+    "set_waveform": ("get_waveform",),
+    "set_prf": ("get_prf",),
+    "set_pulse_burst_length": ("get_pulse_burst_length",),
+    "set_pump_duty": ("get_pump_duty",),
+}
+
+
+@dataclass(frozen=True)
+class TelemetrySnapshot:
+    """Typed telemetry read by AsyncPulsedLaser.stream()
+    Fields that were not requested, or whose query failed, are None
+    The error string of a failed query is stored in errors under the field name
+    timestamp is time.monotonic() when the last query of the snapshot finished
+    sampletimes holds the estimated time.monotonic_ns() each field was read
+    by the laser, see Pulsed_Laser.reading_times()
+    latency is the mean round trip (s) of the queries with reading times"""
+
+    timestamp: float
+    lasertemp: float | None = None
+    beamdeliverytemp: float | None = None
+    diodecurrents: tuple[int, ...] | None = None
+    extendeddiodecurrent: tuple[int, ...] | None = None
+    monitoring: dict[str, bool] | None = None
+    statuswordint: int | None = None
+    extprf: int | None = None
+    alarms: tuple[str, ...] | None = None
+    controlmode: int | None = None
+    latency: float | None = None
+    errors: dict[str, str] = field(default_factory=dict)
+    sampletimes: dict[str, int] = field(default_factory=dict)
 
 
 class AsyncPulsedLaser:
@@ -11,10 +101,89 @@ class AsyncPulsedLaser:
     allowing it to be used in asyncio applications without blocking the event loop.
     """
 
-    def __init__(self):
+    def __init__(self, maxqueue: int = 64, maxage: float | None = None):
         self._laser = Pulsed_Laser()
         self._executor = ThreadPoolExecutor(max_workers=1)
         self._loop = asyncio.get_event_loop()
+        self._inflight = {}
+        # Reads are rejected once maxqueue commands are waiting, and dropped
+        # if they have waited longer than maxage s, see get_queue_metrics()
+        self.maxqueue = maxqueue
+        self.maxage = maxage
+        self.queuemetrics = {
+            "submitted": 0,
+            "conflated": 0,
+            "rejected": 0,
+            "expired": 0,
+            "maxdepth": 0,
+        }
+        self._depth = 0  # Commands queued or running on the executor
+
+    async def _submit(self, func, args: tuple, droppable: bool):
+        """Queue func(*args) on the executor
+        A droppable command is rejected if the queue is full, and expires if
+        it has been queued for longer than maxage when it is reached"""
+        metrics = self.queuemetrics
+        if droppable and self._depth >= self.maxqueue:
+            metrics["rejected"] += 1
+            return REJECTED
+        self._depth += 1
+        metrics["submitted"] += 1
+        metrics["maxdepth"] = max(metrics["maxdepth"], self._depth)
+        try:
+            return await self._loop.run_in_executor(
+                self._executor, self._run, func, args, droppable, time.monotonic()
+            )
+        finally:
+            self._depth -= 1
+
+    def _run(self, func, args: tuple, droppable: bool, queued: float):
+        maxage = self.maxage
+        if droppable and maxage is not None and time.monotonic() - queued > maxage:
+            self.queuemetrics["expired"] += 1
+            return EXPIRED
+        return func(*args)
+
+    async def _call(self, func, *args):
+        """Run a Pulsed_Laser method in the executor, it is never dropped"""
+        return await self._submit(func, args, False)
+
+    async def _read(self, func):
+        """Run a Pulsed_Laser get/query/read method in the executor
+        Concurrent calls of the same method share one pending transaction
+        and all receive its result. A read can be rejected or expire, see
+        get_queue_metrics()"""
+        name = func.__name__
+        pending = self._inflight.get(name)
+        if pending is None:
+            pending = asyncio.ensure_future(self._submit(func, (), True))
+            self._inflight[name] = pending
+            pending.add_done_callback(lambda done: self._finish_read(name, done))
+        else:
+            self.queuemetrics["conflated"] += 1
+        return await asyncio.shield(pending)
+
+    def _finish_read(self, name: str, done: asyncio.Future):
+        if self._inflight.get(name) is done:
+            del self._inflight[name]
+
+    async def _write(self, func, *args):
+        """Run a Pulsed_Laser set/clear method in the executor
+        Set commands are never rejected or dropped. Pending reads of the
+        parameter being set are no longer shared, so later callers read the
+        new value"""
+        for name in INVALIDATES.get(func.__name__, ()):
+            self._inflight.pop(name, None)
+        return await self._submit(func, args, False)
+
+    def get_queue_metrics(self) -> dict[str, int]:
+        """Return the executor queue counters and its current depth
+        depth counts the commands queued or running on the executor
+        submitted: commands queued, conflated: reads that shared a pending
+        read, rejected: reads refused because maxqueue commands were
+        waiting, expired: reads dropped after waiting longer than maxage,
+        maxdepth: the most commands waiting at once"""
+        return {**self.queuemetrics, "depth": self._depth}
 
     # Connection methods
     async def create_serial_connection(
@@ -25,11 +194,13 @@ class AsyncPulsedLaser:
         parity: str = serial.PARITY_NONE,
         databits: int = serial.EIGHTBITS,
         timeout: int = 1,
+        keepalive: int = 10,
+        adaptive_timeout: bool = False,
     ) -> None:
         """Asynchronously create an instance of the Pulsed_Laser_Serial class to talk to laser
-        Default serial settings are those detailed in the G4 manual"""
-        return await self._loop.run_in_executor(
-            self._executor,
+        Default serial settings are those detailed in the G4 manual
+        port may also be a "socket://host:port" or "rfc2217://host:port" URL"""
+        return await self._call(
             self._laser.create_serial_connection,
             port,
             baudrate,
@@ -37,97 +208,126 @@ class AsyncPulsedLaser:
             parity,
             databits,
             timeout,
+            keepalive,
+            adaptive_timeout,
         )
 
     async def close_serial(self) -> None:
         """Asynchronously close the connection with the laser"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.close_serial
-        )
+        return await self._call(self._laser.close_serial)
 
     # Set/Get methods
     async def set_control_mode(self, mode: int) -> None | str:
         """Asynchronously set the control mode of the laser
         mode = 0-7
         To understand the different control modes, refer to laser documentation"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_control_mode, mode
-        )
+        return await self._write(self._laser.set_control_mode, mode)
 
     async def get_control_mode(self) -> None | str:
         """Asynchronously get the current control mode
         On success return a single digit 0-7"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_control_mode
-        )
+        return await self._read(self._laser.get_control_mode)
 
     async def set_status_word(self, bit: int) -> None | str:
         """Asynchronously set the value of the status word bit to 1
         Only writable bits (0, 1, 3, 4, 8, 9)"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_status_word, bit
-        )
+        return await self._write(self._laser.set_status_word, bit)
 
     async def clear_status_word(self, bit: int) -> None | str:
         """Asynchronously set the value of the status word bit to 0
         Only writable bits (0, 1, 3, 4, 8, 9)"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.clear_status_word, bit
-        )
+        return await self._write(self._laser.clear_status_word, bit)
 
     async def get_status_word(self) -> None | str:
         """Asynchronously get the current value of each status word bit
         Result is in the format "n, n, n,"
         Convert the "n" part of the result to a bool for each parameter"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_status_word
-        )
+        return await self._read(self._laser.get_status_word)
 
     async def set_simmer_current(self, current: int) -> None | str:
         """Asynchronously set the simmer current of the laser
         current can be 000-100"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_simmer_current, current
-        )
+        return await self._write(self._laser.set_simmer_current, current)
 
     async def get_simmer_current(self) -> None | str:
         """Asynchronously get the current simmer current
         On success return "nnn" where nnn is the current"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_simmer_current
-        )
+        return await self._read(self._laser.get_simmer_current)
 
     async def set_active_current(self, current: int) -> None | str:
         """Asynchronously set the active current of the laser
         current can be 0000-1000
         Active current is proportional to power"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_active_current, current
-        )
+        return await self._write(self._laser.set_active_current, current)
+
+    async def ramp_active_current(
+        self,
+        target: int,
+        rate: float,
+        step: int = 10,
+        abort: asyncio.Event | None = None,
+        start: int | None = None,
+    ) -> None | str:
+        """Asynchronously ramp the active current from its present value to target
+        rate is in current units per second, step is the size of each step
+        start is the present value, read from the laser (GI) if not given
+        Steps are timed from the start of the ramp and sent early by the
+        measured command latency. If the link falls behind, intermediate
+        steps are dropped and the latest due value is sent
+        Setting abort (or cancelling the task) stops the ramp at the last
+        value sent
+        On a failure, returns the error message"""
+        error = self._laser.check_parameter("SI", target)
+        if error is not None:
+            return error
+        if rate <= 0 or step <= 0:
+            return "Error: Ramp rate and step must be positive"
+        if abort is None:
+            abort = asyncio.Event()
+        if start is None:
+            error = await self.get_active_current()
+            if is_error(error):
+                return error
+            start = self._laser.activecurrent
+        value = start
+        index = 0
+        latency = 0.0
+        began = self._loop.time()
+        while value != target:
+            due = began + ramp_step_due(start, target, rate, step, index) - latency
+            try:
+                await asyncio.wait_for(abort.wait(), max(0.0, due - self._loop.time()))
+            # Before Python 3.11 wait_for() raises asyncio.TimeoutError, which
+            # is not the builtin TimeoutError
+            except asyncio.TimeoutError:  # noqa: UP041
+                pass
+            if abort.is_set():
+                return "Error: Ramp aborted"
+            elapsed = self._loop.time() - began + latency
+            index, value = ramp_next_step(start, target, rate, step, index, elapsed)
+            sent = self._loop.time()
+            error = await self.set_active_current(value)
+            if error is not None:
+                return error
+            latency = 0.7 * latency + 0.3 * (self._loop.time() - sent)
 
     async def get_active_current(self) -> None | str:
         """Asynchronously get the current active current
         On success return "nnnn" where nnnn is the current
         Active current is proportional to power"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_active_current
-        )
+        return await self._read(self._laser.get_active_current)
 
     async def set_waveform(self, waveform: int) -> None | str:
         """Asynchronously set the waveform of the laser
         waveform can be 00-31
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_waveform, waveform
-        )
+        return await self._write(self._laser.set_waveform, waveform)
 
     async def get_waveform(self) -> None | str:
         """Asynchronously get the waveform of the laser
         waveform can be 00-31"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_waveform
-        )
+        return await self._read(self._laser.get_waveform)
 
     async def set_prf(self, prf: int) -> None | str:
         """Asynchronously set the pulse repetition frequency (PRF) of the laser
@@ -135,15 +335,13 @@ class AsyncPulsedLaser:
         PRF can be 0000100-0100000 Hz in CW mode
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_prf, prf
-        )
+        return await self._write(self._laser.set_prf, prf)
 
     async def get_prf(self) -> None | str:
         """Asynchronously get the pulse repetition frequency (PRF) of the laser
         PRF can be 0010000-1000000 Hz in pulsed mode
         PRF can be 0000100-0100000 Hz in CW mode"""
-        return await self._loop.run_in_executor(self._executor, self._laser.get_prf)
+        return await self._read(self._laser.get_prf)
 
     async def set_pulse_burst_length(self, pulseburst: int) -> None | str:
         """Asynchronously set the pulse burst length, number of pulses produced
@@ -152,18 +350,14 @@ class AsyncPulsedLaser:
         =0 is continuous pulsing
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_pulse_burst_length, pulseburst
-        )
+        return await self._write(self._laser.set_pulse_burst_length, pulseburst)
 
     async def get_pulse_burst_length(self) -> None | str:
         """Asynchronously set the pulse burst length, number of pulses produced
         When Laser_Emission_Gate input = High
         Pulse burst length can be 0000000-10000000
         =0 is continuous pulsing"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_pulse_burst_length
-        )
+        return await self._read(self._laser.get_pulse_burst_length)
 
     async def set_pump_duty(self, pumpduty: int) -> None | str:
         """Asynchronously set the pump duty factor
@@ -171,18 +365,14 @@ class AsyncPulsedLaser:
         Pump modulation duty factor when laser in CWM mode
         Change is implimented when pulses start ('SS 1' sent)
         Every time a change is made, 'SS 1' still needs to be sent to update"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.set_pump_duty, pumpduty
-        )
+        return await self._write(self._laser.set_pump_duty, pumpduty)
 
     async def get_pump_duty(self) -> None | str:
         """Asynchronously set the pump duty factor
         pump duty can be 0000-1000
         Response is "nnnnnn"
         Pump modulation duty factor when laser in CWM mode"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.get_pump_duty
-        )
+        return await self._read(self._laser.get_pump_duty)
 
     # Query methods
     async def query_alarms(self) -> None | str:
@@ -190,86 +380,65 @@ class AsyncPulsedLaser:
         Response is "nn, nn, nn..."
         No response if no alarms
         The return string is split using ', ' as the deliminator
-        Each alarm is passed to read_alarms(), and the returned error message
-        is appended to the alarms array"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_alarms
-        )
+        Each alarm is passed to decode_alarms(), and the alarms array is
+        replaced by the returned error messages, so it only holds the alarms
+        active at the last query"""
+        return await self._read(self._laser.query_alarms)
 
     async def query_monitoring_states(self) -> None | str:
         """Asynchronously query the monitoring group signal states
         Response is "bbbbbbbb", 00000000-11111111"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_monitoring_states
-        )
+        return await self._read(self._laser.query_monitoring_states)
 
     async def query_laser_temp(self) -> None | str:
         """Asynchronously query the laser temperature
         Response is "nn.n" from 00.0-85.0 C"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_laser_temp
-        )
+        return await self._read(self._laser.query_laser_temp)
 
     async def query_beam_delivery_temp(self) -> None | str:
         """Asynchronously query the beam delivery temperature
         Response is "nn.n" from 00.0-85.0 C"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_beam_delivery_temp
-        )
+        return await self._read(self._laser.query_beam_delivery_temp)
 
     async def query_active_diode_currents(self) -> None | str:
         """Asynchronously query the diode current of the pump laser driver stages (mA)
         Response is "nnnnn, nnnnn" from 00000-20000"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_active_diode_currents
-        )
+        return await self._read(self._laser.query_active_diode_currents)
 
     async def query_operating_hours(self) -> None | str:
         """Asynchronously query the operating time of the laser
         Time for which the 24V Logic supply has been applied
         Response is "nnnnnn" in hours"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_operating_hours
-        )
+        return await self._read(self._laser.query_operating_hours)
 
     async def query_ext_prf(self) -> None | str:
         """Asynchronously query the external PRF signal
         Rising edge to rising edge of the external trigger signal
         Response is "nnnnnnn", 0000000-1000000 Hz"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_ext_prf
-        )
+        return await self._read(self._laser.query_ext_prf)
 
     async def query_extended_diode_currents(self) -> None | str:
         """Asynchronously query the extended diode currents
         Current of pump laser diode driver stages in high power lasers
         Response is "nnnnn, nnnnn, nnnnn, (nnnnn)"
         00000-20000 mA"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_extended_diode_currents
-        )
+        return await self._read(self._laser.query_extended_diode_currents)
 
     async def query_status_word_int(self) -> None | str:
         """Asynchronously query the status word as a 16-bit integer
         Response is "nnnnnn", 00000-65535"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_status_word_int
-        )
+        return await self._read(self._laser.query_status_word_int)
 
     # Read methods
     async def read_serial_number(self) -> None | str:
         """Asynchronously read the laser serial number
         Response is "nnnnnn", numerical"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.read_serial_number
-        )
+        return await self._read(self._laser.read_serial_number)
 
     async def read_part_number(self) -> None | str:
         """Asynchronously read the part number of the laser
         Response is "XX-XXXP-X-XX-X-X-X(XX)"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.read_part_number
-        )
+        return await self._read(self._laser.read_part_number)
 
     async def query_vendor_info(self) -> None | str:
         """Asynchronously query Vendor Information on the laser
@@ -282,14 +451,77 @@ class AsyncPulsedLaser:
 
         'DCHP' may be 'STATIC' depending on IP config
         x.x.x specifies versions"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.query_vendor_info
+        return await self._read(self._laser.query_vendor_info)
+
+    # Streaming
+    def _read_snapshot(self, fields: tuple[str, ...]) -> TelemetrySnapshot:
+        """Run the queries for every field and build a TelemetrySnapshot
+        Runs in the executor, so a whole snapshot costs one executor hop"""
+        values = {}
+        errors = {}
+        sampletimes = {}
+        roundtrip = 0
+        for name in fields:
+            method, convert = STREAM_FIELDS[name]
+            error = getattr(self._laser, method)()
+            if is_error(error):
+                errors[name] = error
+            else:
+                values[name] = convert(self._laser)
+                times = self._laser.reading_times(SAMPLE_TIME_ATTRIBUTES.get(name, name))
+                if times is not None:
+                    sampletimes[name] = times.sample
+                    roundtrip += times.received - times.sent
+        if sampletimes:
+            values["latency"] = roundtrip / len(sampletimes) / 1e9
+        return TelemetrySnapshot(
+            timestamp=time.monotonic(), errors=errors, sampletimes=sampletimes, **values
         )
 
+    async def stream(
+        self,
+        fields: tuple[str, ...] = ("lasertemp", "beamdeliverytemp", "monitoring"),
+        interval: float = 1.0,
+    ):
+        """Asynchronously iterate over TelemetrySnapshots read every interval seconds
+        fields are names from STREAM_FIELDS
+        Polling runs independently of the consumer. A consumer slower than
+        interval receives the latest snapshot and intermediate ones are dropped,
+        so nothing is buffered
+        Polling stops when the iterator is closed"""
+        fields = tuple(fields)
+        for name in fields:
+            if name not in STREAM_FIELDS:
+                raise ValueError(f"{name} is not a telemetry field")
+        latest = None
+        ready = asyncio.Event()
+
+        async def poll():
+            nonlocal latest
+            deadline = self._loop.time()
+            while True:
+                latest = await self._call(self._read_snapshot, fields)
+                ready.set()
+                deadline = max(deadline + interval, self._loop.time())
+                await asyncio.sleep(deadline - self._loop.time())
+
+        poller = asyncio.ensure_future(poll())
+        try:
+            while True:
+                waiter = asyncio.ensure_future(ready.wait())
+                await asyncio.wait(
+                    {waiter, poller}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not waiter.done():
+                    waiter.cancel()
+                    poller.result()
+                ready.clear()
+                yield latest
+        finally:
+            poller.cancel()
+
     # Initialisation
     async def initialise_laser(self) -> None:
         """Asynchronously runs through all the functions that request information off the laser
         to populate the information about it"""
-        return await self._loop.run_in_executor(
-            self._executor, self._laser.initialise_laser
-        )
+        return await self._call(self._laser.initialise_laser)
@@ -0,0 +1,180 @@
+"""Port owning daemon for the SPI G4 pulsed laser.
+
+A serial port can only be opened by one process, and the G4 RS232 link is
+simplex. LaserDaemon owns the Pulsed_Laser connection and serves any number
+of local clients over a Unix domain socket, so each tool can run as its own
+process.
+
+Protocol, one line each way per request:
+    request:  "<method> [<argument>]", e.g. "get_prf" or "set_prf 50000"
+    reply:    the return value of the Pulsed_Laser method as JSON
+              (null on success for set commands, a string otherwise)
+              Reads in ATTRIBUTE_READS reply with an object of the
+              attributes they update instead of null
+
+Requests from all clients are sent to the laser one at a time in arrival
+order. Reads younger than cachettl seconds are answered from the cache
+without touching the wire, and any set or clear command empties the cache.
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, is_error
+from SPI_G4_Pulsed_Fibre_Laser_async import MONITORING_BITS
+
+# Method prefixes clients are allowed to call
+READ_PREFIXES = ("get_", "query_", "read_")
+WRITE_PREFIXES = ("set_", "clear_")
+
+# Reads that return None on success, and the Pulsed_Laser attributes they
+# update, which are replied and cached in place of None
+ATTRIBUTE_READS = {"query_monitoring_states": MONITORING_BITS}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            result = self.server.laserdaemon.request(line.decode("utf-8").strip())
+            self.wfile.write(bytes(json.dumps(result) + "\n", "utf-8"))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class LaserDaemon:
+    """Serve a connected Pulsed_Laser to clients on the Unix socket at path"""
+
+    def __init__(self, laser: Pulsed_Laser, path: str, cachettl: float = 0.5):
+        self.laser = laser
+        self.path = path
+        self.cachettl = cachettl
+        self.cache = {}
+        self.wirerequests = 0
+        self.cachedrequests = 0
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._server = None
+
+    def start(self):
+        """Start serving in background threads"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = _Server(self.path, _Handler)
+        self._server.laserdaemon = self
+        self._worker.start()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def shutdown(self):
+        """Stop serving and remove the socket file
+        The laser connection is left open"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._requests.put(None)
+        self._worker.join()
+        os.unlink(self.path)
+
+    def request(self, line: str) -> None | str:
+        """Run one protocol request line and return the method result"""
+        method, _, argument = line.partition(" ")
+        if not method.startswith(READ_PREFIXES + WRITE_PREFIXES) or not hasattr(
+            self.laser, method
+        ):
+            return f"Error: Unknown method {method}"
+        args = ()
+        if argument:
+            try:
+                args = (int(argument),)
+            except ValueError:
+                return f"Error: Argument {argument} is not an integer"
+        if method.startswith(READ_PREFIXES) and not args:
+            cached = self.cache.get(method)
+            if cached is not None and time.monotonic() - cached[1] < self.cachettl:
+                self.cachedrequests += 1
+                return cached[0]
+        future = Future()
+        self._requests.put((method, args, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            method, args, future = item
+            try:
+                result = getattr(self.laser, method)(*args)
+            # Any failure is returned to its client, the worker serves them all
+            except Exception as error:  # noqa: BLE001
+                result = f"Error: {error}"
+            self.wirerequests += 1
+            if method.startswith(WRITE_PREFIXES):
+                self.cache.clear()
+            elif not is_error(result):
+                if result is None and method in ATTRIBUTE_READS:
+                    result = {
+                        name: getattr(self.laser, name)
+                        for name in ATTRIBUTE_READS[method]
+                    }
+                self.cache[method] = (result, time.monotonic())
+            future.set_result(result)
+
+
+class LaserDaemonClient:
+    """Client for a LaserDaemon
+    Laser methods are called as on a Pulsed_Laser, e.g. client.get_prf()"""
+
+    def __init__(self, path: str, timeout: float = 10):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+        self.reader = self.socket.makefile("rb")
+
+    def call(self, method: str, *args: int) -> None | str | dict[str, bool]:
+        """Send one request to the daemon and return the result"""
+        line = " ".join((method, *(str(arg) for arg in args)))
+        self.socket.sendall(bytes(line + "\n", "utf-8"))
+        return json.loads(self.reader.readline())
+
+    def __getattr__(self, method: str):
+        if not method.startswith(READ_PREFIXES + WRITE_PREFIXES):
+            raise AttributeError(method)
+        return lambda *args: self.call(method, *args)
+
+    def close(self):
+        """Close the connection to the daemon"""
+        self.reader.close()
+        self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPI G4 laser port daemon")
+    parser.add_argument("--port", required=True, help="serial port of the laser")
+    parser.add_argument("--socket", required=True, help="Unix socket path to serve")
+    parser.add_argument("--cachettl", type=float, default=0.5)
+    arguments = parser.parse_args()
+
+    laser = Pulsed_Laser()
+    laser.create_serial_connection(arguments.port)
+    laser.initialise_laser()
+    daemon = LaserDaemon(laser, arguments.socket, arguments.cachettl)
+    daemon.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown()
+        laser.close_serial()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Chunked columnar storage of SPI G4 pulsed laser telemetry.
+
+TelemetryStore appends telemetry rows to a directory of chunks. Each chunk
+holds one NumPy .npy file per column, and chunks.txt indexes the time span
+of every chunk:
+
+    store/
+        chunks.txt          "<chunk> <first time> <last time> <rows>" per line
+        00000000/time.npy
+        00000000/lasertemp.npy
+        ...
+
+Writing only ever adds files and index lines. read_range() memory-maps the
+chunks that overlap the requested time range and slices them, so reads
+never load the whole history. export_parquet() writes everything to a
+Parquet file when pyarrow is installed.
+
+This module needs NumPy, which is not a dependency of the rest of the
+library.
+"""
+
+import os
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from SPI_G4_Pulsed_Fibre_Laser import READING_COMMANDS, Pulsed_Laser
+
+# Columns written by TelemetryStore.record(), column name: NumPy dtype
+# Telemetry that has not been read and diode stages that are not present on
+# a laser are stored as missing values
+DEFAULT_COLUMNS = {
+    "lasertemp": "float32",
+    "beamdeliverytemp": "float32",
+    "diodecurrent0": "int32",
+    "diodecurrent1": "int32",
+    "extendeddiodecurrent0": "int32",
+    "extendeddiodecurrent1": "int32",
+    "extendeddiodecurrent2": "int32",
+    "extendeddiodecurrent3": "int32",
+    "statuswordint": "uint16",
+    "activecurrent": "uint16",
+    "waveform": "uint8",
+    "prf": "uint32",
+    "extprf": "uint32",
+}
+
+INDEX_FILE = "chunks.txt"
+
+
+def missing_value(dtype: str) -> float:
+    """Return the value stored for a missing value in a column of dtype
+    NaN for a float dtype, -1 for a signed integer dtype, or the largest
+    value of an unsigned integer dtype"""
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return float("nan")
+    if dtype.kind == "u":
+        return int(np.iinfo(dtype).max)
+    return -1
+
+
+class TelemetryStore:
+    """Append-only columnar telemetry history in directory
+
+    Rows are buffered in memory and written as a chunk every chunksize rows
+    (and by flush() or close()). Every row has a "time" column, in seconds
+    since the epoch, which must not decrease from one row to the next.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        columns: dict[str, str] | None = None,
+        chunksize: int = 10000,
+    ):
+        if np is None:
+            raise ImportError("TelemetryStore requires NumPy (pip install numpy)")
+        self.directory = directory
+        self.columns = {"time": "float64", **(columns or DEFAULT_COLUMNS)}
+        self.chunksize = chunksize
+        self.buffer = {name: [] for name in self.columns}
+        self.missing = {
+            name: missing_value(dtype) for name, dtype in self.columns.items()
+        }
+        os.makedirs(directory, exist_ok=True)
+        self.chunks = self._read_index()
+
+    def _read_index(self) -> list[tuple[str, float, float, int]]:
+        chunks = []
+        path = os.path.join(self.directory, INDEX_FILE)
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    name, first, last, rows = line.split()
+                    chunks.append((name, float(first), float(last), int(rows)))
+        return chunks
+
+    def append(self, timestamp: float, values: dict[str, float]):
+        """Add one row, columns missing from values are stored as
+        missing_value() of their dtype"""
+        buffer = self.buffer
+        buffer["time"].append(timestamp)
+        for name, missing in self.missing.items():
+            if name != "time":
+                buffer[name].append(values.get(name, missing))
+        if len(buffer["time"]) >= self.chunksize:
+            self.flush()
+
+    def record(self, laser: Pulsed_Laser, timestamp: float | None = None):
+        """Add the latest telemetry stored on a Pulsed_Laser as one row
+        Telemetry in READING_COMMANDS that has not been read yet is missing"""
+        values = {}
+        for name in self.columns:
+            if name in READING_COMMANDS and laser.reading_times(name) is None:
+                continue
+            if hasattr(laser, name):
+                values[name] = getattr(laser, name)
+        for name, currents in (
+            ("diodecurrent", laser.diodecurrentvalues),
+            ("extendeddiodecurrent", laser.extendeddiodecurrentvalues),
+        ):
+            for stage, current in enumerate(currents):
+                values[f"{name}{stage}"] = current
+        self.append(time.time() if timestamp is None else timestamp, values)
+
+    def flush(self):
+        """Write the buffered rows as a new chunk
+        Every column is converted before anything is written, so a value
+        that does not fit its dtype raises with the rows still buffered.
+        The chunk is only indexed once all of its files are written"""
+        rows = len(self.buffer["time"])
+        if not rows:
+            return
+        arrays = {
+            column: np.asarray(self.buffer[column], dtype=dtype)
+            for column, dtype in self.columns.items()
+        }
+        name = f"{len(self.chunks):08d}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        for column, array in arrays.items():
+            np.save(os.path.join(path, column + ".npy"), array)
+        times = arrays["time"]
+        chunk = (name, float(times[0]), float(times[-1]), rows)
+        with open(os.path.join(self.directory, INDEX_FILE), "a") as file:
+            file.write(f"{chunk[0]} {chunk[1]!r} {chunk[2]!r} {chunk[3]}\n")
+        self.chunks.append(chunk)
+        self.buffer = {column: [] for column in self.columns}
+
+    def close(self):
+        """Write any buffered rows"""
+        self.flush()
+
+    def read_range(
+        self, start: float, end: float, columns: list[str] | None = None
+    ) -> dict[str, "np.ndarray"]:
+        """Return the rows with start <= time < end as one array per column
+        Only the chunks overlapping the range are opened, memory-mapped
+        Rows still buffered in memory are not included until flush()"""
+        columns = list(columns or self.columns)
+        parts = {column: [] for column in columns}
+        for name, first, last, _ in self.chunks:
+            if last < start or first >= end:
+                continue
+            path = os.path.join(self.directory, name)
+            times = np.load(os.path.join(path, "time.npy"), mmap_mode="r")
+            low = np.searchsorted(times, start, side="left")
+            high = np.searchsorted(times, end, side="left")
+            for column in columns:
+                data = np.load(os.path.join(path, column + ".npy"), mmap_mode="r")
+                parts[column].append(data[low:high])
+        return {
+            column: np.concatenate(parts[column])
+            if parts[column]
+            else np.empty(0, dtype=self.columns[column])
+            for column in columns
+        }
+
+    def export_parquet(self, path: str):
+        """Write every stored row to a Parquet file (requires pyarrow)"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("export_parquet requires pyarrow (pip install pyarrow)")
+        data = self.read_range(float("-inf"), float("inf"))
+        pq.write_table(pa.table({name: np.asarray(data[name]) for name in data}), path)
@@ -0,0 +1,161 @@
+"""Fault injection for the SPI G4 pulsed laser serial link.
+
+FaultyPort wraps a serial-like object, such as a pySerial port or a
+SimulatedPort, and injects faults into the link with these probabilities:
+
+    drop        the reply is lost, so the read times out empty
+    truncate    the reply is cut short and loses its CRLF
+    garbage     the reply is replaced by random bytes with the high bit set,
+                as received with the wrong baud rate or framing
+    errorcode   the reply is replaced by one of SPURIOUS_ERROR_CODES
+    wrongshape  the reply is replaced by one of WRONG_SHAPE_REPLIES, printable
+                ASCII that is not in the format of most commands
+    disconnect  the write raises serial.SerialException
+
+Every reply is also delayed by up to jitter seconds. The faults are drawn
+from random.Random(seed), so the same seed and commands give the same run:
+
+    laser.serialconn.serial = FaultyPort(SimulatedPort(), seed=1, drop=0.01)
+    report = run_faults(laser, 10000)
+    report.exceptions  # should be empty
+
+run_faults() counts the errors and exceptions of the laser methods in
+SOAK_COMMANDS and the commands sent per second under the faults.
+"""
+
+import random
+import time
+from dataclasses import dataclass, field
+
+import serial
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, is_error
+from SPI_G4_Pulsed_Fibre_Laser_soak import SOAK_COMMANDS
+
+# Replies injected by errorcode faults, E99 is not a G4 error code
+SPURIOUS_ERROR_CODES = ("E10", "E20", "E21", "E25", "E99")
+# Replies injected by wrongshape faults: a bare CRLF, an echoed command and
+# the replies of other commands
+WRONG_SHAPE_REPLIES = ("", "QT", "36.5", "0050000", "10000, 15000", "1, 0, 1")
+FAULTS = ("drop", "truncate", "garbage", "errorcode", "wrongshape", "disconnect")
+GARBAGE_LENGTH = 16  # Longest garbage reply, in bytes
+
+
+class FaultyPort:
+    """Serial-like object that passes writes and reads to port and injects
+    faults with the given probabilities
+    faults counts each fault injected, by name"""
+
+    def __init__(
+        self,
+        port,
+        seed: int | None = None,
+        jitter: float = 0.0,
+        drop: float = 0.0,
+        truncate: float = 0.0,
+        garbage: float = 0.0,
+        errorcode: float = 0.0,
+        wrongshape: float = 0.0,
+        disconnect: float = 0.0,
+    ):
+        self.port = port
+        self.random = random.Random(seed)
+        self.jitter = jitter
+        self.drop = drop
+        self.truncate = truncate
+        self.garbage = garbage
+        self.errorcode = errorcode
+        self.wrongshape = wrongshape
+        self.disconnect = disconnect
+        self.faults = dict.fromkeys(FAULTS, 0)
+
+    def _inject(self, fault: str) -> bool:
+        probability = getattr(self, fault)
+        if probability and self.random.random() < probability:
+            self.faults[fault] += 1
+            return True
+        return False
+
+    @property
+    def is_open(self) -> bool:
+        return self.port.is_open
+
+    @property
+    def timeout(self) -> float:
+        return self.port.timeout
+
+    @timeout.setter
+    def timeout(self, timeout: float):
+        self.port.timeout = timeout
+
+    def write(self, data: bytes) -> int:
+        if self._inject("disconnect"):
+            raise serial.SerialException("Injected disconnect")
+        return self.port.write(data)
+
+    def read_until(self, expected: bytes = b"\n", size: int | None = None) -> bytes:
+        reply = self.port.read_until(expected, size)
+        if self.jitter:
+            time.sleep(self.random.uniform(0.0, self.jitter))
+        if not reply:
+            return reply
+        if self._inject("drop"):
+            return b""
+        if self._inject("truncate"):
+            return reply[: self.random.randrange(max(1, len(reply) - 1))]
+        if self._inject("garbage"):
+            length = self.random.randint(1, GARBAGE_LENGTH)
+            noise = bytes(self.random.randrange(0x80, 0x100) for _ in range(length))
+            return noise + expected
+        if self._inject("errorcode"):
+            # The laser sends an E-code instead of the whole reply
+            self.port.reset_input_buffer()
+            return bytes(self.random.choice(SPURIOUS_ERROR_CODES), "utf-8") + expected
+        if self._inject("wrongshape"):
+            return bytes(self.random.choice(WRONG_SHAPE_REPLIES), "utf-8") + expected
+        return reply
+
+    def reset_input_buffer(self):
+        self.port.reset_input_buffer()
+
+    def close(self):
+        self.port.close()
+
+
+@dataclass
+class FaultReport:
+    """Outcome of run_faults()
+    exceptions counts the exceptions raised by the laser methods, by type"""
+
+    commands: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    exceptions: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def rate(self) -> float:
+        """Commands per second"""
+        return self.commands / self.seconds if self.seconds else 0.0
+
+
+def run_faults(
+    laser: Pulsed_Laser, count: int, commands: dict[str, tuple] = SOAK_COMMANDS
+) -> FaultReport:
+    """Call the laser methods in commands in turn until count have been
+    called, and report how they failed"""
+    report = FaultReport()
+    calls = list(commands.items())
+    start = time.perf_counter()
+    for index in range(count):
+        name, args = calls[index % len(calls)]
+        try:
+            result = getattr(laser, name)(*args)
+        # Counting whatever the methods raise is the point of the run
+        except Exception as error:  # noqa: BLE001
+            kind = type(error).__name__
+            report.exceptions[kind] = report.exceptions.get(kind, 0) + 1
+        else:
+            if is_error(result):
+                report.errors += 1
+        report.commands += 1
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,120 @@
+"""Synchronised parameter changes across several SPI G4 pulsed lasers.
+
+Waveform, PRF and pulse parameter changes only take effect when 'SS 1' is
+sent, so a change can be made on several lasers in two phases (the active
+current takes effect as soon as it is set, so it cannot be staged):
+
+1) stage_parameters() sends the set commands to every laser concurrently
+2) commit_parameters() releases one thread per laser from a barrier at the
+   same moment to send 'SS 1', and reports the skew of each laser from the
+   estimated time it took the command
+
+synchronised_commit() runs both, and only commits if every laser staged.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, ReplyTimes
+
+# Parameters that can be staged, the set commands in COMMIT_CODES, in the
+# order they are sent
+# Pulsed_Laser attribute: set method
+STAGED_SETTERS = {
+    "waveform": "set_waveform",
+    "prf": "set_prf",
+    "pulseburstlength": "set_pulse_burst_length",
+    "pumpduty": "set_pump_duty",
+}
+
+
+def _stage(laser: Pulsed_Laser, settings: dict[str, int]) -> None | str:
+    for name, method in STAGED_SETTERS.items():
+        if name in settings:
+            error = getattr(laser, method)(settings[name])
+            if error is not None:
+                return f"{method}: {error}"
+    return None
+
+
+def stage_parameters(
+    lasers: list[Pulsed_Laser], settings: dict[str, int] | list[dict[str, int]]
+) -> list[None | str]:
+    """Send set commands to every laser concurrently, without committing
+    settings maps Pulsed_Laser attribute names in STAGED_SETTERS to values,
+    either one dict for all lasers or a list with one dict per laser
+    Returns the first error of each laser, or None if it staged"""
+    if isinstance(settings, dict):
+        settings = [settings] * len(lasers)
+    if len(settings) != len(lasers):
+        raise ValueError("settings must have one dict per laser")
+    for laser_settings in settings:
+        for name in laser_settings:
+            if name not in STAGED_SETTERS:
+                raise ValueError(f"{name} cannot be staged")
+    with ThreadPoolExecutor(max_workers=max(1, len(lasers))) as executor:
+        return list(executor.map(_stage, lasers, settings))
+
+
+def commit_parameters(
+    lasers: list[Pulsed_Laser],
+) -> list[tuple[None | str, float | None]]:
+    """Send 'SS 1' to every laser at the same moment
+    One thread per laser waits on a barrier, so all are released together
+    Returns (error or None, skew) per laser, where skew is the time (s)
+    between the earliest laser taking 'SS 1' and this laser taking it.
+    Only lasers that took 'SS 1' are compared, the others have a skew of
+    None.
+    That is the sample time of the reply (see ReplyTimes), or the middle of
+    the write and read if the connection does not record reply times"""
+    count = len(lasers)
+    if not count:
+        return []
+    barrier = threading.Barrier(count)
+    taken = [0] * count
+    errors = [None] * count
+
+    def commit(index: int):
+        serialconn = lasers[index].serialconn
+        replytimes = getattr(serialconn, "replytimes", None)
+        if not isinstance(replytimes, dict):
+            replytimes = {}
+        previous = replytimes.get("SS")
+        barrier.wait()
+        start = time.monotonic_ns()
+        errors[index] = lasers[index].set_status_word(1)
+        end = time.monotonic_ns()
+        times = replytimes.get("SS")
+        if isinstance(times, ReplyTimes) and times is not previous:
+            taken[index] = times.sample
+        else:
+            taken[index] = (start + end) // 2
+
+    threads = [
+        threading.Thread(target=commit, args=(index,)) for index in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    committed = [sample for error, sample in zip(errors, taken) if error is None]
+    if not committed:
+        return [(error, None) for error in errors]
+    first = min(committed)
+    return [
+        (error, None if error is not None else (sample - first) / 1e9)
+        for error, sample in zip(errors, taken)
+    ]
+
+
+def synchronised_commit(
+    lasers: list[Pulsed_Laser], settings: dict[str, int] | list[dict[str, int]]
+) -> list[tuple[None | str, float | None]]:
+    """Stage settings on every laser, then commit them all together
+    If any laser fails to stage, nothing is committed and each laser reports
+    its staging error (or None) with a skew of None"""
+    errors = stage_parameters(lasers, settings)
+    if any(error is not None for error in errors):
+        return [(error, None) for error in errors]
+    return commit_parameters(lasers)
@@ -0,0 +1,159 @@
+"""Output power calibration of the SPI G4 pulsed laser.
+
+The active current (SI, 0-1000) sets the output power, but the power it
+gives depends on the waveform and PRF. PowerCalibration holds measured
+(waveform, PRF, active current) -> power (W) points and interpolates them:
+
+    along the active current, linearly between the points measured at a PRF
+    along the PRF, linearly between the two nearest measured PRFs, and
+    clamped to the lowest or highest PRF measured
+
+Waveforms are never interpolated between, each one needs its own points.
+The curve of each (waveform, PRF) is built once and cached, so lookups after
+the first only search a short list.
+
+Attach a calibration to a Pulsed_Laser to set the power in watts:
+
+    laser.powercalibration = load_calibration("calibration.csv")
+    laser.set_power(12.5)
+    laser.estimate_power()
+
+CSV files have a header line and the columns waveform, prf, current, power.
+"""
+
+import bisect
+import csv
+import os
+
+CURVE_CACHE_SIZE = 256  # (waveform, PRF) curves kept by each calibration
+CSV_COLUMNS = ("waveform", "prf", "current", "power")
+
+# Calibrations loaded by load_calibration(), path: (mtime, PowerCalibration)
+_loaded = {}
+
+
+class PowerCalibration:
+    """Measured output power of one laser against waveform, PRF and current"""
+
+    def __init__(self):
+        self.points = {}  # waveform: {prf: {current: power}}
+        self._curves = {}  # (waveform, prf): (currents, powers)
+
+    def add_measurement(self, waveform: int, prf: int, current: int, power: float):
+        """Add a measured power (W), replacing any earlier one at the same point"""
+        self.points.setdefault(waveform, {}).setdefault(prf, {})[current] = power
+        self._curves = {
+            key: curve for key, curve in self._curves.items() if key[0] != waveform
+        }
+
+    def curve(self, waveform: int, prf: int) -> tuple[list[int], list[float]]:
+        """Return the active currents and powers of the curve at a waveform
+        and PRF, sorted by current"""
+        key = (waveform, prf)
+        curve = self._curves.get(key)
+        if curve is None:
+            curve = self._build_curve(waveform, prf)
+            if len(self._curves) >= CURVE_CACHE_SIZE:
+                self._curves.clear()
+            self._curves[key] = curve
+        return curve
+
+    def _build_curve(self, waveform: int, prf: int) -> tuple[list[int], list[float]]:
+        byprf = self.points.get(waveform)
+        if not byprf:
+            raise ValueError(f"Waveform {waveform} is not calibrated")
+        prfs = sorted(byprf)
+        if prf <= prfs[0]:
+            return self._points_curve(byprf[prfs[0]])
+        if prf >= prfs[-1]:
+            return self._points_curve(byprf[prfs[-1]])
+        index = bisect.bisect_left(prfs, prf)
+        if prfs[index] == prf:
+            return self._points_curve(byprf[prf])
+        low, high = prfs[index - 1], prfs[index]
+        weight = (prf - low) / (high - low)
+        currents = sorted(set(byprf[low]) | set(byprf[high]))
+        lowcurve = self._points_curve(byprf[low])
+        highcurve = self._points_curve(byprf[high])
+        powers = [
+            (1 - weight) * _interpolate(*lowcurve, current)
+            + weight * _interpolate(*highcurve, current)
+            for current in currents
+        ]
+        return currents, powers
+
+    @staticmethod
+    def _points_curve(measured: dict[int, float]) -> tuple[list[int], list[float]]:
+        currents = sorted(measured)
+        return currents, [measured[current] for current in currents]
+
+    def power(self, waveform: int, prf: int, current: int) -> float:
+        """Return the output power (W) at an active current"""
+        return _interpolate(*self.curve(waveform, prf), current)
+
+    def current_for_power(self, waveform: int, prf: int, power: float) -> int:
+        """Return the lowest active current that gives an output power (W)
+        Raises ValueError if the power is outside the calibrated range"""
+        currents, powers = self.curve(waveform, prf)
+        if not powers[0] <= power <= max(powers):
+            raise ValueError(
+                f"{power} W is outside the calibrated range "
+                f"{powers[0]}-{max(powers)} W"
+            )
+        for index in range(1, len(currents)):
+            if powers[index] >= power:
+                low, high = powers[index - 1], powers[index]
+                fraction = (power - low) / (high - low) if high != low else 0.0
+                span = currents[index] - currents[index - 1]
+                return round(currents[index - 1] + fraction * span)
+        return currents[0]
+
+    @classmethod
+    def from_csv(cls, path: str) -> "PowerCalibration":
+        """Read a calibration from a CSV file with CSV_COLUMNS"""
+        calibration = cls()
+        with open(path, newline="") as file:
+            for row in csv.DictReader(file):
+                calibration.add_measurement(
+                    int(row["waveform"]),
+                    int(row["prf"]),
+                    int(row["current"]),
+                    float(row["power"]),
+                )
+        return calibration
+
+    def to_csv(self, path: str):
+        """Write the calibration to a CSV file with CSV_COLUMNS"""
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_COLUMNS)
+            for waveform in sorted(self.points):
+                byprf = self.points[waveform]
+                for prf in sorted(byprf):
+                    for current in sorted(byprf[prf]):
+                        writer.writerow((waveform, prf, current, byprf[prf][current]))
+
+
+def _interpolate(currents: list[int], powers: list[float], current: float) -> float:
+    """Linearly interpolate a sorted curve, clamped to its ends"""
+    index = bisect.bisect_left(currents, current)
+    if index == 0:
+        return powers[0]
+    if index == len(currents):
+        return powers[-1]
+    low, high = currents[index - 1], currents[index]
+    fraction = (current - low) / (high - low)
+    return powers[index - 1] + fraction * (powers[index] - powers[index - 1])
+
+
+def load_calibration(path: str) -> PowerCalibration:
+    """Return the calibration in a CSV file
+    The file is only read again when its modification time changes, so the
+    curves already built are reused between jobs"""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    calibration = PowerCalibration.from_csv(path)
+    _loaded[path] = (mtime, calibration)
+    return calibration
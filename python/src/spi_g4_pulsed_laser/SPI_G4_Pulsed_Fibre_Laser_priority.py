@@ -0,0 +1,165 @@
+"""Priority aware command dispatcher for the SPI G4 pulsed laser.
+
+The RS232 link is simplex, so every command waits for the one in front of it.
+PriorityDispatcher sits in front of a Pulsed_Laser_Serial object and sends
+queued commands in priority order, so a safety command such as disabling
+emission is never stuck behind a queue of telemetry reads.
+
+It has the same send_set_command/send_get_command interface as
+Pulsed_Laser_Serial, and every other attribute is read from the wrapped
+connection, so it can replace the connection of a Pulsed_Laser:
+
+    laser.serialconn = PriorityDispatcher(laser.serialconn)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+# Priority classes, lower numbers are sent first
+SAFETY = 0
+CONTROL = 1
+TELEMETRY = 2
+
+PRIORITY_NAMES = {SAFETY: "safety", CONTROL: "control", TELEMETRY: "telemetry"}
+
+# Commands that stop emission: clear "Laser is On" and "Start Pulses"
+SAFETY_COMMANDS = frozenset({"SC 0", "SC 1"})
+
+CANCELLED = "Error: Cancelled for a higher priority command"
+
+
+def command_priority(command: str) -> int:
+    """Return the priority class of a command
+    Emission stop commands are SAFETY, other "set" (S..) commands are CONTROL
+    and everything else (get, query and read commands) is TELEMETRY"""
+    if command in SAFETY_COMMANDS:
+        return SAFETY
+    if command[:1] == "S":
+        return CONTROL
+    return TELEMETRY
+
+
+class PriorityDispatcher:
+    """Send commands to the laser in priority order from a single worker thread
+
+    When a SAFETY or CONTROL command is queued, any TELEMETRY reads still
+    waiting in the queue are cancelled (if cancel_telemetry is True) and
+    complete with (False, CANCELLED). The time each command spent queued is
+    recorded per priority class, see get_queue_delays().
+    The command already on the wire is never interrupted, so the worst case
+    delay of a safety command is one transaction.
+    """
+
+    def __init__(self, serialconn, cancel_telemetry: bool = True):
+        self.serialconn = serialconn
+        self.cancel_telemetry = cancel_telemetry
+        self.queuedelays = {
+            name: {"count": 0, "total": 0.0, "max": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(
+        self, command: str, priority: int | None = None, lines: int = 1
+    ) -> Future:
+        """Queue a command and return a Future for its (success, result)
+        The priority class is worked out from the command if not given
+        lines is the number of lines in the reply"""
+        if priority is None:
+            priority = command_priority(command)
+        future = Future()
+        with self._condition:
+            if self._closed:
+                future.set_result((False, "Error: Dispatcher is closed"))
+                return future
+            if priority < TELEMETRY and self.cancel_telemetry:
+                self._cancel_telemetry()
+            heapq.heappush(
+                self._queue,
+                (
+                    priority,
+                    next(self._counter),
+                    command,
+                    lines,
+                    future,
+                    time.perf_counter(),
+                ),
+            )
+            self._condition.notify()
+        return future
+
+    def _cancel_telemetry(self):
+        """Complete every queued TELEMETRY command with CANCELLED
+        Must be called with the condition held"""
+        kept = []
+        for entry in self._queue:
+            if entry[0] == TELEMETRY:
+                entry[4].set_result((False, CANCELLED))
+            else:
+                kept.append(entry)
+        if len(kept) != len(self._queue):
+            heapq.heapify(kept)
+            self._queue = kept
+
+    def send_set_command(self, setcommand: str) -> tuple[bool, str]:
+        """Queue a "set" command and wait for the result"""
+        return self.submit(setcommand).result()
+
+    def send_get_command(self, getcommand: str, lines: int = 1) -> tuple[bool, str]:
+        """Queue a "get" command and wait for the result"""
+        return self.submit(getcommand, lines=lines).result()
+
+    def send_command(self, command: str, lines: int = 1) -> tuple[bool, str]:
+        """Queue a command and wait for the result"""
+        return self.submit(command, lines=lines).result()
+
+    def __getattr__(self, name: str):
+        return getattr(self.serialconn, name)
+
+    def get_queue_delays(self) -> dict[str, dict[str, float]]:
+        """Return the count, mean and max queueing delay (s) per class"""
+        with self._condition:
+            return {
+                name: {
+                    "count": stats["count"],
+                    "mean": stats["total"] / stats["count"] if stats["count"] else 0.0,
+                    "max": stats["max"],
+                }
+                for name, stats in self.queuedelays.items()
+            }
+
+    def close_connection(self):
+        """Stop the worker once the queue is empty and close the connection"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+        self.serialconn.close_connection()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                priority, _, command, lines, future, queued = heapq.heappop(
+                    self._queue
+                )
+                delay = time.perf_counter() - queued
+                stats = self.queuedelays[PRIORITY_NAMES[priority]]
+                stats["count"] += 1
+                stats["total"] += delay
+                stats["max"] = max(stats["max"], delay)
+            try:
+                future.set_result(self.serialconn.send_command(command, lines))
+            except Exception as error:  # noqa: BLE001 - raised by future.result()
+                future.set_exception(error)
@@ -0,0 +1,351 @@
+"""Run the SPI G4 pulsed laser I/O in a separate process.
+
+In a process busy with CPU heavy Python work, a polling thread waits for the
+GIL and replies time out. LaserProcess moves the Pulsed_Laser and its serial
+port into a child process that does nothing but talk to the laser:
+
+    child process                              other local processes
+    ---------------------------------          ----------------------------
+    poll telemetry every interval       --->   shared memory state block
+    send requested commands             <-->   request and reply queues
+
+The latest state is published to a multiprocessing.shared_memory block, so
+any local process can read it with StateReader(name) without a system call.
+The block is a sequence number followed by the STATE_FIELDS values. The
+writer makes the sequence number odd while it writes and even once done,
+and a reader retries until it reads the same even number before and after
+the values (a seqlock), so it never sees half an update.
+
+Commands go through a queue to the child and their return values come back
+through another:
+
+    process = LaserProcess("/dev/ttyUSB0")
+    process.start()
+    process.call("set_prf", 50000)
+    process.read_state()["lasertemp"]
+    process.stop()
+
+laser_factory is called in the child to create the laser, so it must be
+picklable, such as a class or a module level function.
+"""
+
+import itertools
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, is_error
+from SPI_G4_Pulsed_Fibre_Laser_async import MONITORING_BITS
+
+# Queries sent by the child every poll interval
+POLL_METHODS = (
+    "query_laser_temp",
+    "query_beam_delivery_temp",
+    "query_active_diode_currents",
+    "query_extended_diode_currents",
+    "query_status_word_int",
+    "query_monitoring_states",
+    "query_ext_prf",
+)
+
+# State block values, name: struct format
+# Diode stages that are not present are -1, monitoring holds MONITORING_BITS
+# as bits 0-7, updated is the time.monotonic() of the last poll
+STATE_FIELDS = {
+    "updated": "d",
+    "polls": "Q",
+    "errors": "Q",
+    "lasertemp": "d",
+    "beamdeliverytemp": "d",
+    "diodecurrent0": "i",
+    "diodecurrent1": "i",
+    "extendeddiodecurrent0": "i",
+    "extendeddiodecurrent1": "i",
+    "extendeddiodecurrent2": "i",
+    "extendeddiodecurrent3": "i",
+    "statuswordint": "I",
+    "monitoring": "I",
+    "extprf": "I",
+    "controlmode": "I",
+    "simmer": "I",
+    "activecurrent": "I",
+    "waveform": "I",
+    "prf": "I",
+    "pulseburstlength": "I",
+    "pumpduty": "I",
+}
+
+SEQUENCE = struct.Struct("<Q")
+STATE = struct.Struct("<" + "".join(STATE_FIELDS.values()))
+STATE_SIZE = SEQUENCE.size + STATE.size
+
+CLOSED = "Error: Laser process is not running"
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing state block without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13 attaching registers the block with this process's
+    # resource tracker, which unlinks it when the process exits. A process
+    # that has not started a tracker yet is not the owner, so unregister it
+    tracker = resource_tracker._resource_tracker
+    owned = getattr(tracker, "_fd", None) is not None
+    block = shared_memory.SharedMemory(name=name)
+    if not owned:
+        resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def read_block(buffer) -> dict[str, float]:
+    """Read a consistent copy of the state in a state block buffer"""
+    attempts = 0
+    while True:
+        before = SEQUENCE.unpack_from(buffer)[0]
+        if not before & 1:
+            values = STATE.unpack_from(buffer, SEQUENCE.size)
+            if SEQUENCE.unpack_from(buffer)[0] == before:
+                return dict(zip(STATE_FIELDS, values))
+        attempts += 1
+        if attempts % 100 == 0:
+            time.sleep(0)
+
+
+def write_block(buffer, values: tuple):
+    """Publish STATE_FIELDS values to a state block buffer, single writer only"""
+    sequence = SEQUENCE.unpack_from(buffer)[0]
+    SEQUENCE.pack_into(buffer, 0, sequence + 1)
+    STATE.pack_into(buffer, SEQUENCE.size, *values)
+    SEQUENCE.pack_into(buffer, 0, sequence + 2)
+
+
+def laser_state(laser: Pulsed_Laser, polls: int, errors: int) -> tuple:
+    """Return the STATE_FIELDS values of a laser, in order"""
+    diodes = list(laser.diodecurrentvalues[:2])
+    diodes += [-1] * (2 - len(diodes))
+    extended = list(laser.extendeddiodecurrentvalues[:4])
+    extended += [-1] * (4 - len(extended))
+    monitoring = 0
+    for bit, name in enumerate(MONITORING_BITS):
+        if getattr(laser, name):
+            monitoring |= 1 << bit
+    return (
+        time.monotonic(),
+        polls,
+        errors,
+        float(laser.lasertemp),
+        float(laser.beamdeliverytemp),
+        *diodes,
+        *extended,
+        laser.statuswordint,
+        monitoring,
+        laser.extprf,
+        laser.controlmode,
+        laser.simmer,
+        laser.activecurrent,
+        laser.waveform,
+        laser.prf,
+        laser.pulseburstlength,
+        laser.pumpduty,
+    )
+
+
+def _serve(laser_factory, port, connection, name, requests, replies, methods, interval):
+    """Main loop of the child process"""
+    block = _attach(name)
+    laser = laser_factory()
+    try:
+        laser.create_serial_connection(port, **connection)
+    # Any failure to connect is returned by LaserProcess.start()
+    except Exception as error:  # noqa: BLE001
+        replies.put(("ready", f"Error: {error}"))
+        block.close()
+        return
+    replies.put(("ready", None))
+    polls = 0
+    errors = 0
+    due = time.monotonic()
+    try:
+        while True:
+            # Poll whenever one is due, so a steady stream of requests cannot
+            # hold the state block back
+            if time.monotonic() >= due:
+                for method in methods:
+                    try:
+                        failed = is_error(getattr(laser, method)())
+                    # A query that raises counts as an error, the child keeps
+                    # polling and serving requests
+                    except Exception:  # noqa: BLE001
+                        failed = True
+                    if failed:
+                        errors += 1
+                polls += 1
+                write_block(block.buf, laser_state(laser, polls, errors))
+                due = max(due + interval, time.monotonic())
+            try:
+                request = requests.get(timeout=max(0.0, due - time.monotonic()))
+            except queue.Empty:
+                continue
+            if request is None:
+                break
+            ident, method, args = request
+            try:
+                replies.put((ident, getattr(laser, method)(*args), None))
+            except Exception as error:  # noqa: BLE001 - raised by call()
+                replies.put((ident, None, error))
+    finally:
+        laser.close_serial()
+        block.close()
+        replies.put(None)
+
+
+class LaserProcess:
+    """A Pulsed_Laser running in a child process
+
+    connection holds keyword arguments for create_serial_connection().
+    The child polls methods every interval seconds and publishes the state
+    block, and runs requested methods in between polls. The block only
+    changes on a poll, so settings made by requests appear with the next one.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        laser_factory=Pulsed_Laser,
+        methods: tuple[str, ...] = POLL_METHODS,
+        interval: float = 0.1,
+        **connection,
+    ):
+        self.port = port
+        self.laser_factory = laser_factory
+        self.methods = tuple(methods)
+        self.interval = interval
+        self.connection = connection
+        self.block = None
+        self.process = None
+        self._requests = None
+        self._replies = None
+        self._futures = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._receiver = None
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory state block, for StateReader"""
+        return self.block.name
+
+    def start(self) -> None | str:
+        """Start the child process and connect to the laser
+        Returns the connection error, or None once the child is ready"""
+        context = multiprocessing.get_context("spawn")
+        self.block = shared_memory.SharedMemory(create=True, size=STATE_SIZE)
+        self.block.buf[:STATE_SIZE] = bytes(STATE_SIZE)
+        self._requests = context.Queue()
+        self._replies = context.Queue()
+        self.process = context.Process(
+            target=_serve,
+            args=(
+                self.laser_factory,
+                self.port,
+                self.connection,
+                self.block.name,
+                self._requests,
+                self._replies,
+                self.methods,
+                self.interval,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        ready = self._get_reply(self.process)
+        error = CLOSED if ready is None else ready[1]
+        if error is not None:
+            self.process.join()
+            self._release()
+            return error
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+        return None
+
+    def _get_reply(self, process):
+        """Return the next reply, or None once the child has exited"""
+        while True:
+            try:
+                return self._replies.get(timeout=0.5)
+            except queue.Empty:
+                if not process.is_alive():
+                    return None
+
+    def _receive(self):
+        process = self.process
+        while True:
+            reply = self._get_reply(process)
+            if reply is None:
+                break
+            ident, result, error = reply
+            with self._lock:
+                future = self._futures.pop(ident)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_result(CLOSED)
+
+    def submit(self, method: str, *args) -> Future:
+        """Queue a call of a Pulsed_Laser method in the child process
+        Returns a Future for its return value"""
+        future = Future()
+        with self._lock:
+            if self._receiver is None or not self._receiver.is_alive():
+                future.set_result(CLOSED)
+                return future
+            ident = next(self._counter)
+            self._futures[ident] = future
+        self._requests.put((ident, method, args))
+        return future
+
+    def call(self, method: str, *args):
+        """Call a Pulsed_Laser method in the child process and wait for it"""
+        return self.submit(method, *args).result()
+
+    def read_state(self) -> dict[str, float]:
+        """Return the latest state published by the child"""
+        return read_block(self.block.buf)
+
+    def stop(self):
+        """Finish queued requests, stop the child and free the state block"""
+        if self.process is None:
+            return
+        self._requests.put(None)
+        self._receiver.join()
+        self.process.join()
+        self._release()
+
+    def _release(self):
+        self.process = None
+        self.block.close()
+        self.block.unlink()
+
+
+class StateReader:
+    """Read the state block of a LaserProcess from any local process"""
+
+    def __init__(self, name: str):
+        self.block = _attach(name)
+
+    def read(self) -> dict[str, float]:
+        """Return the latest state published by the laser process"""
+        return read_block(self.block.buf)
+
+    def close(self):
+        self.block.close()
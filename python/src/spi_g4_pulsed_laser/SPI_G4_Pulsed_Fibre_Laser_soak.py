@@ -0,0 +1,425 @@
+"""Soak and memory-leak harness for the SPI G4 pulsed laser library.
+
+SimulatedLaser answers the G4 RS232 commands on a local TCP port, so a
+Pulsed_Laser can be connected to it with a "socket://" URL and driven at the
+full command rate without hardware. SimulatedPort connects to it in memory
+instead, for measuring the library without any transport.
+
+run_soak() drives a Pulsed_Laser and an AsyncPulsedLaser against a simulated
+laser for the given duration. Every interval it samples:
+
+    memory    Python memory traced by tracemalloc (bytes)
+    rss       resident set size of the process (bytes)
+    threads   number of live threads
+    latency   mean command round trip time over the interval (s)
+
+The first sample is the baseline. The soak stops and fails as soon as memory,
+rss or threads grow by more than their limit, or latency rises above its
+limit times the baseline. On a memory failure the allocation sites that grew
+the most are reported.
+
+    python SPI_G4_Pulsed_Fibre_Laser_soak.py --duration 28800
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser_async import AsyncPulsedLaser
+
+# Replies of the simulated laser to get, query and read commands
+SIMULATED_REPLIES = {
+    "GM": "0",
+    "GH": "010",
+    "GI": "0500",
+    "GW": "0",
+    "GR": "0050000",
+    "GL": "0000000",
+    "GF": "0100",
+    "QA": "80",
+    "QD": "00000000",
+    "QT": "36.5",
+    "QU": "31.2",
+    "QI": "10000, 15000",
+    "QH": "000100",
+    "QR": "0000000",
+    "QJ": "01000, 20000, 00030, (12032)",
+    "RSN": "123456",
+    "RPN": "SP-040P-A-EP-Z-F-Y(IP)",
+    "RQV": "FPGA HW Rev: 8.0.1\r\n"
+    "NIOS-II FW Rev: 8.0.1\r\n"
+    "Stellaris FW Rev: 0.0.1.1\r\n"
+    "IP Config: 192.168.0.50 DHCP\r\n"
+    "Driver FW Rev: 1.0",
+}
+
+# Writable status word bits, in the order they are reported by GS
+STATUS_WORD_BITS = (0, 1, 3, 4, 8, 9)
+
+# Pulsed_Laser methods sent by the soak each round, method: arguments
+SOAK_COMMANDS = {
+    "set_prf": (50000,),
+    "get_prf": (),
+    "set_active_current": (500,),
+    "get_active_current": (),
+    "get_status_word": (),
+    "query_status_word_int": (),
+    "query_monitoring_states": (),
+    "query_laser_temp": (),
+    "query_beam_delivery_temp": (),
+    "query_active_diode_currents": (),
+    "query_extended_diode_currents": (),
+    "query_alarms": (),
+    "query_vendor_info": (),
+}
+
+# Default growth limits of run_soak(), see the module docstring
+SOAK_LIMITS = {
+    "memory": 1 << 20,  # bytes
+    "rss": 16 << 20,  # bytes
+    "threads": 0,
+    "latency": 3.0,  # multiple of the baseline
+}
+
+
+class SimulatedLaser:
+    """Local TCP stand-in for an SPI G4 laser
+    Set commands are stored and read back by the matching get command, the
+    status word follows SS and SC. Unknown commands reply "E10"
+    latency (s) is waited before each reply"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.replies = dict(SIMULATED_REPLIES)
+        self.statusword = dict.fromkeys(STATUS_WORD_BITS, 0)
+        self.commands = 0
+        self.server = None
+        self.connections = []
+
+    @property
+    def url(self) -> str:
+        """URL to pass to create_serial_connection()"""
+        host, port = self.server.getsockname()[:2]
+        return f"socket://{host}:{port}"
+
+    def reply(self, command: str) -> str:
+        """Return the reply of the laser to a command, without the CRLF"""
+        self.commands += 1
+        code, _, value = command.partition(" ")
+        if code in ("SS", "SC"):
+            bit = int(value)
+            if bit not in self.statusword:
+                return "E20"
+            self.statusword[bit] = int(code == "SS")
+            return value
+        if code[:1] == "S" and "G" + code[1:] in self.replies:
+            self.replies["G" + code[1:]] = value
+            return value
+        if code == "GS":
+            return ", ".join(str(self.statusword[bit]) for bit in STATUS_WORD_BITS)
+        if code == "QS":
+            word = sum(state << bit for bit, state in self.statusword.items())
+            return f"{word:05d}"
+        return self.replies.get(command, "E10")
+
+    def start(self):
+        """Start accepting connections on a free port of 127.0.0.1"""
+        self.server = socket.create_server(("127.0.0.1", 0))
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def stop(self):
+        """Close the server and every connection"""
+        self.server.close()
+        for conn in self.connections:
+            conn.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        buffer = b""
+        while True:
+            try:
+                data = conn.recv(1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while b"\r\n" in buffer:
+                line, buffer = buffer.split(b"\r\n", 1)
+                reply = self.reply(line.decode("utf-8"))
+                if self.latency:
+                    time.sleep(self.latency)
+                try:
+                    conn.sendall(bytes(reply + "\r\n", "utf-8"))
+                except OSError:
+                    return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class SimulatedPort:
+    """In-memory serial port wired to a SimulatedLaser, with no wire latency
+    Replaces the pySerial object of a connection:
+
+        laser.serialconn.serial = SimulatedPort()
+    """
+
+    def __init__(self, simulator: SimulatedLaser | None = None):
+        self.simulator = SimulatedLaser() if simulator is None else simulator
+        self.is_open = True
+        self.timeout = 1
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        for line in data.split(b"\r\n")[:-1]:
+            reply = self.simulator.reply(line.decode("utf-8"))
+            self.buffer += bytes(reply + "\r\n", "utf-8")
+        return len(data)
+
+    def read_until(self, expected: bytes = b"\n", size: int | None = None) -> bytes:
+        """Return up to and including expected, or everything left, as a
+        read that timed out would"""
+        end = self.buffer.find(expected)
+        end = len(self.buffer) if end < 0 else end + len(expected)
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def reset_input_buffer(self):
+        self.buffer.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+@dataclass(frozen=True)
+class SoakSample:
+    """Resource usage of the process at one point of a soak"""
+
+    elapsed: float  # s since the soak started
+    commands: int  # commands sent since the last sample
+    memory: int
+    rss: int
+    threads: int
+    latency: float
+
+
+@dataclass
+class SoakReport:
+    """Samples of a soak and the reasons it failed, if it did"""
+
+    samples: list[SoakSample] = field(default_factory=list)
+    failures: list[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+
+class _LatencyMeter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, latency: float):
+        with self.lock:
+            self.count += 1
+            self.total += latency
+
+    def take(self) -> tuple[int, float]:
+        """Return the count and mean latency since the last take()"""
+        with self.lock:
+            count, total = self.count, self.total
+            self.count, self.total = 0, 0.0
+        return count, total / count if count else 0.0
+
+
+def current_rss() -> int:
+    """Return the resident set size of this process (bytes)
+    Uses /proc where available, otherwise the peak RSS from getrusage, and
+    0 where neither exists"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _drive(url: str, stop: threading.Event, meter: _LatencyMeter):
+    laser = Pulsed_Laser()
+    laser.create_serial_connection(url)
+    try:
+        while not stop.is_set():
+            for name, args in SOAK_COMMANDS.items():
+                start = time.perf_counter()
+                getattr(laser, name)(*args)
+                meter.add(time.perf_counter() - start)
+    finally:
+        laser.close_serial()
+
+
+async def _drive_async(url: str, stop: threading.Event, meter: _LatencyMeter):
+    laser = AsyncPulsedLaser()
+    await laser.create_serial_connection(url)
+
+    async def timed(name: str, args: tuple):
+        start = time.perf_counter()
+        await getattr(laser, name)(*args)
+        meter.add(time.perf_counter() - start)
+
+    try:
+        while not stop.is_set():
+            await asyncio.gather(
+                *(timed(name, args) for name, args in SOAK_COMMANDS.items())
+            )
+    finally:
+        await laser.close_serial()
+
+
+def _check(
+    baseline: SoakSample, sample: SoakSample, limits: dict[str, float]
+) -> list[str]:
+    failures = []
+    for name in ("memory", "rss", "threads"):
+        growth = getattr(sample, name) - getattr(baseline, name)
+        if growth > limits[name]:
+            failures.append(f"{name} grew by {growth} (limit {limits[name]})")
+    if sample.latency > baseline.latency * limits["latency"]:
+        failures.append(
+            f"latency rose from {baseline.latency * 1e3:.3f} ms "
+            f"to {sample.latency * 1e3:.3f} ms"
+        )
+    return failures
+
+
+def run_soak(
+    duration: float,
+    interval: float = 60.0,
+    use_async: bool = True,
+    limits: dict[str, float] | None = None,
+    callback=None,
+) -> SoakReport:
+    """Drive the library against a SimulatedLaser for duration seconds
+    limits overrides entries of SOAK_LIMITS
+    callback(sample) is called with each SoakSample as it is taken
+    At least two samples are taken, the baseline and one to compare with it
+    Returns a SoakReport, the soak stops at the first failing sample"""
+    limits = {**SOAK_LIMITS, **(limits or {})}
+    report = SoakReport()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    stop = threading.Event()
+    meter = _LatencyMeter()
+    with SimulatedLaser() as simulator:
+        drivers = [
+            threading.Thread(
+                target=_drive, args=(simulator.url, stop, meter), name="soak-sync"
+            )
+        ]
+        if use_async:
+            drivers.append(
+                threading.Thread(
+                    target=asyncio.run,
+                    args=(_drive_async(simulator.url, stop, meter),),
+                    name="soak-async",
+                )
+            )
+        for driver in drivers:
+            driver.start()
+        start = time.monotonic()
+        baseline = None
+        try:
+            while True:
+                time.sleep(interval)
+                commands, latency = meter.take()
+                sample = SoakSample(
+                    elapsed=time.monotonic() - start,
+                    commands=commands,
+                    memory=tracemalloc.get_traced_memory()[0],
+                    rss=current_rss(),
+                    threads=threading.active_count(),
+                    latency=latency,
+                )
+                report.samples.append(sample)
+                if callback is not None:
+                    callback(sample)
+                report.failures = [
+                    f"{driver.name} stopped" for driver in drivers if not driver.is_alive()
+                ]
+                if baseline is None:
+                    baseline = sample
+                    snapshot = tracemalloc.take_snapshot()
+                    if report.failures:
+                        break
+                    continue
+                report.failures += _check(baseline, sample, limits)
+                if any(failure.startswith("memory") for failure in report.failures):
+                    growth = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                    report.failures += [str(stat) for stat in growth[:5]]
+                if report.failures or sample.elapsed >= duration:
+                    break
+        finally:
+            stop.set()
+            for driver in drivers:
+                driver.join()
+            if not tracing:
+                tracemalloc.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPI G4 laser library soak test")
+    parser.add_argument("--duration", type=float, default=3600.0, help="seconds")
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds")
+    parser.add_argument("--no-async", action="store_true")
+    arguments = parser.parse_args()
+
+    def show(sample: SoakSample):
+        print(
+            f"{sample.elapsed:10.0f} s  {sample.commands:8d} commands  "
+            f"memory {sample.memory:10d}  rss {sample.rss:10d}  "
+            f"threads {sample.threads:3d}  latency {sample.latency * 1e3:.3f} ms"
+        )
+
+    report = run_soak(
+        arguments.duration,
+        arguments.interval,
+        use_async=not arguments.no_async,
+        callback=show,
+    )
+    for failure in report.failures:
+        print(failure)
+    raise SystemExit(0 if report.passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Thread-safe client for sharing one SPI G4 pulsed laser between threads.
+
+Pulsed_Laser_Serial holds a lock for each write/read transaction, so any
+number of threads can call Pulsed_Laser methods without taking each other's
+replies. They still queue on the lock in whatever order the OS wakes them,
+so a GUI thread can wait behind a long run of polling reads.
+
+ThreadedPulsedLaser gives each calling thread its own request queue. One
+worker thread owns the connection and takes one request from each thread's
+queue in turn, so a thread waits for at most one transaction per other busy
+thread, however many requests those threads have queued:
+
+    client = ThreadedPulsedLaser(laser)
+    future = client.submit("query_laser_temp")   # never blocks
+    client.set_prf(50000)                        # blocks until sent
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+
+CLOSED = "Error: ThreadedPulsedLaser is closed"
+
+
+class ThreadedPulsedLaser:
+    """Send Pulsed_Laser method calls from several threads, round robin
+    between the threads that have requests queued
+
+    Methods of the laser can be called directly on the client, and block
+    until the request has been sent. Attributes are read from the laser.
+    """
+
+    def __init__(self, laser: Pulsed_Laser):
+        self.laser = laser
+        self._queues = {}  # Thread ident: deque of queued requests
+        self._ready = deque()  # Idents of threads with requests, in turn order
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, method: str, *args) -> Future:
+        """Queue a call of a Pulsed_Laser method from this thread's queue
+        Returns a Future for the return value of the method"""
+        func = getattr(self.laser, method)
+        future = Future()
+        ident = threading.get_ident()
+        with self._condition:
+            if self._closed:
+                future.set_result(CLOSED)
+                return future
+            queue = self._queues.get(ident)
+            if queue is None:
+                queue = self._queues[ident] = deque()
+                self._ready.append(ident)
+                self._condition.notify()
+            queue.append((func, args, future))
+        return future
+
+    def pending(self) -> dict[int, int]:
+        """Return the number of queued requests of each thread, by ident"""
+        with self._condition:
+            return {ident: len(queue) for ident, queue in self._queues.items()}
+
+    def __getattr__(self, name: str):
+        value = getattr(self.laser, name)
+        if not callable(value):
+            return value
+
+        def call(*args):
+            return self.submit(name, *args).result()
+
+        return call
+
+    def close(self):
+        """Stop the worker once every queue is empty
+        The laser connection is left open"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._ready and not self._closed:
+                    self._condition.wait()
+                if not self._ready:
+                    return
+                ident = self._ready.popleft()
+                queue = self._queues[ident]
+                func, args, future = queue.popleft()
+                if queue:
+                    self._ready.append(ident)
+                else:
+                    del self._queues[ident]
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except Exception as error:  # noqa: BLE001 - raised by future.result()
+                future.set_exception(error)
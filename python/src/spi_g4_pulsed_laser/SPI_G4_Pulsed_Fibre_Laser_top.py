@@ -0,0 +1,213 @@
+"""Live terminal monitor for SPI G4 pulsed lasers.
+
+    python SPI_G4_Pulsed_Fibre_Laser_top.py top --port /dev/ttyUSB0 --port /dev/ttyUSB1
+
+Each laser is polled by its own AsyncPulsedLaser.stream() and shown as a
+column of a table, with a row for each of ROWS. The table is drawn once.
+After that only the cells whose text has changed are rewritten, each after
+one ANSI cursor move, and each frame is a single write to the terminal. A
+frame where nothing changed writes nothing, so the monitor costs little more
+than the polling itself.
+"""
+
+import argparse
+import asyncio
+import sys
+
+import serial
+from SPI_G4_Pulsed_Fibre_Laser_async import (
+    MONITORING_BITS,
+    AsyncPulsedLaser,
+    TelemetrySnapshot,
+)
+
+# Stream fields polled for each laser
+TOP_FIELDS = (
+    "controlmode",
+    "statuswordint",
+    "monitoring",
+    "lasertemp",
+    "beamdeliverytemp",
+    "diodecurrents",
+    "alarms",
+)
+
+# Table rows below the header of port names, in the order of format_snapshot()
+ROWS = (
+    "Control mode",
+    "Status word",
+    "Monitoring",
+    "Laser temp",
+    "Beam delivery temp",
+    "Diode currents (mA)",
+    "Alarms",
+    "Latency",
+    "Errors",
+)
+
+# Status word bit: label, for the bits shown
+STATUS_BITS = {
+    0: "on",
+    1: "pulses",
+    3: "CW",
+    4: "ext-current",
+    8: "pilot",
+    9: "ext-trigger",
+}
+
+# Labels of MONITORING_BITS, in the same order
+MONITORING_LABELS = ("mon", "alarm", "ltemp", "bdtemp", "fault", "deact", "warn", "on")
+
+LABEL_WIDTH = 20
+COLUMN_WIDTH = 36
+
+
+def format_snapshot(snapshot: TelemetrySnapshot) -> tuple[str, ...]:
+    """Return the text of each of ROWS for a snapshot
+    A field that was not read is shown as "-" """
+    status = monitoring = temp = bdtemp = diodes = alarms = latency = "-"
+    if snapshot.statuswordint is not None:
+        word = snapshot.statuswordint
+        status = " ".join(
+            label for bit, label in STATUS_BITS.items() if word >> bit & 1
+        )
+        status = f"{word:05d} {status}"
+    if snapshot.monitoring is not None:
+        monitoring = " ".join(
+            label
+            for name, label in zip(MONITORING_BITS, MONITORING_LABELS)
+            if snapshot.monitoring[name]
+        )
+    if snapshot.lasertemp is not None:
+        temp = f"{snapshot.lasertemp:.1f} C"
+    if snapshot.beamdeliverytemp is not None:
+        bdtemp = f"{snapshot.beamdeliverytemp:.1f} C"
+    if snapshot.diodecurrents is not None:
+        diodes = ", ".join(map(str, snapshot.diodecurrents))
+    if snapshot.alarms is not None:
+        alarms = ", ".join(snapshot.alarms) or "none"
+    if snapshot.latency is not None:
+        latency = f"{snapshot.latency * 1e3:.2f} ms"
+    controlmode = "-" if snapshot.controlmode is None else str(snapshot.controlmode)
+    return (
+        controlmode,
+        status,
+        monitoring,
+        temp,
+        bdtemp,
+        diodes,
+        alarms,
+        latency,
+        ", ".join(snapshot.errors.values()),
+    )
+
+
+class Screen:
+    """A table of text cells on an ANSI terminal, one column per laser
+    update() queues the cells that changed and flush() writes them"""
+
+    def __init__(self, headers: list[str], out=sys.stdout):
+        self.headers = headers
+        self.out = out
+        self.cells = {}  # (row, column): text last written
+        self._pending = []
+
+    def _cell(self, row: int, column: int, text: str):
+        if self.cells.get((row, column)) == text:
+            return
+        self.cells[row, column] = text
+        x = LABEL_WIDTH + 2 + column * (COLUMN_WIDTH + 1)
+        self._pending.append(
+            f"\x1b[{row + 1};{x}H{text:<{COLUMN_WIDTH}.{COLUMN_WIDTH}}"
+        )
+
+    def draw(self):
+        """Clear the terminal and draw the labels and headers"""
+        self.cells.clear()
+        self._pending = ["\x1b[?25l\x1b[2J\x1b[H"]
+        for row, label in enumerate(ROWS, 1):
+            self._pending.append(f"\x1b[{row + 1};1H{label}")
+        for column, header in enumerate(self.headers):
+            self._cell(0, column, header)
+        self.flush()
+
+    def update(self, column: int, texts: tuple[str, ...]):
+        """Queue the cells of a column that changed"""
+        for row, text in enumerate(texts, 1):
+            self._cell(row, column, text)
+
+    def flush(self):
+        """Write the queued cells in one write"""
+        if self._pending:
+            self.out.write("".join(self._pending))
+            self.out.flush()
+            self._pending = []
+
+    def close(self):
+        """Move the cursor below the table and show it again"""
+        self.out.write(f"\x1b[{len(ROWS) + 2};1H\x1b[?25h\n")
+        self.out.flush()
+
+
+async def _watch(laser: AsyncPulsedLaser, screen: Screen, column: int, interval, frames):
+    shown = 0
+    async for snapshot in laser.stream(TOP_FIELDS, interval):
+        screen.update(column, format_snapshot(snapshot))
+        screen.flush()
+        shown += 1
+        if shown == frames:
+            break
+
+
+async def run_top(
+    ports: list[str],
+    interval: float = 1.0,
+    out=sys.stdout,
+    frames: int | None = None,
+    **connection,
+):
+    """Show the lasers on ports until cancelled
+    connection holds keyword arguments for create_serial_connection()
+    If frames is given, stop once each laser has shown that many snapshots"""
+    lasers = []
+    screen = Screen(list(ports), out)
+    try:
+        for port in ports:
+            laser = AsyncPulsedLaser()
+            await laser.create_serial_connection(port, **connection)
+            lasers.append(laser)
+        screen.draw()
+        await asyncio.gather(
+            *(
+                _watch(laser, screen, column, interval, frames)
+                for column, laser in enumerate(lasers)
+            )
+        )
+    finally:
+        if screen.cells:
+            screen.close()
+        for laser in lasers:
+            await laser.close_serial()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="spi-g4", description="SPI G4 laser tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    top = commands.add_parser("top", help="live monitor of one or more lasers")
+    top.add_argument(
+        "--port", action="append", required=True, help="serial port, repeatable"
+    )
+    top.add_argument("--interval", type=float, default=1.0, help="seconds")
+    arguments = parser.parse_args()
+
+    try:
+        asyncio.run(run_top(arguments.port, arguments.interval))
+    except KeyboardInterrupt:
+        pass
+    except serial.SerialException as error:
+        print(f"Error: {error}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Tracers for SPI G4 pulsed laser serial transactions.
+
+A tracer is attached to the connection of a Pulsed_Laser:
+
+    laser.serialconn.tracer = OpenTelemetryTracer(trace.get_tracer("laser"))
+
+OpenTelemetryTracer emits one span per command through any tracer with the
+OpenTelemetry start_span()/set_attribute()/end() interface, so the spans go
+to whatever exporter that tracer is configured with. RecordingTracer keeps
+the most recent spans in memory.
+"""
+
+import time
+from collections import deque
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser_Tracer
+
+
+class OpenTelemetryTracer(Pulsed_Laser_Tracer):
+    """Emit an OpenTelemetry style span for each laser command
+    Span attributes: laser.command, laser.command.code, laser.bytes_written,
+    laser.bytes_read, laser.success, laser.result and laser.error_code"""
+
+    def __init__(self, tracer, port: str | None = None):
+        self.tracer = tracer
+        self.port = port
+
+    def start_span(self, command: str, data: bytes) -> object:
+        code = command.split(" ", 1)[0]
+        attributes = {
+            "laser.command": command,
+            "laser.command.code": code,
+            "laser.bytes_written": len(data),
+        }
+        if self.port is not None:
+            attributes["laser.port"] = self.port
+        return self.tracer.start_span(f"G4 {code}", attributes=attributes)
+
+    def end_span(
+        self, span: object, reply: bytes, success: bool, result: str, errorcode: str
+    ):
+        span.set_attribute("laser.bytes_read", len(reply))
+        span.set_attribute("laser.success", success)
+        span.set_attribute("laser.result", result)
+        if errorcode:
+            span.set_attribute("laser.error_code", errorcode)
+        span.end()
+
+
+class RecordingTracer(Pulsed_Laser_Tracer):
+    """Keep the last maxlen commands as dicts in self.spans
+    Times are time.monotonic_ns() values"""
+
+    def __init__(self, maxlen: int = 1000):
+        self.spans = deque(maxlen=maxlen)
+
+    def start_span(self, command: str, data: bytes) -> object:
+        return {
+            "command": command,
+            "bytes_written": len(data),
+            "start": time.monotonic_ns(),
+        }
+
+    def end_span(
+        self, span: object, reply: bytes, success: bool, result: str, errorcode: str
+    ):
+        span["end"] = time.monotonic_ns()
+        span["bytes_read"] = len(reply)
+        span["success"] = success
+        span["result"] = result
+        span["errorcode"] = errorcode
+        self.spans.append(span)
@@ -0,0 +1,144 @@
+"""Link heartbeat watchdog for the SPI G4 pulsed laser.
+
+LinkWatchdog checks that the RS232 link is alive when no other commands are
+flowing. A reply to any command proves the link, so the heartbeat ('QS', the
+status word as one integer) is only sent once the link has been idle for
+interval seconds. It never adds load while the application is talking to
+the laser.
+
+Each check scores the link between 0 and 1 and adds it to an exponentially
+weighted health score:
+
+    reply to another command     1
+    heartbeat reply              latencylimit / latency, at most 1
+    heartbeat E-code             ERROR_SCORE
+    heartbeat timeout or error   0
+
+The link is degraded when the health falls below threshold, and recovers
+when it is back above threshold + HEALTH_HYSTERESIS.
+"""
+
+import threading
+import time
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, is_error
+
+ERROR_SCORE = 0.5  # Score of a heartbeat answered with an E-code
+HEALTH_HYSTERESIS = 0.1  # Health above threshold needed to recover
+
+
+class LinkWatchdog:
+    """Send heartbeats on an idle link and keep a health score
+
+    ondegraded(health, disableerror) and onrecovered(health) are called
+    from the watchdog thread when the link becomes degraded or recovers.
+    If disable_emission is True, clear_status_word(0) is sent to the laser
+    when the link becomes degraded, in case it can still be reached.
+    disableerror is the error it returned or raised, or None if it was
+    sent or disable_emission is False.
+    """
+
+    def __init__(
+        self,
+        laser: Pulsed_Laser,
+        interval: float = 1.0,
+        latencylimit: float = 0.05,
+        alpha: float = 0.3,
+        threshold: float = 0.5,
+        ondegraded=None,
+        onrecovered=None,
+        disable_emission: bool = False,
+    ):
+        self.laser = laser
+        self.interval = interval
+        self.latencylimit = latencylimit
+        self.alpha = alpha
+        self.threshold = threshold
+        self.ondegraded = ondegraded
+        self.onrecovered = onrecovered
+        self.disable_emission = disable_emission
+        self.health = 1.0
+        self.degraded = False
+        self.disableerror = None
+        self.heartbeats = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._seenreply = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start checking the link from a daemon thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watchdog thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.wait(delay):
+            delay = self.check()
+
+    def check(self) -> float:
+        """Score the link once, sending a heartbeat only if it is idle
+        Returns the time (s) until the link should next be checked"""
+        serialconn = self.laser.serialconn
+        lastreply = getattr(serialconn, "lastreply", 0.0)
+        idle = time.monotonic() - lastreply
+        if lastreply > self._seenreply and idle < self.interval:
+            self._seenreply = lastreply
+            self.update(1.0)
+            return self.interval - idle
+        self.update(self.heartbeat())
+        self._seenreply = getattr(serialconn, "lastreply", 0.0)
+        return self.interval
+
+    def heartbeat(self) -> float:
+        """Send the heartbeat and return its score"""
+        self.heartbeats += 1
+        start = time.perf_counter()
+        try:
+            result = self.laser.query_status_word_int()
+        # A heartbeat that raises is scored as a lost link, and the watchdog
+        # keeps running
+        except Exception:  # noqa: BLE001
+            self.timeouts += 1
+            return 0.0
+        latency = time.perf_counter() - start
+        if result[:1] == "E" and result[1:2].isdigit():
+            self.errors += 1
+            return ERROR_SCORE
+        if is_error(result):
+            self.timeouts += 1
+            return 0.0
+        return min(1.0, self.latencylimit / latency) if latency else 1.0
+
+    def disable(self) -> None | str:
+        """Send clear_status_word(0) and return its error, if any"""
+        try:
+            return self.laser.clear_status_word(0)
+        # The link is already failing, so the failure is reported to
+        # ondegraded instead of stopping the watchdog
+        except Exception as error:  # noqa: BLE001
+            return f"Error: {error}"
+
+    def update(self, score: float):
+        """Add a score to the health and fire the callbacks on a change"""
+        self.health += self.alpha * (score - self.health)
+        if not self.degraded and self.health < self.threshold:
+            self.degraded = True
+            self.disableerror = None
+            if self.disable_emission:
+                self.disableerror = self.disable()
+            if self.ondegraded is not None:
+                self.ondegraded(self.health, self.disableerror)
+        elif self.degraded and self.health >= self.threshold + HEALTH_HYSTERESIS:
+            self.degraded = False
+            if self.onrecovered is not None:
+                self.onrecovered(self.health)
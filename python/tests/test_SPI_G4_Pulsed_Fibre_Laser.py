@@ -1,6 +1,12 @@
 import pytest
+import json
+import socket
+import threading
+import time
 from unittest.mock import Mock, patch
-from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, Pulsed_Laser_Serial
+from SPI_G4_Pulsed_Fibre_Laser import (Pulsed_Laser, Pulsed_Laser_Serial, character_time_ns,
+                                       estimate_sample_time, ramp_next_step, ramp_step_due)
+from SPI_G4_Pulsed_Fibre_Laser_soak import SimulatedLaser
 import serial
 
 @pytest.fixture
@@ -19,6 +25,47 @@ def test_create_serial_connection(mock_serial):
                                         stopbits=serial.STOPBITS_ONE,
                                         bytesize=serial.EIGHTBITS, timeout=1)
     
+@pytest.fixture
+def socket_laser():
+    """Local socket stand-in for a serial-over-Ethernet gateway
+    Replies to each command with the value in the replies dict"""
+    replies = {'GR': '50000', 'SR 20000': '20000', 'GW': 'E9'}
+    server = socket.create_server(('127.0.0.1', 0))
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            buffer = b''
+            while True:
+                data = conn.recv(1024)
+                if not data:
+                    break
+                buffer += data
+                while b'\r\n' in buffer:
+                    line, buffer = buffer.split(b'\r\n', 1)
+                    reply = replies.get(line.decode('utf-8'), 'E10')
+                    conn.sendall(bytes(reply + '\r\n', 'utf-8'))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.getsockname()[1]
+    server.close()
+
+def test_create_socket_connection(socket_laser):
+    laser = Pulsed_Laser()
+    laser.create_serial_connection(f'socket://127.0.0.1:{socket_laser}')
+
+    sock = laser.serialconn.serial._socket
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) != 0
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE) != 0
+
+    assert laser.get_prf() == '50000'
+    assert laser.prf == 50000
+    assert laser.set_prf(20000) is None
+    assert laser.prf == 20000
+    assert laser.get_waveform() == 'E9: Insufficient privilege'
+    laser.close_serial()
+
 def test_close_serial():
     laser = Pulsed_Laser()
     laser.serialconn = Mock()
@@ -42,8 +89,61 @@ def test_error_check_fail():
                                         stopbits=serial.STOPBITS_ONE,
                                         databits=serial.EIGHTBITS, timeout=1)
     
-    with pytest.raises(KeyError, match='The error code fake_key is not in the list of errors'):
-        laser_serial.error_check('fake_key')
+    assert laser_serial.error_check('fake_key') == 'Unknown error code'
+
+@pytest.mark.parametrize('reply, error', [
+    (b'', 'Error: No reply to GR from /dev/ttyUSB0'),
+    (b'005', 'Error: Incomplete reply to GR from /dev/ttyUSB0'),
+    (b'\xfe\x13\x80\r\n', 'Error: Garbled reply to GR from /dev/ttyUSB0'),
+    (b'00\x0250\r\n', 'Error: Garbled reply to GR from /dev/ttyUSB0'),
+])
+def test_send_command_bad_reply(reply, error):
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1)
+    laser_serial.serial = Mock()
+    laser_serial.serial.read_until.return_value = reply
+
+    assert laser_serial.send_get_command('GR') == (False, error)
+    # Once before the write and once to discard the bad reply
+    assert laser_serial.serial.reset_input_buffer.call_count == 2
+    assert laser_serial.replytimes == {}
+
+def test_query_alarms_none_active():
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                           parity=serial.PARITY_NONE,
+                                           stopbits=serial.STOPBITS_ONE,
+                                           databits=serial.EIGHTBITS, timeout=1)
+    laser.serialconn.serial = Mock()
+    laser.serialconn.serial.read_until.return_value = b'\r\n'
+    laser.alarms = ['Base plate temperature alarm']
+
+    assert laser.query_alarms() == ''
+    assert laser.alarms == []
+
+def test_send_command_unknown_error_code():
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1)
+    laser_serial.serial = Mock()
+    laser_serial.serial.read_until.return_value = b'E99\r\n'
+
+    assert laser_serial.send_get_command('GR') == (False, 'E99: Unknown error code')
+
+def test_send_command_port_failure():
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                           parity=serial.PARITY_NONE,
+                                           stopbits=serial.STOPBITS_ONE,
+                                           databits=serial.EIGHTBITS, timeout=1)
+    laser.serialconn.serial = Mock()
+    laser.serialconn.serial.write.side_effect = serial.SerialException('device disconnected')
+
+    assert laser.get_prf() == 'Error: Serial port on /dev/ttyUSB0 failed: device disconnected'
+    assert laser.prf == 0
     
 def test_set_control_mode():
     laser = Pulsed_Laser()
@@ -104,7 +204,7 @@ def test_set_status_word_fail():
     laser.serialconn = Mock()
     laser.serialconn.send_set_command.return_value = (False, 'Error')
 
-    result = laser.set_status_word(2)
+    result = laser.set_status_word(0)
     assert result  == "Error"
 
 
@@ -131,7 +231,7 @@ def test_clear_status_word_fail():
     laser.serialconn = Mock()
     laser.serialconn.send_set_command.return_value = (False, 'Error')
 
-    result = laser.clear_status_word(2)
+    result = laser.clear_status_word(0)
     assert result  == "Error"
 
 def test_get_status_word():
@@ -274,9 +374,9 @@ def test_set_prf():
     laser.serialconn = Mock()
     laser.serialconn.send_set_command.return_value = (True, 'Success')
 
-    result = laser.set_prf(1000)
+    result = laser.set_prf(10000)
 
-    assert result is None and laser.prf == 1000
+    assert result is None and laser.prf == 10000
     
 def test_set_prf_fail():
     laser = Pulsed_Laser()
@@ -412,7 +512,26 @@ def test_query_all_alarms():
     assert laser.alarms == ['System fault: diode driver current',
                             'System fault: seed laser',
                             'Base plate temperature alarm']
+
+def test_query_alarms_replaces_previous():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_get_command.return_value = (True, '40, 80')
+    laser.query_alarms()
+    laser.serialconn.send_get_command.return_value = (True, '80')
+
+    laser.query_alarms()
+
+    assert laser.alarms == ['Base plate temperature alarm']
     
+def test_query_alarms_unknown_code():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_get_command.return_value = (True, '70, 80')
+
+    assert laser.query_alarms() == '70, 80'
+    assert laser.alarms == ['Unknown alarm 70', 'Base plate temperature alarm']
+
 def test_query_alarms_fail():
     laser = Pulsed_Laser()
     laser.serialconn = Mock()
@@ -495,6 +614,8 @@ def test_query_active_diode_currents():
 
     assert result == '10000, 15000'
     assert laser.diodecurrents == '10000, 15000'
+    assert laser.diodecurrentvalues.tolist() == [10000, 15000]
+    assert laser.diodecurrentstats.count == [1, 1]
 
 def test_query_active_diode_fail():
     laser = Pulsed_Laser()
@@ -552,6 +673,59 @@ def test_query_extended_diode_currents():
 
     assert result == '01000, 20000, 00030, (12032)'
     assert laser.extendeddiodecurrent == '01000, 20000, 00030, (12032)'
+    assert laser.extendeddiodecurrentvalues.tolist() == [1000, 20000, 30, 12032]
+
+def test_diode_current_stats():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    for reply in ('01000, 20000, 00030', '03000, 19000, 00010, (12000)', '02000, 18000, 00020, '):
+        laser.serialconn.send_get_command.return_value = (True, reply)
+        laser.query_extended_diode_currents()
+
+    stats = laser.extendeddiodecurrentstats
+    assert stats.count == [3, 3, 3, 1]
+    assert stats.minimum == [1000, 18000, 10, 12000]
+    assert stats.maximum == [3000, 20000, 30, 12000]
+    assert stats.mean() == [2000.0, 19000.0, 20.0, 12000.0]
+    assert laser.extendeddiodecurrentvalues.tolist() == [2000, 18000, 20]
+    stats.reset()
+    assert stats.count == [] and stats.mean() == []
+
+def test_getters_unexpected_reply():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.enable = True
+    getters = {'GS': laser.get_status_word, 'QD': laser.query_monitoring_states,
+               'QT': laser.query_laser_temp, 'GR': laser.get_prf,
+               'QS': laser.query_status_word_int}
+    for reply in ('', 'QT', '1, 0, 1, 1'):
+        laser.serialconn.send_get_command.return_value = (True, reply)
+        for command, getter in getters.items():
+            assert getter() == f'Error: Unexpected reply to {command}: {reply!r}'
+
+    laser.serialconn.send_get_command.return_value = (True, '36.5')
+    assert laser.get_prf() == "Error: Unexpected reply to GR: '36.5'"
+    assert laser.query_alarms() == "Error: Unexpected reply to QA: '36.5'"
+    assert laser.enable is True
+    assert laser.pulses is False
+    assert laser.lasertemp == 0
+    assert laser.prf == 0
+
+def test_query_diode_currents_unexpected_reply():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_get_command.return_value = (True, '10000, 15000')
+    laser.query_extended_diode_currents()
+
+    for reply in ('36.5', '10000, 99999', ''):
+        laser.serialconn.send_get_command.return_value = (True, reply)
+        assert laser.query_active_diode_currents() == f'Error: Unexpected reply to QI: {reply!r}'
+        assert laser.query_extended_diode_currents() == f'Error: Unexpected reply to QJ: {reply!r}'
+
+    assert laser.diodecurrentstats.count == []
+    assert laser.extendeddiodecurrent == '10000, 15000'
+    assert laser.extendeddiodecurrentvalues.tolist() == [10000, 15000]
+    assert laser.extendeddiodecurrentstats.count == [1, 1]
 
 def test_query_extended_diode_currents_fail():
     laser = Pulsed_Laser()
@@ -649,4 +823,515 @@ def test_query_vendor_info_fail():
 
     result = laser.query_vendor_info()
     
-    assert result == 'E9: Insufficient privilege'
\ No newline at end of file
+    assert result == 'E9: Insufficient privilege'
+def test_send_command_reads_until_crlf():
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1)
+    laser_serial.serial = Mock()
+    laser_serial.serial.read_until.return_value = b'50000\r\n'
+
+    assert laser_serial.send_get_command('GR') == (True, '50000')
+    laser_serial.serial.write.assert_called_once_with(b'GR\r\n')
+    laser_serial.serial.read_until.assert_called_once_with(expected=b'\r\n')
+
+def test_adaptive_timeout():
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1,
+                                       adaptive_timeout=True)
+    laser_serial.serial = Mock()
+    laser_serial.serial.timeout = 1
+    laser_serial.serial.read_until.return_value = b'3\r\n'
+
+    for _ in range(19):
+        laser_serial.send_get_command('GM')
+    assert laser_serial.get_timeouts() == {}
+
+    laser_serial.send_get_command('GM')
+    assert laser_serial.get_timeouts()['GM'] == 0.02
+
+    # A slow command keeps its own, longer timeout
+    for _ in range(20):
+        laser_serial.record_latency('RQV', 0.1)
+    assert laser_serial.get_timeouts()['RQV'] == pytest.approx(0.3)
+
+    # The learned timeout never exceeds the fixed timeout
+    for _ in range(200):
+        laser_serial.record_latency('GR', 5)
+    assert laser_serial.get_timeouts()['GR'] == 1
+
+def test_adaptive_timeout_ignores_timed_out_reads():
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1,
+                                       adaptive_timeout=True)
+    laser_serial.serial = Mock()
+    laser_serial.serial.read_until.return_value = b''
+    for _ in range(20):
+        laser_serial.record_latency('GM', 0.01)
+
+    start = time.monotonic()
+    assert laser_serial.send_get_command('GM')[0] is False
+    assert 0.02 <= time.monotonic() - start < 0.5
+    assert len(laser_serial.latencies['GM']) == 20
+
+def test_adaptive_timeout_follows_slower_link():
+    with SimulatedLaser() as simulator:
+        laser = Pulsed_Laser()
+        laser.create_serial_connection(simulator.url, adaptive_timeout=True)
+        try:
+            for _ in range(20):
+                laser.get_prf()
+                laser.query_laser_temp()
+            timeouts = laser.serialconn.get_timeouts()
+            assert timeouts['GR'] < 0.1 and timeouts['QT'] < 0.1
+
+            simulator.latency = 0.1
+            results = []
+            for _ in range(10):
+                results.append((laser.get_prf(), laser.query_laser_temp()))
+                # A late reply is never taken as the reply to the next command
+                assert (laser.prf, laser.lasertemp) == (50000, 36.5)
+
+            assert results[-5:] == [('0050000', '36.5')] * 5
+            timeouts = laser.serialconn.get_timeouts()
+            assert timeouts['GR'] >= 0.1 and timeouts['QT'] >= 0.1
+        finally:
+            laser.close_serial()
+
+class TimeoutPort:
+    is_open = True
+
+    def __init__(self):
+        self._timeout = 1
+        self.timeoutchanges = 0
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._timeout = timeout
+        self.timeoutchanges += 1
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        pass
+
+    def read_until(self, expected):
+        return b'3\r\n'
+
+def test_adaptive_timeout_sets_port_timeout_once():
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1,
+                                       adaptive_timeout=True)
+    laser_serial.serial = TimeoutPort()
+    for code, latency in (('GM', 0.01), ('QT', 0.05), ('QI', 0.2)):
+        for _ in range(20):
+            laser_serial.record_latency(code, latency)
+
+    for _ in range(10):
+        for code in ('GM', 'QT', 'QI'):
+            assert laser_serial.send_get_command(code) == (True, '3')
+    assert laser_serial.serial.timeout == 0.02
+    assert laser_serial.serial.timeoutchanges == 1
+
+def test_character_time():
+    assert character_time_ns(115200, 8, serial.PARITY_NONE, 1) == pytest.approx(86805.6, abs=0.1)
+    assert character_time_ns(9600, 8, serial.PARITY_EVEN, 2) == pytest.approx(1250000)
+
+def test_estimate_sample_time():
+    # 4 byte command and 6 byte reply at 100 ns per byte in a 2000 ns round trip
+    assert estimate_sample_time(1000, 3000, 4, 6, 100) == 1900
+    # A round trip shorter than the transmission time falls back to its mid-point
+    assert estimate_sample_time(1000, 1500, 4, 6, 100) == 1250
+
+def test_reading_times():
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                           parity=serial.PARITY_NONE,
+                                           stopbits=serial.STOPBITS_ONE,
+                                           databits=serial.EIGHTBITS, timeout=1)
+    laser.serialconn.serial = Mock()
+    laser.serialconn.serial.read_until.return_value = b'36.5\r\n'
+    assert laser.reading_times('lasertemp') is None
+
+    before = time.monotonic_ns()
+    laser.query_laser_temp()
+    times = laser.reading_times('lasertemp')
+
+    assert before <= times.sent <= times.sample <= times.received <= time.monotonic_ns()
+    assert laser.serialconn.lastreply == times.received / 1e9
+
+    # A failed query keeps the times of the reading still stored
+    laser.serialconn.serial.read_until.return_value = b'E9\r\n'
+    laser.query_laser_temp()
+    assert laser.reading_times('lasertemp') == times
+
+def test_reading_times_unparsed_reply():
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                           parity=serial.PARITY_NONE,
+                                           stopbits=serial.STOPBITS_ONE,
+                                           databits=serial.EIGHTBITS, timeout=1)
+    laser.serialconn.serial = Mock()
+    laser.serialconn.serial.read_until.return_value = b'QT\r\n'
+    assert laser.query_laser_temp() == "Error: Unexpected reply to QT: 'QT'"
+    assert laser.reading_times('lasertemp') is None
+
+    laser.serialconn.serial.read_until.return_value = b'36.5\r\n'
+    laser.query_laser_temp()
+    times = laser.reading_times('lasertemp')
+    laser.serialconn.serial.read_until.return_value = b'\r\n'
+    assert laser.query_laser_temp() == "Error: Unexpected reply to QT: ''"
+
+    # The stored value is not made to look freshly read
+    assert laser.reading_times('lasertemp') == times
+    assert laser.lasertemp == 36.5
+
+def test_query_vendor_info_multiline():
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                           parity=serial.PARITY_NONE,
+                                           stopbits=serial.STOPBITS_ONE,
+                                           databits=serial.EIGHTBITS, timeout=1)
+    laser.serialconn.serial = Mock()
+    laser.serialconn.serial.read_until.side_effect = [b'FPGA HW Rev: 8.1.0\r\n',
+                                                      b'NIOS-II FW Rev: 8.2.0\r\n',
+                                                      b'Stellaris FW Rev: 0.0.1.2\r\n',
+                                                      b'IP Config: 10.0.0.5 STATIC\r\n',
+                                                      b'Driver FW Rev: 1.4\r\n']
+
+    result = laser.query_vendor_info()
+
+    assert result == ('FPGA HW Rev: 8.1.0\nNIOS-II FW Rev: 8.2.0\n'
+                      'Stellaris FW Rev: 0.0.1.2\nIP Config: 10.0.0.5 STATIC\n'
+                      'Driver FW Rev: 1.4')
+    assert laser.vendorinfo == result
+
+def test_query_vendor_info_short_reply():
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1)
+    laser_serial.serial = Mock()
+    laser_serial.serial.read_until.side_effect = [b'FPGA HW Rev: 8.1.0\r\n', b'']
+
+    assert laser_serial.send_get_command('RQV', 5) == (True, 'FPGA HW Rev: 8.1.0')
+    assert laser_serial.serial.read_until.call_count == 2
+
+def warm_start_laser():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.port = '/dev/ttyUSB0'
+    laser.serialconn.send_get_command.return_value = (True, '123213')
+    laser.initialise_laser = Mock()
+    return laser
+
+def test_warm_start(tmp_path):
+    path = str(tmp_path / 'state.json')
+    laser = warm_start_laser()
+    laser.serialno = 123213
+    laser.partno = 'XX-XXXP-X-XX-X-X-X(XX)'
+    laser.waveform = 7
+    laser.prf = 50000
+    laser.save_state(path)
+
+    laser = warm_start_laser()
+    laser.serialconn.send_get_command.side_effect = [(True, '123213'),
+                                                     (True, '1, 0, 0, 0, 0, 0'),
+                                                     (True, '00000001'),
+                                                     (True, '80')]
+
+    assert laser.warm_start(path) is True
+    laser.initialise_laser.assert_not_called()
+    assert laser.partno == 'XX-XXXP-X-XX-X-X-X(XX)'
+    assert laser.waveform == 7
+    assert laser.prf == 50000
+    assert laser.enable is True
+    assert laser.laseronmonitor is True
+    assert laser.alarms == ['Base plate temperature alarm']
+    assert laser.serialconn.send_get_command.call_count == 4
+
+def test_warm_start_different_laser(tmp_path):
+    path = str(tmp_path / 'state.json')
+    laser = warm_start_laser()
+    laser.serialno = 111111
+    laser.save_state(path)
+
+    laser = warm_start_laser()
+    assert laser.warm_start(path) is False
+    laser.initialise_laser.assert_called_once()
+    with open(path) as file:
+        assert sorted(json.load(file)) == ['/dev/ttyUSB0|111111', '/dev/ttyUSB0|123213']
+
+def test_warm_start_no_reply(tmp_path):
+    laser = warm_start_laser()
+    laser.serialconn.send_get_command.return_value = (False, 'E9: Insufficient privilege')
+
+    assert laser.warm_start(str(tmp_path / 'state.json')) is False
+    laser.initialise_laser.assert_called_once()
+
+def test_check_parameter_rejects_locally():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+
+    assert laser.set_control_mode(8) == 'E20: Parameter out of range'
+    assert laser.set_status_word(2) == 'E20: Parameter out of range'
+    assert laser.clear_status_word(5) == 'E20: Parameter out of range'
+    assert laser.set_simmer_current(101) == 'E20: Parameter out of range'
+    assert laser.set_active_current(-1) == 'E20: Parameter out of range'
+    assert laser.set_waveform(32) == 'E20: Parameter out of range'
+    assert laser.set_pulse_burst_length(10000001) == 'E20: Parameter out of range'
+    assert laser.set_pump_duty(1001) == 'E20: Parameter out of range'
+    assert laser.set_prf(9999).startswith('E35: ')
+    assert laser.set_active_current('500') == 'E14: Parameter error: not a number'
+    assert laser.set_active_current(True) == 'E14: Parameter error: not a number'
+    assert laser.set_active_current(500.0) == 'E14: Parameter error: not a number'
+    laser.serialconn.send_set_command.assert_not_called()
+    assert laser.prf == 0
+
+def test_check_parameter_accepts_integer_types():
+    numpy = pytest.importorskip('numpy')
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+
+    assert laser.set_prf(numpy.int64(50000)) is None
+    laser.serialconn.send_set_command.assert_called_once_with('SR 50000')
+
+def test_check_parameter_cw_prf():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+
+    assert laser.set_prf(100) is not None
+    assert laser.set_prf(1000000) is None
+
+    laser.mode = True
+    assert laser.set_prf(100) is None
+    assert laser.set_prf(1000000) is not None
+    assert laser.prf == 100
+
+def test_check_parameter_disabled():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (False, 'E20: Parameter out of range')
+    laser.validate = False
+
+    assert laser.set_waveform(32) == 'E20: Parameter out of range'
+    laser.serialconn.send_set_command.assert_called_once_with('SW 32')
+
+def sent_currents(serialconn):
+    return [int(call.args[0].split()[1]) for call in serialconn.send_set_command.call_args_list]
+
+def test_ramp_next_step():
+    assert ramp_step_due(100, 145, 500, 10, 0) == pytest.approx(0.02)
+    assert ramp_step_due(100, 145, 500, 10, 4) == pytest.approx(0.09)
+    assert ramp_next_step(100, 145, 500, 10, 0, 0.02) == (1, 110)
+    # Late steps are dropped, but the ramp always moves on and ends on target
+    assert ramp_next_step(100, 145, 500, 10, 0, 0.061) == (3, 130)
+    assert ramp_next_step(100, 145, 500, 10, 3, 0.061) == (4, 140)
+    assert ramp_next_step(100, 145, 500, 10, 4, 1.0) == (5, 145)
+    assert ramp_next_step(500, 400, 1000, 20, 0, 0.0) == (1, 480)
+
+def test_ramp_active_current():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_get_command.return_value = (True, '0100')
+    laser.serialconn.send_set_command.return_value = (True, '')
+
+    result = laser.ramp_active_current(145, rate=500, step=10)
+
+    assert result is None and laser.activecurrent == 145
+    laser.serialconn.send_get_command.assert_called_once_with('GI')
+    sent = sent_currents(laser.serialconn)
+    assert 100 < sent[0] <= 110
+    assert sent == sorted(set(sent)) and sent[-1] == 145
+
+def test_ramp_active_current_down_on_schedule():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+
+    start = time.monotonic()
+    result = laser.ramp_active_current(400, rate=1000, step=20, start=500)
+    duration = time.monotonic() - start
+
+    assert result is None and laser.activecurrent == 400
+    laser.serialconn.send_get_command.assert_not_called()
+    sent = sent_currents(laser.serialconn)
+    assert sent == sorted(set(sent), reverse=True) and sent[-1] == 400
+    # The last step is due 0.1 s into the ramp and is never sent early
+    assert duration >= 0.09
+
+def test_ramp_active_current_drops_late_steps():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+
+    def slow_set(command):
+        time.sleep(0.01)
+        return True, ''
+
+    laser.serialconn.send_set_command.side_effect = slow_set
+
+    result = laser.ramp_active_current(1000, rate=20000, step=1, start=0)
+
+    assert result is None and laser.activecurrent == 1000
+    assert laser.serialconn.send_set_command.call_count < 20
+
+def test_ramp_active_current_abort():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    abort = threading.Event()
+
+    def set_then_abort(command):
+        abort.set()
+        return True, ''
+
+    laser.serialconn.send_set_command.side_effect = set_then_abort
+
+    result = laser.ramp_active_current(1000, rate=100, step=10, abort=abort, start=0)
+
+    assert result == 'Error: Ramp aborted'
+    assert laser.activecurrent == 10
+
+def test_ramp_active_current_fail():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (False, 'E25: Command not executed because Laser is not ready')
+
+    assert laser.ramp_active_current(1001, rate=100) == 'E20: Parameter out of range'
+    assert laser.ramp_active_current(100, rate=0) == 'Error: Ramp rate and step must be positive'
+    assert laser.ramp_active_current(100, rate=1000, start=0) == 'E25: Command not executed because Laser is not ready'
+    assert laser.serialconn.send_set_command.call_count == 1
+    laser.serialconn.send_get_command.return_value = (False, 'E9: Insufficient privilege')
+    assert laser.ramp_active_current(100, rate=1000) == 'E9: Insufficient privilege'
+    assert laser.serialconn.send_set_command.call_count == 1
+
+def test_transaction_single_commit():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+    laser.serialconn.send_get_command.return_value = (True, '36.5')
+
+    with laser.transaction() as txn:
+        assert laser.set_active_current(400) is None
+        laser.set_prf(50000)
+        laser.set_waveform(3)
+        laser.set_status_word(1)
+        laser.set_prf(80000)
+        laser.query_laser_temp()
+        laser.serialconn.serialconn.send_set_command.assert_not_called()
+
+    assert txn.error is None
+    assert [call.args[0] for call in laser.serialconn.send_set_command.call_args_list] == \
+        ['SW 3', 'SR 80000', 'SI 400', 'SS 1']
+    assert txn.sent == ['SW 3', 'SR 80000', 'SI 400', 'SS 1']
+    assert laser.prf == 80000
+    assert laser.lasertemp == 36.5
+
+def test_transaction_failure_rolls_back():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.side_effect = [(True, ''), (False, 'E21: Command not executed because an alarm is active')]
+    laser.prf = 50000
+
+    with laser.transaction() as txn:
+        laser.set_waveform(3)
+        laser.set_prf(80000)
+
+    assert txn.failedcommand == 'SR 80000'
+    assert txn.error == 'E21: Command not executed because an alarm is active'
+    assert txn.sent == ['SW 3']
+    # Only the settings that were not sent are rolled back
+    assert laser.prf == 50000
+    assert laser.waveform == 3
+    assert laser.serialconn.send_set_command.call_count == 2
+
+def test_transaction_exception_sends_nothing():
+    laser = Pulsed_Laser()
+    serialconn = laser.serialconn = Mock()
+
+    with pytest.raises(RuntimeError), laser.transaction():
+        laser.set_prf(80000)
+        raise RuntimeError('recipe error')
+
+    assert laser.serialconn is serialconn
+    serialconn.send_set_command.assert_not_called()
+    assert laser.prf == 0
+
+def test_transaction_status_word_order():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+
+    with laser.transaction() as txn:
+        laser.set_pulse_burst_length(100)
+        laser.set_status_word(3)
+        laser.set_status_word(8)
+        laser.clear_status_word(8)
+        laser.clear_status_word(1)
+
+    # Clearing bit 1 leaves the changes for the next 'SS 1'
+    assert txn.sent == ['SS 3', 'SC 8', 'SC 1', 'SL 100']
+    assert laser.pilotlaser is False
+
+    with laser.transaction() as txn:
+        pass
+    assert txn.sent == []
+
+def test_transaction_commit_only_when_needed():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+
+    # Control mode and active current do not wait for 'SS 1'
+    with laser.transaction() as txn:
+        laser.set_control_mode(2)
+        laser.set_active_current(400)
+    assert txn.sent == ['SM 2', 'SI 400']
+
+    # Turning the laser off leaves the changes for the next 'SS 1'
+    with laser.transaction() as txn:
+        laser.set_prf(80000)
+        laser.clear_status_word(0)
+    assert txn.sent == ['SC 0', 'SR 80000']
+def test_transaction_other_thread_not_staged():
+    laser = Pulsed_Laser()
+    serialconn = laser.serialconn = Mock()
+    serialconn.send_set_command.return_value = (True, '')
+    laser.enable = True
+
+    def other():
+        laser.clear_status_word(0)
+        with laser.transaction() as other_txn:
+            laser.set_pulse_burst_length(100)
+        sent.append(other_txn.sent)
+
+    sent = []
+    with laser.transaction() as txn:
+        laser.set_prf(80000)
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        # The other thread's commands reach the laser while this one is open
+        assert [call.args[0] for call in serialconn.send_set_command.call_args_list] == \
+            ['SC 0', 'SL 100', 'SS 1']
+        assert laser.serialconn is not serialconn
+        with pytest.raises(RuntimeError), laser.transaction():
+            pass
+
+    assert laser.serialconn is serialconn
+    assert sent == [['SL 100', 'SS 1']]
+    assert txn.sent == ['SR 80000', 'SS 1']
+    assert laser.enable is False
@@ -0,0 +1,61 @@
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, parse_diode_currents
+from SPI_G4_Pulsed_Fibre_Laser_anomaly import AnomalyDetector, ChannelStats
+
+
+def test_channel_stats():
+    stats = ChannelStats(alpha=0.5)
+    stats.update(10.0, 0.0)
+    stats.update(12.0, 1.0)
+
+    assert stats.mean == 11.0
+    assert stats.variance == 1.0
+    assert stats.slope == 1.0
+    assert stats.count == 2
+
+def test_trend_warning_before_limit():
+    warnings = []
+    detector = AnomalyDetector(horizon=30, limits={'lasertemp': 60.0},
+                               callback=lambda *warning: warnings.append(warning))
+    for second in range(30):
+        assert detector.update('lasertemp', 40.0, second) == []
+    # Rising 1 C/s reaches the limit well within the horizon
+    temperature = 40.0
+    for second in range(30, 40):
+        temperature += 1.0
+        detector.update('lasertemp', temperature, second)
+
+    trend = [warning for warning in warnings if warning[1] == 'trend']
+    assert len(trend) == 1
+    assert trend[0][2] < 50.0
+
+def test_limit_and_deviation_warnings():
+    warnings = []
+    detector = AnomalyDetector(callback=lambda *warning: warnings.append(warning))
+    for second in range(30):
+        detector.update('diodecurrent0', 10000 + second % 2, second)
+
+    assert detector.update('diodecurrent0', 19500, 30) == [('diodecurrent0', 'limit', 19500),
+                                                             ('diodecurrent0', 'deviation', 19500)]
+    assert detector.active_warnings() == [('diodecurrent0', 'deviation'), ('diodecurrent0', 'limit')]
+    assert sorted(warnings) == [('diodecurrent0', 'deviation', 19500),
+                                ('diodecurrent0', 'limit', 19500)]
+
+    for second in range(31, 200):
+        detector.update('diodecurrent0', 10000, second)
+    assert detector.active_warnings() == []
+
+def test_update_from_laser():
+    laser = Pulsed_Laser()
+    laser.lasertemp = 35.0
+    laser.beamdeliverytemp = 30.0
+    laser.diodecurrentvalues = parse_diode_currents('10000, 15000')
+    laser.extendeddiodecurrentvalues = parse_diode_currents('01000, 20000, 00030, (12032)')
+    detector = AnomalyDetector(warmup=0)
+
+    warnings = detector.update_from_laser(laser, 0.0)
+
+    assert sorted(detector.channels) == ['beamdeliverytemp', 'diodecurrent0', 'diodecurrent1',
+                                         'extendeddiodecurrent0', 'extendeddiodecurrent1',
+                                         'extendeddiodecurrent2', 'extendeddiodecurrent3',
+                                         'lasertemp']
+    assert warnings == [('extendeddiodecurrent1', 'limit', 20000)]
@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+from SPI_G4_Pulsed_Fibre_Laser import ReplyTimes, parse_diode_currents
+from SPI_G4_Pulsed_Fibre_Laser_async import EXPIRED, REJECTED, AsyncPulsedLaser
+
+REPLIES = {'QT': '36.5', 'QU': '31.0', 'QI': '10000, 15000',
+           'QJ': '01000, 20000, 00030, (12032)', 'QD': '01000001', 'QS': 'E9'}
+
+
+def mock_serialconn(replies=REPLIES):
+    serialconn = Mock()
+
+    def send_get_command(command):
+        reply = replies[command]
+        if reply[0] == 'E':
+            return False, reply + ': Insufficient privilege'
+        return True, reply
+
+    serialconn.send_get_command.side_effect = send_get_command
+    serialconn.replytimes = {'QT': ReplyTimes(100, 300, 200), 'QD': ReplyTimes(400, 600, 500)}
+    return serialconn
+
+def test_parse_diode_currents():
+    assert parse_diode_currents('10000, 15000').tolist() == [10000, 15000]
+    assert parse_diode_currents('01000, 20000, 00030').tolist() == [1000, 20000, 30]
+    assert parse_diode_currents('01000, 20000, 00030, (12032)').tolist() == [1000, 20000, 30, 12032]
+
+def test_stream_typed_snapshot():
+    async def run():
+        laser = AsyncPulsedLaser()
+        laser._laser.serialconn = mock_serialconn()
+        fields = ('lasertemp', 'beamdeliverytemp', 'diodecurrents',
+                  'extendeddiodecurrent', 'monitoring', 'statuswordint')
+        async for snapshot in laser.stream(fields, interval=0.01):
+            return snapshot
+
+    snapshot = asyncio.run(run())
+    assert snapshot.lasertemp == 36.5
+    assert snapshot.beamdeliverytemp == 31.0
+    assert snapshot.diodecurrents == (10000, 15000)
+    assert snapshot.extendeddiodecurrent == (1000, 20000, 30, 12032)
+    assert snapshot.monitoring['alarmstatemonitor'] is True
+    assert snapshot.monitoring['laseronmonitor'] is True
+    assert snapshot.monitoring['monitor'] is False
+    assert snapshot.statuswordint is None
+    assert snapshot.errors == {'statuswordint': 'E9: Insufficient privilege'}
+    assert snapshot.alarms is None
+    assert snapshot.sampletimes == {'lasertemp': 200, 'monitoring': 500}
+    assert snapshot.latency == pytest.approx(200e-9)
+
+def test_stream_conflates_for_slow_consumer():
+    async def run():
+        laser = AsyncPulsedLaser()
+        laser._laser.serialconn = mock_serialconn()
+        stream = laser.stream(('lasertemp',), interval=0.001)
+        first = await stream.__anext__()
+        await asyncio.sleep(0.1)
+        second = await stream.__anext__()
+        await stream.aclose()
+        return laser, first, second
+
+    laser, first, second = asyncio.run(run())
+    # Samples taken while the consumer slept were replaced by the latest one
+    assert second.timestamp - first.timestamp >= 0.05
+    assert laser._laser.serialconn.send_get_command.call_count > 2
+
+def test_stream_unknown_field():
+    async def run():
+        laser = AsyncPulsedLaser()
+        async for snapshot in laser.stream(('diodecurrent',)):
+            pass
+
+    with pytest.raises(ValueError, match='diodecurrent is not a telemetry field'):
+        asyncio.run(run())
+
+def test_concurrent_reads_share_transaction():
+    async def run():
+        laser = AsyncPulsedLaser()
+        laser._laser.serialconn = mock_serialconn()
+        results = await asyncio.gather(*(laser.query_laser_temp() for _ in range(5)))
+        return laser, results
+
+    laser, results = asyncio.run(run())
+    assert results == ['36.5'] * 5
+    assert laser._laser.serialconn.send_get_command.call_count == 1
+    assert laser._inflight == {}
+
+def test_set_invalidates_pending_read():
+    release = threading.Event()
+    replies = ['50000', '20000']
+
+    def send_get_command(command):
+        release.wait(5)
+        return True, replies.pop(0)
+
+    async def run():
+        laser = AsyncPulsedLaser()
+        laser._laser.serialconn = Mock()
+        laser._laser.serialconn.send_get_command.side_effect = send_get_command
+        laser._laser.serialconn.send_set_command.return_value = (True, '')
+        before = asyncio.ensure_future(laser.get_prf())
+        await asyncio.sleep(0)
+        assert 'get_prf' in laser._inflight
+        setting = asyncio.ensure_future(laser.set_prf(20000))
+        await asyncio.sleep(0)
+        assert 'get_prf' not in laser._inflight
+        after = asyncio.ensure_future(laser.get_prf())
+        await asyncio.sleep(0)
+        release.set()
+        return await before, await setting, await after
+
+    assert asyncio.run(run()) == ('50000', None, '20000')
+
+def test_ramp_active_current():
+    async def run():
+        laser = AsyncPulsedLaser()
+        laser._laser.serialconn = Mock()
+        laser._laser.serialconn.send_get_command.return_value = (True, '0000')
+        laser._laser.serialconn.send_set_command.return_value = (True, '')
+        result = await laser.ramp_active_current(50, rate=500, step=10)
+        return laser, result
+
+    laser, result = asyncio.run(run())
+    assert result is None and laser._laser.activecurrent == 50
+    laser._laser.serialconn.send_get_command.assert_called_once_with('GI')
+    sent = [int(call.args[0].split()[1])
+            for call in laser._laser.serialconn.send_set_command.call_args_list]
+    assert sent == sorted(set(sent)) and sent[-1] == 50
+
+def test_ramp_active_current_abort():
+    async def run():
+        laser = AsyncPulsedLaser()
+        loop = asyncio.get_running_loop()
+        abort = asyncio.Event()
+
+        def set_then_abort(command):
+            loop.call_soon_threadsafe(abort.set)
+            return True, ''
+
+        laser._laser.serialconn = Mock()
+        laser._laser.serialconn.send_set_command.side_effect = set_then_abort
+        result = await laser.ramp_active_current(1000, rate=200, step=10, abort=abort,
+                                                 start=0)
+        return laser, result
+
+    laser, result = asyncio.run(run())
+    assert result == 'Error: Ramp aborted'
+    assert laser._laser.activecurrent == 10
+
+def test_full_queue_rejects_reads_not_sets():
+    release = threading.Event()
+
+    def send_get_command(command):
+        release.wait(5)
+        return True, '36.5'
+
+    async def run():
+        laser = AsyncPulsedLaser(maxqueue=2)
+        laser._laser.serialconn = Mock()
+        laser._laser.serialconn.send_get_command.side_effect = send_get_command
+        laser._laser.serialconn.send_set_command.return_value = (True, '')
+        temp = asyncio.ensure_future(laser.query_laser_temp())
+        beam = asyncio.ensure_future(laser.query_beam_delivery_temp())
+        await asyncio.sleep(0)
+        duplicate = asyncio.ensure_future(laser.query_laser_temp())
+        rejected = await laser.query_ext_prf()
+        setting = asyncio.ensure_future(laser.set_prf(20000))
+        await asyncio.sleep(0)
+        depth = laser.get_queue_metrics()['depth']
+        release.set()
+        return laser, rejected, depth, await asyncio.gather(temp, beam, duplicate, setting)
+
+    laser, rejected, depth, results = asyncio.run(run())
+    assert rejected == REJECTED
+    assert depth == 3
+    assert results == ['36.5', '36.5', '36.5', None]
+    assert laser.get_queue_metrics() == {'submitted': 3, 'conflated': 1, 'rejected': 1,
+                                         'expired': 0, 'maxdepth': 3, 'depth': 0}
+
+def test_stale_reads_expire():
+    def send_get_command(command):
+        time.sleep(0.1)
+        return True, '36.5'
+
+    async def run():
+        laser = AsyncPulsedLaser(maxage=0.05)
+        laser._laser.serialconn = Mock()
+        laser._laser.serialconn.send_get_command.side_effect = send_get_command
+        laser._laser.serialconn.send_set_command.return_value = (True, '')
+        return laser, await asyncio.gather(laser.query_laser_temp(), laser.query_ext_prf(),
+                                           laser.set_prf(20000))
+
+    laser, results = asyncio.run(run())
+    assert results == ['36.5', EXPIRED, None]
+    assert laser.get_queue_metrics()['expired'] == 1
+    assert laser._laser.serialconn.send_get_command.call_count == 1
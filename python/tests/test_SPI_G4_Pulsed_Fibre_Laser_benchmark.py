@@ -0,0 +1,135 @@
+"""Per-command Python overhead of Pulsed_Laser, compared with stored baselines
+
+Each method is timed against SimulatedPort, an in-memory port with no wire
+latency, so only the library's own work is measured: formatting the command,
+the connection lock, decoding and checking the reply, and updating state.
+Times are divided by the time of reference_workload on the same machine, so
+the baselines hold on faster or slower hardware.
+
+A method fails when its ratio is more than TOLERANCE times its baseline in
+RETRIES measurements in a row.
+The benchmarks are skipped unless SPI_G4_BENCHMARK=1 is set, and always
+under a tracer such as coverage, which slows each method by a different
+amount. Run them with:
+
+    SPI_G4_BENCHMARK=1 pytest tests/test_SPI_G4_Pulsed_Fibre_Laser_benchmark.py
+
+After an intended change in overhead, update the baselines with:
+
+    SPI_G4_UPDATE_BASELINES=1 pytest tests/test_SPI_G4_Pulsed_Fibre_Laser_benchmark.py
+"""
+import json
+import os
+import statistics
+import sys
+import timeit
+
+import pytest
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, Pulsed_Laser_Serial
+from SPI_G4_Pulsed_Fibre_Laser_soak import SimulatedPort
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+UPDATE = os.environ.get('SPI_G4_UPDATE_BASELINES') == '1'
+TOLERANCE = float(os.environ.get('SPI_G4_BENCHMARK_TOLERANCE', '2.0'))
+RETRIES = 3
+
+pytestmark = [
+    pytest.mark.skipif(
+        os.environ.get('SPI_G4_BENCHMARK') != '1' and not UPDATE,
+        reason='Benchmarks only run with SPI_G4_BENCHMARK=1'),
+    pytest.mark.skipif(sys.gettrace() is not None,
+                       reason='Benchmarks are not meaningful under a tracer'),
+]
+
+BENCHMARKS = {
+    'set_control_mode': (0,),
+    'get_control_mode': (),
+    'set_status_word': (1,),
+    'clear_status_word': (1,),
+    'get_status_word': (),
+    'set_simmer_current': (10,),
+    'get_simmer_current': (),
+    'set_active_current': (500,),
+    'get_active_current': (),
+    'set_waveform': (0,),
+    'get_waveform': (),
+    'set_prf': (50000,),
+    'get_prf': (),
+    'set_pulse_burst_length': (0,),
+    'get_pulse_burst_length': (),
+    'set_pump_duty': (100,),
+    'get_pump_duty': (),
+    'query_alarms': (),
+    'query_monitoring_states': (),
+    'query_laser_temp': (),
+    'query_beam_delivery_temp': (),
+    'query_active_diode_currents': (),
+    'query_operating_hours': (),
+    'query_ext_prf': (),
+    'query_extended_diode_currents': (),
+    'query_status_word_int': (),
+    'read_serial_number': (),
+    'read_part_number': (),
+    'query_vendor_info': (),
+}
+
+
+def reference_workload():
+    for value in range(20):
+        data = bytes(f'SR {value}' + '\r\n', 'utf-8')
+        data.decode('utf-8').rstrip('\r\n').split(' ', 1)
+
+def best_time(func, number=200, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+def simulated_laser():
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial('COM1', 115200, 1, 'N', 8, 1)
+    laser.serialconn.serial = SimulatedPort()
+    return laser
+
+@pytest.fixture(scope='module')
+def baselines():
+    try:
+        with open(BASELINES) as file:
+            baselines = json.load(file)
+    except FileNotFoundError:
+        baselines = {}
+    yield baselines
+    if UPDATE:
+        with open(BASELINES, 'w') as file:
+            json.dump(dict(sorted(baselines.items())), file, indent=2)
+            file.write('\n')
+
+def overhead(func):
+    # The reference is timed next to the method so both see the same load
+    return best_time(func) / best_time(reference_workload)
+
+def check_overhead(name, func, baselines):
+    if UPDATE:
+        baselines[name] = round(statistics.median(overhead(func) for _ in range(5)), 2)
+        return
+    if name not in baselines:
+        pytest.skip(f'No baseline for {name}, run with SPI_G4_UPDATE_BASELINES=1')
+    # A regression is slow every time, a busy machine only some of the time
+    limit = baselines[name] * TOLERANCE
+    ratios = []
+    for _ in range(RETRIES):
+        ratios.append(overhead(func))
+        if ratios[-1] <= limit:
+            return
+    pytest.fail(f'{name} overhead {min(ratios):.2f} x reference, baseline {baselines[name]}')
+
+@pytest.mark.parametrize('method', BENCHMARKS)
+def test_method_overhead(method, baselines):
+    laser = simulated_laser()
+    func = getattr(laser, method)
+    args = BENCHMARKS[method]
+    assert func(*args) is None or not func(*args).startswith('E')
+    check_overhead(method, lambda: func(*args), baselines)
+
+def test_error_reply_overhead(baselines):
+    laser = simulated_laser()
+    laser.serialconn.serial.simulator.replies['GW'] = 'E9'
+    assert laser.get_waveform() == 'E9: Insufficient privilege'
+    check_overhead('error_reply', laser.get_waveform, baselines)
@@ -0,0 +1,69 @@
+from unittest.mock import Mock
+
+import pytest
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser_daemon import LaserDaemon, LaserDaemonClient
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_get_command.return_value = (True, '50000')
+    laser.serialconn.send_set_command.return_value = (True, '')
+    daemon = LaserDaemon(laser, str(tmp_path / 'laser.sock'), cachettl=60)
+    daemon.start()
+    yield daemon
+    daemon.shutdown()
+
+def test_clients_share_laser(daemon):
+    hmi = LaserDaemonClient(daemon.path)
+    logger = LaserDaemonClient(daemon.path)
+
+    assert hmi.get_prf() == '50000'
+    assert logger.get_prf() == '50000'
+    assert daemon.laser.serialconn.send_get_command.call_count == 1
+    assert daemon.cachedrequests == 1
+
+    assert logger.set_prf(20000) is None
+    assert daemon.laser.prf == 20000
+    daemon.laser.serialconn.send_set_command.assert_called_once_with('SR 20000')
+
+    # A set empties the cache, so the next read goes to the laser
+    assert hmi.get_prf() == '50000'
+    assert daemon.laser.serialconn.send_get_command.call_count == 2
+    assert daemon.wirerequests == 3
+    hmi.close()
+    logger.close()
+
+def test_monitoring_states_cached(daemon):
+    daemon.laser.serialconn.send_get_command.return_value = (True, '01000001')
+    client = LaserDaemonClient(daemon.path)
+
+    states = client.query_monitoring_states()
+    assert states['alarmstatemonitor'] is True
+    assert states['laseronmonitor'] is True
+    assert states['monitor'] is False
+    assert client.query_monitoring_states() == states
+    assert daemon.laser.serialconn.send_get_command.call_count == 1
+    assert daemon.cachedrequests == 1
+    client.close()
+
+def test_errors_are_not_cached(daemon):
+    daemon.laser.serialconn.send_get_command.return_value = (False, 'E9: Insufficient privilege')
+    client = LaserDaemonClient(daemon.path)
+
+    assert client.get_waveform() == 'E9: Insufficient privilege'
+    assert client.get_waveform() == 'E9: Insufficient privilege'
+    assert daemon.laser.serialconn.send_get_command.call_count == 2
+    client.close()
+
+def test_bad_requests(daemon):
+    client = LaserDaemonClient(daemon.path)
+
+    assert client.call('close_serial') == 'Error: Unknown method close_serial'
+    assert client.call('set_prf', 'fast') == 'Error: Argument fast is not an integer'
+    with pytest.raises(AttributeError):
+        client.initialise_laser()
+    daemon.laser.serialconn.close_connection.assert_not_called()
+    client.close()
@@ -0,0 +1,93 @@
+import pytest
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, Pulsed_Laser_Serial
+from SPI_G4_Pulsed_Fibre_Laser_soak import SimulatedPort
+
+np = pytest.importorskip('numpy')
+from SPI_G4_Pulsed_Fibre_Laser_export import TelemetryStore
+
+
+def test_read_range_across_chunks(tmp_path):
+    store = TelemetryStore(str(tmp_path), {'lasertemp': 'float32'}, chunksize=10)
+    for second in range(25):
+        store.append(1000.0 + second, {'lasertemp': 30.0 + second})
+    store.close()
+
+    assert [chunk[3] for chunk in store.chunks] == [10, 10, 5]
+    data = store.read_range(1008.0, 1013.0)
+    assert data['time'].tolist() == [1008.0, 1009.0, 1010.0, 1011.0, 1012.0]
+    assert data['lasertemp'].tolist() == [38.0, 39.0, 40.0, 41.0, 42.0]
+    assert data['lasertemp'].dtype == np.float32
+
+    assert store.read_range(2000.0, 3000.0)['time'].size == 0
+
+def test_reopen_and_append(tmp_path):
+    store = TelemetryStore(str(tmp_path), {'prf': 'uint32'}, chunksize=2)
+    store.append(1.0, {'prf': 10000})
+    store.append(2.0, {'prf': 20000})
+
+    store = TelemetryStore(str(tmp_path), {'prf': 'uint32'}, chunksize=2)
+    store.append(3.0, {'prf': 30000})
+    store.flush()
+
+    assert len(store.chunks) == 2
+    assert store.read_range(0.0, 10.0, ['prf'])['prf'].tolist() == [10000, 20000, 30000]
+
+def test_record_laser(tmp_path):
+    laser = Pulsed_Laser()
+    laser.serialconn = Pulsed_Laser_Serial('COM1', 115200, 1, 'N', 8, 1)
+    laser.serialconn.serial = SimulatedPort()
+    laser.serialconn.serial.simulator.replies['QJ'] = '01000, 20000, 00030'
+    laser.query_laser_temp()
+    laser.query_active_diode_currents()
+    laser.query_extended_diode_currents()
+    laser.set_prf(50000)
+    store = TelemetryStore(str(tmp_path))
+
+    store.record(laser, timestamp=5.0)
+    store.flush()
+
+    data = store.read_range(0.0, 10.0)
+    assert data['lasertemp'].tolist() == [36.5]
+    assert data['diodecurrent1'].tolist() == [15000]
+    assert data['extendeddiodecurrent2'].tolist() == [30]
+    assert data['extendeddiodecurrent3'].tolist() == [-1]
+    assert data['prf'].tolist() == [50000]
+    # Telemetry never read is missing, not 0
+    assert np.isnan(data['beamdeliverytemp'][0])
+    assert data['statuswordint'].tolist() == [65535]
+    assert data['extprf'].tolist() == [2**32 - 1]
+
+def test_partial_row_fills_missing_values(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+
+    store.append(1.0, {'lasertemp': 30.0})
+    store.flush()
+
+    data = store.read_range(0.0, 10.0)
+    assert data['lasertemp'].tolist() == [30.0]
+    assert np.isnan(data['beamdeliverytemp'][0])
+    assert data['diodecurrent0'].tolist() == [-1]
+    assert data['prf'].tolist() == [2**32 - 1]
+    assert data['waveform'].tolist() == [255]
+
+def test_flush_bad_value_writes_nothing(tmp_path):
+    store = TelemetryStore(str(tmp_path), {'lasertemp': 'float32', 'prf': 'uint32'})
+    store.append(1.0, {'lasertemp': 30.0, 'prf': 'fast'})
+
+    with pytest.raises(ValueError):
+        store.flush()
+
+    assert store.chunks == []
+    assert not (tmp_path / 'chunks.txt').exists()
+    assert store.buffer['lasertemp'] == [30.0]
+
+def test_export_parquet(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    store = TelemetryStore(str(tmp_path / 'store'), {'lasertemp': 'float32'})
+    store.append(1.0, {'lasertemp': 30.0})
+    store.flush()
+
+    store.export_parquet(str(tmp_path / 'telemetry.parquet'))
+
+    assert pq.read_table(str(tmp_path / 'telemetry.parquet')).to_pydict() == {
+        'time': [1.0], 'lasertemp': [30.0]}
@@ -0,0 +1,73 @@
+import asyncio
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, Pulsed_Laser_Serial
+from SPI_G4_Pulsed_Fibre_Laser_async import AsyncPulsedLaser
+from SPI_G4_Pulsed_Fibre_Laser_faults import FaultyPort, run_faults
+from SPI_G4_Pulsed_Fibre_Laser_soak import SimulatedPort
+
+FAULTS = {'drop': 0.05, 'truncate': 0.05, 'garbage': 0.05, 'errorcode': 0.05,
+          'wrongshape': 0.05, 'disconnect': 0.05}
+
+
+def faulty_serialconn(seed, **faults):
+    serialconn = Pulsed_Laser_Serial('COM1', 115200, 1, 'N', 8, 1)
+    serialconn.serial = FaultyPort(SimulatedPort(), seed=seed, **faults)
+    return serialconn
+
+def test_no_faults():
+    laser = Pulsed_Laser()
+    laser.serialconn = faulty_serialconn(1)
+    report = run_faults(laser, 200)
+
+    assert report.commands == 200
+    assert report.errors == 0
+    assert report.exceptions == {}
+    assert sum(laser.serialconn.serial.faults.values()) == 0
+
+def test_faults_are_seeded():
+    results = []
+    for _ in range(2):
+        laser = Pulsed_Laser()
+        laser.serialconn = faulty_serialconn(7, **FAULTS)
+        results.append([laser.get_prf() for _ in range(100)])
+
+    assert results[0] == results[1]
+    assert len(set(results[0])) > 1
+
+def test_faults_return_errors():
+    laser = Pulsed_Laser()
+    laser.serialconn = faulty_serialconn(1, **FAULTS)
+    report = run_faults(laser, 2000)
+    faults = laser.serialconn.serial.faults
+
+    assert report.exceptions == {}
+    assert all(count > 0 for count in faults.values()), faults
+    assert report.errors >= sum(faults.values()) // 2
+    assert report.rate > 0
+
+def test_wrong_shape_replies_return_errors():
+    laser = Pulsed_Laser()
+    laser.serialconn = faulty_serialconn(5, wrongshape=0.5)
+    report = run_faults(laser, 2000)
+
+    assert report.exceptions == {}
+    assert laser.serialconn.serial.faults['wrongshape'] > 500
+    assert report.errors > 0
+
+def test_async_stream_survives_faults():
+    async def run():
+        laser = AsyncPulsedLaser()
+        laser._laser.serialconn = faulty_serialconn(3, **FAULTS)
+        snapshots = []
+        async for snapshot in laser.stream(('lasertemp', 'diodecurrents', 'monitoring'),
+                                           interval=0):
+            snapshots.append(snapshot)
+            if len(snapshots) == 200:
+                break
+        await laser.close_serial()
+        return snapshots
+
+    snapshots = asyncio.run(run())
+    assert len(snapshots) == 200
+    assert any(snapshot.errors for snapshot in snapshots)
+    assert any(not snapshot.errors for snapshot in snapshots)
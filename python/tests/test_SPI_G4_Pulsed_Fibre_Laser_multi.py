@@ -0,0 +1,96 @@
+from unittest.mock import Mock
+
+import pytest
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, ReplyTimes
+from SPI_G4_Pulsed_Fibre_Laser_multi import (
+    commit_parameters,
+    stage_parameters,
+    synchronised_commit,
+)
+
+
+def mock_laser(reply=(True, '')):
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = reply
+    return laser
+
+def sent(laser):
+    return [call.args[0] for call in laser.serialconn.send_set_command.call_args_list]
+
+def test_synchronised_commit():
+    lasers = [mock_laser() for _ in range(3)]
+
+    results = synchronised_commit(lasers, {'pumpduty': 50, 'prf': 50000, 'waveform': 3})
+
+    for laser, (error, skew) in zip(lasers, results):
+        assert error is None
+        assert 0 <= skew < 0.1
+        assert sent(laser) == ['SW 3', 'SR 50000', 'SF 50', 'SS 1']
+        assert laser.pulses is True
+    assert min(skew for _, skew in results) == 0
+
+def test_stage_per_laser_settings():
+    lasers = [mock_laser(), mock_laser()]
+
+    errors = stage_parameters(lasers, [{'waveform': 1}, {'waveform': 2}])
+
+    assert errors == [None, None]
+    assert sent(lasers[0]) == ['SW 1']
+    assert sent(lasers[1]) == ['SW 2']
+
+    with pytest.raises(ValueError, match='one dict per laser'):
+        stage_parameters(lasers, [{'waveform': 1}])
+    with pytest.raises(ValueError, match='simmer cannot be staged'):
+        stage_parameters(lasers, {'simmer': 1})
+    # The active current is not held until 'SS 1'
+    with pytest.raises(ValueError, match='activecurrent cannot be staged'):
+        stage_parameters(lasers, {'activecurrent': 500})
+
+def test_staging_failure_prevents_commit():
+    lasers = [mock_laser(), mock_laser((False, 'E21: Command not executed because an alarm is active'))]
+
+    results = synchronised_commit(lasers, {'prf': 50000})
+
+    assert results == [(None, None),
+                       ('set_prf: E21: Command not executed because an alarm is active', None)]
+    assert 'SS 1' not in sent(lasers[0])
+
+def test_commit_reports_errors():
+    lasers = [mock_laser(), mock_laser((False, 'E25: Command not executed because Laser is not ready'))]
+
+    results = commit_parameters(lasers)
+
+    assert results[0] == (None, 0.0)
+    assert results[1] == ('E25: Command not executed because Laser is not ready', None)
+    assert commit_parameters(lasers[1:]) == [
+        ('E25: Command not executed because Laser is not ready', None)]
+
+def test_commit_skew_from_reply_times():
+    lasers = []
+    for offset in (2000000, 0, 5000000):
+        laser = mock_laser()
+        laser.serialconn.replytimes = {'SS': ReplyTimes(0, 0, 0)}
+
+        def send_set_command(command, serialconn=laser.serialconn, offset=offset):
+            serialconn.replytimes['SS'] = ReplyTimes(10**9, 10**9 + 10**7, 10**9 + offset)
+            return True, ''
+
+        laser.serialconn.send_set_command.side_effect = send_set_command
+        lasers.append(laser)
+
+    results = commit_parameters(lasers)
+
+    assert results == [(None, 0.002), (None, 0.0), (None, 0.005)]
+
+    # A laser that did not take 'SS 1' is left out of the skew
+    lasers[1].serialconn.send_set_command.side_effect = None
+    lasers[1].serialconn.send_set_command.return_value = (False, 'E21: Command not executed because an alarm is active')
+    results = commit_parameters(lasers)
+
+    assert results[0] == (None, 0.0)
+    assert results[1][1] is None
+    assert results[2] == (None, 0.003)
+
+def test_commit_no_lasers():
+    assert commit_parameters([]) == []
@@ -0,0 +1,73 @@
+from unittest.mock import Mock
+
+import pytest
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser_power import PowerCalibration, load_calibration
+
+
+def calibration():
+    calibration = PowerCalibration()
+    for current, power in ((0, 0.0), (500, 10.0), (1000, 20.0)):
+        calibration.add_measurement(1, 50000, current, power)
+    for current, power in ((0, 0.0), (500, 20.0), (1000, 40.0)):
+        calibration.add_measurement(1, 100000, current, power)
+    calibration.add_measurement(2, 50000, 0, 0.0)
+    calibration.add_measurement(2, 50000, 1000, 5.0)
+    return calibration
+
+def test_power_interpolation():
+    model = calibration()
+
+    assert model.power(1, 50000, 250) == 5.0
+    assert model.power(1, 75000, 500) == pytest.approx(15.0)
+    # PRFs outside the measured range use the nearest measured PRF
+    assert model.power(1, 20000, 1000) == 20.0
+    assert model.power(1, 200000, 1000) == 40.0
+    assert model.power(2, 50000, 500) == 2.5
+    with pytest.raises(ValueError, match='Waveform 3 is not calibrated'):
+        model.power(3, 50000, 500)
+
+def test_current_for_power():
+    model = calibration()
+
+    assert model.current_for_power(1, 50000, 15.0) == 750
+    assert model.current_for_power(1, 75000, 15.0) == 500
+    assert model.current_for_power(1, 50000, 0.0) == 0
+    with pytest.raises(ValueError, match='outside the calibrated range'):
+        model.current_for_power(1, 50000, 25.0)
+
+def test_curves_are_cached():
+    model = calibration()
+    curve = model.curve(1, 75000)
+    assert model.curve(1, 75000) is curve
+
+    model.add_measurement(1, 50000, 1000, 22.0)
+    assert model.curve(1, 75000) is not curve
+    assert model.power(1, 50000, 1000) == 22.0
+
+def test_csv_round_trip(tmp_path):
+    path = str(tmp_path / 'calibration.csv')
+    calibration().to_csv(path)
+
+    loaded = load_calibration(path)
+    assert loaded.points == calibration().points
+    assert load_calibration(path) is loaded
+
+def test_set_power():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_set_command.return_value = (True, '')
+    assert laser.set_power(10.0) == 'Error: No power calibration'
+    assert laser.estimate_power() is None
+
+    laser.powercalibration = calibration()
+    laser.waveform = 1
+    laser.prf = 100000
+
+    assert laser.set_power(30.0) is None
+    laser.serialconn.send_set_command.assert_called_once_with('SI 750')
+    assert laser.activecurrent == 750
+    assert laser.estimate_power() == 30.0
+    assert laser.set_power(50.0) == 'Error: 50.0 W is outside the calibrated range 0.0-40.0 W'
+    laser.waveform = 5
+    assert laser.estimate_power() is None
@@ -0,0 +1,88 @@
+import threading
+from unittest.mock import Mock
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, ReplyTimes
+from SPI_G4_Pulsed_Fibre_Laser_priority import (
+    CANCELLED,
+    CONTROL,
+    SAFETY,
+    TELEMETRY,
+    PriorityDispatcher,
+    command_priority,
+)
+
+
+def blocking_serialconn():
+    """Mock connection that holds the first command on the wire until released"""
+    release = threading.Event()
+    started = threading.Event()
+    sent = []
+
+    def send_command(command, lines=1):
+        sent.append(command)
+        if len(sent) == 1:
+            started.set()
+            release.wait(5)
+        return True, command
+
+    serialconn = Mock()
+    serialconn.send_command.side_effect = send_command
+    return serialconn, sent, started, release
+
+def test_command_priority():
+    assert command_priority('SC 0') == SAFETY
+    assert command_priority('SC 1') == SAFETY
+    assert command_priority('SC 3') == CONTROL
+    assert command_priority('SR 50000') == CONTROL
+    assert command_priority('QT') == TELEMETRY
+    assert command_priority('GR') == TELEMETRY
+    assert command_priority('RQV') == TELEMETRY
+
+def test_safety_command_jumps_queue():
+    serialconn, sent, started, release = blocking_serialconn()
+    dispatcher = PriorityDispatcher(serialconn)
+
+    inflight = dispatcher.submit('QT')
+    started.wait(5)
+    queued = [dispatcher.submit(command) for command in ('QI', 'QJ', 'GR')]
+    control = dispatcher.submit('SR 20000')
+    safety = dispatcher.submit('SC 0')
+    release.set()
+
+    assert safety.result(5) == (True, 'SC 0')
+    assert control.result(5) == (True, 'SR 20000')
+    assert inflight.result(5) == (True, 'QT')
+    for future in queued:
+        assert future.result(5) == (False, CANCELLED)
+    dispatcher.close_connection()
+
+    assert sent == ['QT', 'SC 0', 'SR 20000']
+    serialconn.close_connection.assert_called_once()
+    delays = dispatcher.get_queue_delays()
+    assert delays['safety']['count'] == 1
+    assert delays['control']['count'] == 1
+    assert delays['telemetry']['count'] == 1
+    assert delays['safety']['max'] >= 0
+
+def test_dispatcher_replaces_laser_connection():
+    serialconn = Mock()
+    serialconn.send_command.return_value = (True, '50000')
+    laser = Pulsed_Laser()
+    laser.serialconn = PriorityDispatcher(serialconn)
+
+    assert laser.get_prf() == '50000'
+    assert laser.prf == 50000
+    laser.close_serial()
+
+    assert laser.serialconn.submit('QT').result() == (False, 'Error: Dispatcher is closed')
+
+def test_dispatcher_forwards_connection_attributes():
+    serialconn = Mock()
+    serialconn.port = '/dev/ttyUSB0'
+    serialconn.replytimes = {'QT': ReplyTimes(100, 300, 200)}
+    laser = Pulsed_Laser()
+    laser.serialconn = PriorityDispatcher(serialconn)
+
+    assert laser.serialconn.port == '/dev/ttyUSB0'
+    assert laser.reading_times('lasertemp') == ReplyTimes(100, 300, 200)
+    laser.close_serial()
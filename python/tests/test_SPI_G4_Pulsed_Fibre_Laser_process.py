@@ -0,0 +1,96 @@
+import time
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser_process import (
+    CLOSED,
+    STATE_SIZE,
+    LaserProcess,
+    StateReader,
+    laser_state,
+    read_block,
+    write_block,
+)
+from SPI_G4_Pulsed_Fibre_Laser_soak import SimulatedLaser
+
+
+def test_seqlock_block():
+    buffer = bytearray(STATE_SIZE)
+    laser = Pulsed_Laser()
+    laser.lasertemp = 36.5
+    laser.prf = 50000
+    laser.laseronmonitor = True
+
+    write_block(buffer, laser_state(laser, 3, 1))
+    state = read_block(buffer)
+
+    assert buffer[0] == 2
+    assert (state['polls'], state['errors']) == (3, 1)
+    assert state['lasertemp'] == 36.5
+    assert state['prf'] == 50000
+    assert state['monitoring'] == 1 << 7
+    assert state['diodecurrent0'] == -1
+
+def test_laser_process():
+    with SimulatedLaser() as simulator:
+        process = LaserProcess(simulator.url, interval=0.02)
+        assert process.start() is None
+        try:
+            assert process.call('set_prf', 20000) is None
+            assert process.call('get_prf') == '20000'
+            deadline = time.monotonic() + 10
+            while process.read_state()['polls'] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            reader = StateReader(process.name)
+            state = reader.read()
+            assert state['polls'] >= 2
+            assert state['lasertemp'] == 36.5
+            assert state['prf'] == 20000
+            assert state['extendeddiodecurrent3'] == 12032
+            reader.close()
+        finally:
+            process.stop()
+
+    assert process.submit('get_prf').result() == CLOSED
+
+def test_laser_process_poll_raises():
+    with SimulatedLaser() as simulator:
+        process = LaserProcess(simulator.url, methods=('no_such_method', 'query_laser_temp'),
+                               interval=0.02)
+        assert process.start() is None
+        try:
+            deadline = time.monotonic() + 10
+            while process.read_state()['polls'] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            state = process.read_state()
+            assert state['polls'] >= 2
+            assert state['errors'] >= state['polls']
+            assert state['lasertemp'] == 36.5
+            assert process.call('get_prf') == '0050000'
+        finally:
+            process.stop()
+
+def test_laser_process_polls_between_requests():
+    with SimulatedLaser(latency=0.002) as simulator:
+        process = LaserProcess(simulator.url, interval=0.02)
+        assert process.start() is None
+        try:
+            first = process.read_state()
+            futures = [process.submit('get_prf') for _ in range(60)]
+            deadline = time.monotonic() + 10
+            while process.read_state()['polls'] < first['polls'] + 3 and time.monotonic() < deadline:
+                time.sleep(0.005)
+
+            # Polls keep running while the requests are still queued
+            state = process.read_state()
+            assert not futures[-1].done()
+            assert state['polls'] >= first['polls'] + 3
+            assert state['updated'] > first['updated']
+            assert all(future.result() == '0050000' for future in futures)
+        finally:
+            process.stop()
+
+def test_laser_process_connection_error():
+    process = LaserProcess('socket://127.0.0.1:1')
+    assert process.start().startswith('Error: ')
@@ -0,0 +1,57 @@
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser_soak import (
+    SOAK_LIMITS,
+    SimulatedLaser,
+    SimulatedPort,
+    SoakSample,
+    _check,
+    run_soak,
+)
+
+
+def test_simulated_laser():
+    with SimulatedLaser() as simulator:
+        laser = Pulsed_Laser()
+        laser.create_serial_connection(simulator.url)
+        laser.initialise_laser()
+
+        assert laser.prf == 50000
+        assert laser.lasertemp == 36.5
+        assert laser.diodecurrentvalues.tolist() == [10000, 15000]
+        assert laser.vendorinfo.splitlines()[-1] == 'Driver FW Rev: 1.0'
+        assert laser.alarms == ['Base plate temperature alarm']
+
+        assert laser.set_prf(20000) is None
+        assert laser.get_prf() == '20000'
+        assert laser.set_status_word(1) is None
+        assert laser.get_status_word() == '0, 1, 0, 0, 0, 0'
+        assert laser.query_status_word_int() == '00002'
+        laser.close_serial()
+
+def test_check_limits():
+    baseline = SoakSample(1.0, 1000, 100000, 20 << 20, 5, 0.001)
+    steady = SoakSample(2.0, 1000, 100500, 20 << 20, 5, 0.0012)
+    leaking = SoakSample(3.0, 1000, 100000 + (2 << 20), 20 << 20, 6, 0.01)
+
+    assert _check(baseline, steady, SOAK_LIMITS) == []
+    failures = _check(baseline, leaking, SOAK_LIMITS)
+    assert [failure.split()[0] for failure in failures] == ['memory', 'threads', 'latency']
+
+def test_short_soak():
+    samples = []
+    report = run_soak(0.4, interval=0.2, limits={'memory': 10 << 20, 'rss': 64 << 20,
+                                                 'latency': 100.0},
+                      callback=samples.append)
+
+    assert report.passed, report.failures
+    assert report.samples == samples
+    assert len(samples) >= 2
+    assert all(sample.commands > 0 for sample in samples)
+
+def test_simulated_port():
+    port = SimulatedPort()
+    port.write(b'GR\r\nQT\r\n')
+
+    assert port.read_until(b'\r\n') == b'0050000\r\n'
+    assert port.read_until(b'\r\n') == b'36.5\r\n'
+    assert port.read_until(b'\r\n') == b''
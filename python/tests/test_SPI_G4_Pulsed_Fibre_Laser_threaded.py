@@ -0,0 +1,92 @@
+import threading
+import time
+from unittest.mock import Mock
+
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser, Pulsed_Laser_Serial
+from SPI_G4_Pulsed_Fibre_Laser_threaded import CLOSED, ThreadedPulsedLaser
+
+
+class SlowEchoSerial:
+    """Serial stand-in that replies with the last command written, after a delay
+    Interleaved transactions would read each other's replies"""
+    is_open = True
+    timeout = 1
+
+    def __init__(self):
+        self.last = b''
+
+    def reset_input_buffer(self):
+        pass
+
+    def write(self, data):
+        self.last = data
+        time.sleep(0.001)
+
+    def read_until(self, expected=b'\r\n'):
+        time.sleep(0.001)
+        return self.last
+
+def test_transactions_are_atomic():
+    serialconn = Pulsed_Laser_Serial('COM1', 115200, 1, 'N', 8, 1)
+    serialconn.serial = SlowEchoSerial()
+    mismatches = []
+
+    def worker(command):
+        for _ in range(20):
+            _, result = serialconn.send_command(command)
+            if result != command:
+                mismatches.append(result)
+
+    threads = [threading.Thread(target=worker, args=(command,)) for command in ('GR', 'QT', 'QI')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert mismatches == []
+    waits = serialconn.get_lock_waits()
+    assert waits['count'] == 60
+    assert waits['contended'] > 0
+    assert waits['max'] >= waits['mean'] > 0
+
+def test_threads_take_turns():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def get_prf():
+        calls.append(('poller', len(calls)))
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        return '50000'
+
+    laser = Mock()
+    laser.get_prf.side_effect = get_prf
+    laser.set_waveform.side_effect = lambda waveform: calls.append(('gui', waveform))
+    client = ThreadedPulsedLaser(laser)
+
+    polls = [client.submit('get_prf')]
+    started.wait(5)
+    polls += [client.submit('get_prf') for _ in range(3)]
+    gui = threading.Thread(target=lambda: client.submit('set_waveform', 1).result(5))
+    gui.start()
+    while len(client.pending()) < 2:
+        time.sleep(0.001)
+    release.set()
+    gui.join()
+
+    assert [future.result(5) for future in polls] == ['50000'] * 4
+    assert [caller for caller, _ in calls] == ['poller', 'poller', 'gui', 'poller', 'poller']
+    client.close()
+
+def test_client_proxies_laser():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.send_get_command.return_value = (True, '50000')
+    client = ThreadedPulsedLaser(laser)
+
+    assert client.get_prf() == '50000'
+    assert client.prf == 50000
+    client.close()
+    assert client.submit('get_prf').result() == CLOSED
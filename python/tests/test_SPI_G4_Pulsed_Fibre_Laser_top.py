@@ -0,0 +1,59 @@
+import asyncio
+import io
+
+from SPI_G4_Pulsed_Fibre_Laser_async import MONITORING_BITS, TelemetrySnapshot
+from SPI_G4_Pulsed_Fibre_Laser_soak import SimulatedLaser
+from SPI_G4_Pulsed_Fibre_Laser_top import Screen, format_snapshot, run_top
+
+
+def test_format_snapshot():
+    monitoring = dict.fromkeys(MONITORING_BITS, False)
+    monitoring['alarmstatemonitor'] = monitoring['laseronmonitor'] = True
+    snapshot = TelemetrySnapshot(timestamp=1.0, controlmode=3, statuswordint=11,
+                                 monitoring=monitoring, lasertemp=36.54,
+                                 diodecurrents=(10000, 15000), alarms=(),
+                                 latency=0.00125,
+                                 errors={'beamdeliverytemp': 'E9: Insufficient privilege'})
+
+    assert format_snapshot(snapshot) == ('3', '00011 on pulses CW', 'alarm on', '36.5 C', '-',
+                                         '10000, 15000', 'none', '1.25 ms',
+                                         'E9: Insufficient privilege')
+
+def test_screen_writes_changed_cells():
+    out = io.StringIO()
+    screen = Screen(['COM1', 'COM2'], out)
+    screen.draw()
+    screen.update(0, ('3', 'on'))
+    screen.update(1, ('1', 'off'))
+    screen.flush()
+    out.seek(0)
+    out.truncate()
+
+    screen.update(0, ('3', 'on'))
+    screen.update(1, ('1', 'on pulses'))
+    screen.flush()
+    assert out.getvalue() == '\x1b[3;59H' + 'on pulses'.ljust(36)
+
+    out.seek(0)
+    out.truncate()
+    screen.update(0, ('3', 'on'))
+    screen.flush()
+    assert out.getvalue() == ''
+
+def test_run_top_simulated():
+    out = io.StringIO()
+    with SimulatedLaser() as simulator:
+        url = simulator.url
+        asyncio.run(run_top([url], interval=0.01, out=out, frames=2))
+
+    text = out.getvalue()
+    assert url in text
+    assert '36.5 C' in text
+    assert text.endswith('\x1b[?25h\n')
+def test_run_top_unknown_alarm():
+    out = io.StringIO()
+    with SimulatedLaser() as simulator:
+        simulator.replies['QA'] = '70'
+        asyncio.run(run_top([simulator.url], interval=0.01, out=out, frames=2))
+
+    assert 'Unknown alarm 70' in out.getvalue()
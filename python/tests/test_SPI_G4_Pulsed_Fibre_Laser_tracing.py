@@ -0,0 +1,49 @@
+from unittest.mock import Mock
+
+import serial
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser_Serial
+from SPI_G4_Pulsed_Fibre_Laser_tracing import OpenTelemetryTracer, RecordingTracer
+
+
+def laser_serial(*replies):
+    laser_serial = Pulsed_Laser_Serial(port='/dev/ttyUSB0', baudrate=115200,
+                                       parity=serial.PARITY_NONE,
+                                       stopbits=serial.STOPBITS_ONE,
+                                       databits=serial.EIGHTBITS, timeout=1)
+    laser_serial.serial = Mock()
+    laser_serial.serial.read_until.side_effect = list(replies)
+    return laser_serial
+
+def test_recording_tracer():
+    conn = laser_serial(b'50000\r\n', b'E20\r\n')
+    conn.tracer = RecordingTracer()
+
+    conn.send_get_command('GR')
+    conn.send_set_command('SR 5')
+
+    first, second = conn.tracer.spans
+    assert first['command'] == 'GR'
+    assert first['bytes_written'] == 4
+    assert first['bytes_read'] == 7
+    assert first['success'] is True
+    assert first['result'] == '50000'
+    assert first['errorcode'] == ''
+    assert first['end'] >= first['start']
+    assert second['success'] is False
+    assert second['errorcode'] == 'E20'
+    assert second['result'] == 'E20: Parameter out of range'
+
+def test_opentelemetry_tracer():
+    conn = laser_serial(b'E9\r\n')
+    otel = Mock()
+    conn.tracer = OpenTelemetryTracer(otel, port='/dev/ttyUSB0')
+
+    conn.send_get_command('GW')
+
+    otel.start_span.assert_called_once_with('G4 GW', attributes={
+        'laser.command': 'GW', 'laser.command.code': 'GW',
+        'laser.bytes_written': 4, 'laser.port': '/dev/ttyUSB0'})
+    span = otel.start_span.return_value
+    span.set_attribute.assert_any_call('laser.error_code', 'E9')
+    span.set_attribute.assert_any_call('laser.success', False)
+    span.end.assert_called_once()
@@ -0,0 +1,99 @@
+import time
+from unittest.mock import Mock
+
+import serial
+from SPI_G4_Pulsed_Fibre_Laser import Pulsed_Laser
+from SPI_G4_Pulsed_Fibre_Laser_watchdog import ERROR_SCORE, LinkWatchdog
+
+
+def watched_laser():
+    laser = Pulsed_Laser()
+    laser.serialconn = Mock()
+    laser.serialconn.lastreply = 0.0
+    laser.serialconn.send_get_command.return_value = (True, '00001')
+    laser.serialconn.send_set_command.return_value = (True, '0')
+    return laser
+
+def test_heartbeat_only_when_idle():
+    laser = watched_laser()
+    watchdog = LinkWatchdog(laser, interval=10.0)
+
+    assert watchdog.check() == 10.0
+    laser.serialconn.send_get_command.assert_called_once_with('QS')
+    assert laser.statuswordint == 1
+    assert watchdog.heartbeats == 1
+
+    # Another command replied 2 s ago, so the next check is due in 8 s
+    laser.serialconn.lastreply = time.monotonic() - 2.0
+    delay = watchdog.check()
+    assert 7.9 < delay <= 8.0
+    assert watchdog.heartbeats == 1
+    assert watchdog.health == 1.0
+
+def test_heartbeat_scores():
+    laser = watched_laser()
+    watchdog = LinkWatchdog(laser)
+
+    assert watchdog.heartbeat() == 1.0
+    laser.serialconn.send_get_command.return_value = (False, 'E9: Insufficient privilege')
+    assert watchdog.heartbeat() == ERROR_SCORE
+    laser.serialconn.send_get_command.return_value = (False, 'Error: Serial port on COM1 is not open')
+    assert watchdog.heartbeat() == 0.0
+    laser.serialconn.send_get_command.side_effect = serial.SerialException('device disconnected')
+    assert watchdog.heartbeat() == 0.0
+    assert (watchdog.heartbeats, watchdog.errors, watchdog.timeouts) == (4, 1, 2)
+
+def test_degraded_and_recovered():
+    laser = watched_laser()
+    events = []
+    watchdog = LinkWatchdog(laser, ondegraded=lambda health, error: events.append(('degraded', error)),
+                            onrecovered=lambda health: events.append('recovered'),
+                            disable_emission=True)
+    laser.serialconn.send_get_command.side_effect = serial.SerialException('timeout')
+    for _ in range(3):
+        watchdog.check()
+
+    assert watchdog.degraded is True
+    assert events == [('degraded', None)]
+    assert watchdog.disableerror is None
+    laser.serialconn.send_set_command.assert_called_once_with('SC 0')
+    assert laser.enable is False
+
+    laser.serialconn.send_get_command.side_effect = None
+    for _ in range(10):
+        watchdog.check()
+
+    assert watchdog.degraded is False
+    assert events == [('degraded', None), 'recovered']
+
+def test_disable_error_reported():
+    laser = watched_laser()
+    errors = []
+    watchdog = LinkWatchdog(laser, ondegraded=lambda health, error: errors.append(error),
+                            disable_emission=True)
+    laser.serialconn.send_get_command.side_effect = serial.SerialException('timeout')
+    laser.serialconn.send_set_command.return_value = (False, 'Error: No reply to SC from COM1')
+    for _ in range(3):
+        watchdog.check()
+    assert errors == ['Error: No reply to SC from COM1']
+
+    laser.serialconn.send_get_command.side_effect = None
+    for _ in range(10):
+        watchdog.check()
+    laser.serialconn.send_get_command.side_effect = serial.SerialException('timeout')
+    laser.serialconn.send_set_command.side_effect = serial.SerialException('device disconnected')
+    for _ in range(5):
+        watchdog.check()
+
+    assert errors == ['Error: No reply to SC from COM1', 'Error: device disconnected']
+    assert watchdog.disableerror == 'Error: device disconnected'
+
+def test_watchdog_thread():
+    laser = watched_laser()
+    watchdog = LinkWatchdog(laser, interval=0.01)
+    watchdog.start()
+    time.sleep(0.1)
+    watchdog.stop()
+
+    assert watchdog.heartbeats > 1
+    assert watchdog.degraded is False